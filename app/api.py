@@ -1,82 +1,353 @@
-from fastapi import APIRouter, Body, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, Body, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Optional
+from contextlib import aclosing, asynccontextmanager
 import asyncio
+import json
+import logging
 
 # Import the refactored agent functions designed for the multi-tool workflow
 from orchestrator.agent import (
     GraphState,
-    select_tools_node,
-    extract_parameters_for_tool,
-    call_tool_api,
-    _format_combined_response
+    abatch_select_tools,
+    abatch_extract_parameters,
+    cached_call_tool_api,
+    _format_combined_response,
+    _format_tool_response
 )
-from orchestrator.state_manager import get_student_state, update_student_chat_history
+# Single turns run through the compiled LangGraph workflow; /chat/batch is a separate path
+from orchestrator.workflow import NO_TOOL_ANSWER, astream_turn, run_turn, resume_turn, save_turn
+from orchestrator.state_manager import aget_student_state
+from orchestrator.context_builder import build_context
+from orchestrator.config import BATCH_MAX_ITEMS, RETRIEVER_MAX_K
+from orchestrator.tool_cache import canonical_key
+from orchestrator.admission import admission_controller, AdmissionTicket, Overloaded
+from orchestrator.session_cache import session_cache
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["Main Application"])
 
 class ChatRequest(BaseModel):
     user_id: str
     message: str
+    # How many tools the retriever shortlists for selection; defaults to RETRIEVER_K
+    retriever_k: Optional[int] = Field(default=None, ge=1, le=RETRIEVER_MAX_K)
+
+class ResumeRequest(BaseModel):
+    user_id: str
+    turn_id: str
+
+class BatchChatRequest(BaseModel):
+    items: List[ChatRequest] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+
+async def _admit(user_id: Optional[str]) -> AdmissionTicket:
+    """Waits for this user's earlier turns and an admission slot, or sheds the request with 429."""
+    try:
+        return await admission_controller.admit(user_id)
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+@asynccontextmanager
+async def _admitted(user_id: Optional[str]):
+    ticket = await _admit(user_id)
+    try:
+        yield ticket
+    finally:
+        ticket.release()
+
+async def _initial_state(request: ChatRequest) -> tuple:
+    """The turn's starting graph state from the student's profile and context. Returns (state, context)."""
+    # A student with an open /ws/chat session already has the profile and context in memory
+    session = session_cache.get(request.user_id)
+    if session is not None:
+        context, user_info = session.context, session.user_info
+    else:
+        student_state = await aget_student_state(request.user_id)
+        # Prompts get the rolling summary plus the last few turns, fitted to the token budget
+        context = build_context(
+            student_state["chat_history"], student_state["conversation_summary"],
+            history_length=student_state["message_count"]
+        )
+        user_info = student_state["user_info"]
+    initial_state = GraphState(
+        user_id=request.user_id,
+        student_message=request.message,
+        chat_history=context["chat_history"],
+        conversation_summary=context["conversation_summary"],
+        user_info=user_info,
+        selected_tools=[], tool_parameters={}, tool_results={}, tool_api_responses=[], final_answer="",
+        retriever_k=request.retriever_k
+    )
+    return initial_state, context
+
+def _turn_response(final_state: dict, context_tokens: Optional[dict] = None) -> dict:
+    return {
+        "chat_response": final_state["final_answer"],
+        "tools_used": final_state["selected_tools"],
+        "tool_data": final_state["tool_api_responses"],
+        "context_tokens": context_tokens,
+        # A turn with timed-out tools can be finished later with POST /chat/resume
+        "turn_id": final_state["turn_id"],
+        "resumable": final_state["resumable"],
+        "node_timings": final_state["node_timings"],
+    }
 
 @router.post("/chat")
 async def chat_handler(request: ChatRequest = Body(...)):
     """
     This is the main endpoint that runs the full multi-tool orchestrator workflow.
     """
+    async with _admitted(request.user_id):
+        try:
+            logger.info("Received multi-tool request for user: %s", request.user_id)
+            # Selection, the tool DAG (extract -> call per tool), normalization and the state
+            # save all run inside the compiled graph (see orchestrator/workflow.py)
+            initial_state, context = await _initial_state(request)
+            final_state = await run_turn(initial_state)
+            return _turn_response(final_state, context["token_counts"])
+
+        except Exception as e:
+            logger.exception("Error in workflow: %s", e)
+            # Provide a more detailed error message for debugging
+            raise HTTPException(status_code=500, detail=f"An internal error occurred in the AI workflow: {str(e)}")
+
+@router.post("/chat/resume")
+async def chat_resume_handler(request: ResumeRequest = Body(...)):
+    """
+    Finishes a turn whose tools missed their deadline (`resumable` in its response). Only the
+    timed-out tools run again; the selection and completed tools come from the turn's checkpoint.
+    """
+    async with _admitted(request.user_id):
+        try:
+            final_state = await resume_turn(request.turn_id, request.user_id)
+        except LookupError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except Exception as e:
+            logger.exception("Error resuming turn %s: %s", request.turn_id, e)
+            raise HTTPException(status_code=500, detail=f"An internal error occurred in the AI workflow: {str(e)}")
+        return _turn_response(final_state)
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _turn_events(request: ChatRequest):
+    """Yields (event, data): `tools`, one `section` per tool as it completes, then `done` (or `error`)."""
     try:
-        print(f"\n--- 🚀 RECEIVED MULTI-TOOL REQUEST for user: {request.user_id} ---")
+        initial_state, context = await _initial_state(request)
+        selected_tools, final_state = [], {}
+        # Closing the graph's stream (e.g. the client disconnected) cancels its running tools
+        async with aclosing(astream_turn(initial_state)) as updates:
+            async for node, values in updates:
+                if node == "select":
+                    selected_tools = values["selected_tools"]
+                    yield "tools", {"tools_used": selected_tools}
+                    if not selected_tools:
+                        yield "section", {"index": 0, "tool": None, "content": NO_TOOL_ANSWER}
+                elif node == "tool":
+                    for tool_name, response in values["tool_results"].items():
+                        yield "section", {
+                            "index": selected_tools.index(tool_name), "tool": tool_name, "content": _format_tool_response(response)
+                        }
+                else:
+                    # History is written once (by the graph's save node), after every section has been sent
+                    final_state.update(values)
+        final_state["selected_tools"] = selected_tools
+        yield "done", _turn_response(final_state, context["token_counts"])
+    except Exception as e:
+        logger.exception("Error in streaming workflow: %s", e)
+        yield "error", {"detail": f"An internal error occurred in the AI workflow: {str(e)}"}
 
-        # 1. Fetch State & Populate Initial State
-        student_state = get_student_state(request.user_id)
-        initial_state = GraphState(
-            student_message=request.message,
-            chat_history=student_state["chat_history"],
-            user_info=student_state["user_info"],
-            selected_tools=[], tool_api_responses=[], final_answer=""
-        )
+async def _stream_turn(request: ChatRequest, ticket: AdmissionTicket):
+    """The turn's events as SSE; the admission slot is released when the stream ends."""
+    try:
+        async with aclosing(_turn_events(request)) as events:
+            async for event, data in events:
+                yield _sse(event, data)
+    finally:
+        ticket.release()
+
+@router.post("/chat/stream")
+async def chat_stream_handler(request: ChatRequest = Body(...)):
+    """
+    Streaming variant of /chat (Server-Sent Events). Each tool's section is sent as soon
+    as that tool finishes, so the student sees content before the slowest tool is done.
+    """
+    logger.info("Received streaming request for user: %s", request.user_id)
+    # Admitted before the stream starts, so an overload is still a plain 429. The slot is held
+    # until the stream ends; the background task frees it if the stream never started.
+    ticket = await _admit(request.user_id)
+    return StreamingResponse(
+        _stream_turn(request, ticket),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(ticket.release),
+    )
+
+class WebSocketTurn(BaseModel):
+    message: str
+    retriever_k: Optional[int] = Field(default=None, ge=1, le=RETRIEVER_MAX_K)
+
+async def _ws_send(websocket: WebSocket, event: str, data: dict):
+    await websocket.send_json({"event": event, "data": data})
 
-        # 2. Run Tool Selection to get the plan
-        state_after_selection = select_tools_node(initial_state)
-        selected_tools = state_after_selection.get("selected_tools", [])
+async def _ws_turn(websocket: WebSocket, user_id: str, raw: str):
+    """Runs one turn from a socket message, pushing the same events /chat/stream sends."""
+    try:
+        turn = WebSocketTurn.model_validate_json(raw)
+    except ValidationError as e:
+        await _ws_send(websocket, "error", {"status": 422, "detail": e.errors(include_url=False, include_context=False)})
+        return
+    try:
+        ticket = await admission_controller.admit(user_id)
+    except Overloaded as e:
+        # The socket stays open; the client may resend after `retry_after` seconds
+        await _ws_send(websocket, "error", {"status": 429, "detail": str(e), "retry_after": e.retry_after})
+        return
+    try:
+        request = ChatRequest(user_id=user_id, message=turn.message, retriever_k=turn.retriever_k)
+        async with aclosing(_turn_events(request)) as events:
+            async for event, data in events:
+                await _ws_send(websocket, event, data)
+    finally:
+        ticket.release()
+
+@router.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket, user_id: str):
+    """
+    Persistent chat for one student (`/ws/chat?user_id=...`). Each text frame is a turn,
+    `{"message": ..., "retriever_k": optional}`; the server pushes `{"event", "data"}` frames
+    with the /chat/stream events, one turn at a time. While the socket is open the student's
+    profile and context stay cached and history is written back in the background.
+    """
+    await websocket.accept()
+    try:
+        session = await session_cache.open(user_id)
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+    logger.info("WebSocket session opened for user: %s", user_id)
+    try:
+        while True:
+            await _ws_turn(websocket, user_id, await websocket.receive_text())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await session_cache.close(session)
+        logger.info("WebSocket session closed for user: %s", user_id)
+
+def _batch_error(index: int, item: ChatRequest, error) -> dict:
+    return {"index": index, "user_id": item.user_id, "status": "error", "error": str(error)}
+
+@router.post("/chat/batch")
+async def chat_batch_handler(request: BatchChatRequest = Body(...)):
+    """
+    Runs many (user_id, message) turns together: one batched embedding call, capped `abatch`
+    LLM calls for selection and extraction, and one downstream call per identical tool request.
+    Every item gets its own result or error; one bad item never fails the batch.
+    The batch takes a single admission slot; its LLM calls still go through the shared token bucket.
 
-        if not selected_tools:
-            # If no tools are selected, provide a default response
-            final_answer = "I'm not sure which tool to use for your request. Could you please rephrase?"
-            tool_responses = []
+    Batch items don't run through the turn graph (orchestrator/workflow.py): its nodes work on
+    one turn at a time, and batching happens across items. So batch turns have no tool
+    deadlines, no streaming and no checkpoint/resume.
+    """
+    async with _admitted(None):
+        return await _run_batch(request)
+
+async def _run_batch(request: BatchChatRequest) -> dict:
+    items = request.items
+    logger.info("Received batch request with %d item(s)", len(items))
+    results = [None] * len(items)
+
+    # 1. Fetch every student's state concurrently
+    student_states = await asyncio.gather(*(aget_student_state(item.user_id) for item in items), return_exceptions=True)
+    states, state_indices = [], []
+    for i, (item, student_state) in enumerate(zip(items, student_states)):
+        if isinstance(student_state, Exception):
+            results[i] = _batch_error(i, item, student_state)
+            continue
+        context = build_context(
+            student_state["chat_history"], student_state["conversation_summary"],
+            history_length=student_state["message_count"]
+        )
+        states.append(GraphState(
+            user_id=item.user_id,
+            student_message=item.message,
+            chat_history=context["chat_history"],
+            conversation_summary=context["conversation_summary"],
+            user_info=student_state["user_info"],
+            selected_tools=[], tool_parameters={}, tool_api_responses=[], final_answer="",
+            retriever_k=item.retriever_k
+        ))
+        state_indices.append(i)
+
+    # 2. Batched tool selection
+    selections = await abatch_select_tools(states) if states else []
+    selected = []  # (item index, state)
+    for i, selection in zip(state_indices, selections):
+        if isinstance(selection, Exception):
+            results[i] = _batch_error(i, items[i], selection)
         else:
-            # 3. --- Orchestration Loop ---
-            # Create a list of tasks to run concurrently for efficiency
-            tasks = []
-            for tool_name in selected_tools:
-                # For each tool, we create a task that chains parameter extraction and the API call
-                async def tool_task(current_tool_name: str):
-                    params = extract_parameters_for_tool(state_after_selection, current_tool_name)
-                    response = await call_tool_api(current_tool_name, params)
-                    return response
-                tasks.append(tool_task(tool_name))
-
-            # Run all tool tasks in parallel
-            tool_responses = await asyncio.gather(*tasks)
-
-            # 4. Normalize the combined results into a single answer
-            final_answer = _format_combined_response(tool_responses)
-
-        # 5. Save the new conversation turn to memory
-        new_messages = [
-            {"role": "user", "content": request.message},
-            {"role": "assistant", "content": final_answer}
-        ]
-        update_student_chat_history(request.user_id, new_messages)
-
-        # 6. Return the final, combined answer and the raw data
-        return {
-            "chat_response": final_answer,
-            "tools_used": selected_tools,
-            "tool_data": tool_responses
+            selected.append((i, selection))
+
+    # 3. Batched parameter extraction, grouped per tool
+    extraction_requests = [(state, tool_name) for _, state in selected for tool_name in state["selected_tools"]]
+    extracted = await abatch_extract_parameters(extraction_requests) if extraction_requests else []
+
+    # 4. One downstream call per distinct (tool, parameters), shared by every item that needs it
+    tool_calls = {}
+    item_calls = {}  # item index -> list of call keys (or the extraction error)
+    cursor = 0
+    for i, state in selected:
+        keys = []
+        for tool_name in state["selected_tools"]:
+            params = extracted[cursor]
+            cursor += 1
+            if isinstance(params, Exception):
+                keys = params
+                break
+            key = canonical_key(tool_name, params)
+            if key not in tool_calls:
+                tool_calls[key] = cached_call_tool_api(tool_name, params)
+            keys.append(key)
+        item_calls[i] = keys
+
+    responses = dict(zip(tool_calls.keys(), await asyncio.gather(*tool_calls.values(), return_exceptions=True)))
+
+    # 5. Assemble each item's answer and persist its turn
+    async def finish_item(i: int, state: GraphState):
+        keys = item_calls[i]
+        if isinstance(keys, Exception):
+            results[i] = _batch_error(i, items[i], keys)
+            return
+        tool_responses = [responses[key] for key in keys]
+        failed = next((r for r in tool_responses if isinstance(r, Exception)), None)
+        if failed is not None:
+            results[i] = _batch_error(i, items[i], failed)
+            return
+        # Each item gets its own copy, since identical calls share one response object
+        tool_responses = [dict(response) for response in tool_responses]
+        final_answer = _format_combined_response(tool_responses) if tool_responses else NO_TOOL_ANSWER
+        try:
+            await save_turn(items[i].user_id, items[i].message, final_answer)
+        except Exception as e:
+            results[i] = _batch_error(i, items[i], e)
+            return
+        results[i] = {
+            "index": i, "user_id": items[i].user_id, "status": "ok",
+            "chat_response": final_answer, "tools_used": state["selected_tools"], "tool_data": tool_responses
         }
 
-    except Exception as e:
-        print(f"--- 🚨 ERROR in workflow: {e} ---")
-        # Provide a more detailed error message for debugging
-        raise HTTPException(status_code=500, detail=f"An internal error occurred in the AI workflow: {str(e)}")
+    await asyncio.gather(*(finish_item(i, state) for i, state in selected))
 
+    succeeded = sum(1 for result in results if result["status"] == "ok")
+    return {
+        "results": results,
+        "summary": {
+            "total": len(items), "succeeded": succeeded, "failed": len(items) - succeeded,
+            "extraction_calls": len(extraction_requests),
+            "distinct_tool_calls": len(tool_calls)
+        }
+    }
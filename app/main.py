@@ -1,13 +1,59 @@
-from fastapi import FastAPI
+import asyncio
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 # --- FIX: Import the api router as well ---
 from . import api, mock_tools
 from fastapi.middleware.cors import CORSMiddleware
+from orchestrator.http_client import start_http_client, close_http_client, get_pool_stats
+from orchestrator.tool_index import load_index, index_status
+from orchestrator.selection_cache import selection_cache
+from orchestrator.tool_cache import tool_result_cache
+from orchestrator.fast_router import fast_path_router
+from orchestrator.resilience import get_resilience_stats
+from orchestrator.admission import admission_controller
+from orchestrator.speculation import speculation_tracker
+from orchestrator.model_tiers import model_tiers
+from orchestrator.output_repair import output_repairer
+from orchestrator.session_cache import session_cache
+from orchestrator.workflow import start_workflow, close_workflow
+from orchestrator import state_manager
+from orchestrator.telemetry import (
+    configure_logging, shutdown_logging, set_request_id, reset_request_id,
+    http_request_duration, render_metrics, PROMETHEUS_CONTENT_TYPE,
+)
+
+async def _warm_tool_index():
+    """Loads the saved tool index in the background so startup never waits on it."""
+    try:
+        await asyncio.to_thread(load_index)
+    except Exception:
+        pass  # Reported through /ready; the first request retries the load.
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Owns app-lifetime resources: the log queue, the pooled HTTP client, the compiled workflow, the tool index warm-up and WebSocket sessions."""
+    configure_logging()
+    await start_http_client()
+    await start_workflow()
+    warmup = asyncio.create_task(_warm_tool_index())
+    yield
+    warmup.cancel()
+    # Sessions still connected at shutdown may have history that hasn't been written back yet
+    await session_cache.aclose()
+    await close_workflow()
+    await close_http_client()
+    shutdown_logging()
 
 # Create the main FastAPI application instance
 app = FastAPI(
     title="AI Tutor Orchestrator",
     description="The intelligent middleware connecting an AI Tutor to educational tools.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 origins = [
@@ -22,6 +68,24 @@ app.add_middleware(
     allow_headers=["*"], # Allow all headers
 )
 
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    """Gives every request an ID (honoring an incoming X-Request-ID) and records its latency."""
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16]
+    token = set_request_id(request_id)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        reset_request_id(token)
+        # Label by route template, not raw path, to keep the series count bounded
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        http_request_duration.observe(time.perf_counter() - started, method=request.method, route=route, status=status)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 # --- Include the API Routers ---
 
 # --- FIX: Add this line to include the /chat endpoint ---
@@ -38,3 +102,91 @@ def read_root():
     """A simple health check endpoint to confirm the server is running."""
     return {"status": "ok", "message": "Welcome to the AI Tutor Orchestrator!"}
 
+@app.get("/ready", tags=["Health Check"])
+def readiness():
+    """Readiness probe: only reports ready once the tool index is loaded."""
+    status = index_status()
+    return JSONResponse(status_code=200 if status["state"] == "ready" else 503, content=status)
+
+@app.get("/stats/http-pool", tags=["Health Check"])
+def http_pool_stats():
+    """Connection-pool statistics for the shared tool HTTP client, used to size its limits."""
+    return get_pool_stats()
+
+@app.get("/stats/selection-cache", tags=["Health Check"])
+def selection_cache_stats():
+    """Hit/miss/bypass counters for the semantic tool-selection cache."""
+    return selection_cache.get_stats()
+
+@app.get("/stats/tool-cache", tags=["Health Check"])
+def tool_cache_stats():
+    """Hit, coalesced and miss counters for the downstream tool-result cache."""
+    return tool_result_cache.get_stats()
+
+@app.get("/stats/router", tags=["Health Check"])
+def router_stats():
+    """
+    How often the local fast path vs. the selector LLM was taken, and each path's accuracy where
+    labeled: the fast path by shadow checks against the LLM; both paths by evaluation runs
+    (tests/run_evaluation.py), which label in their own process, so a server reports llm accuracy None.
+    """
+    return fast_path_router.get_stats()
+
+@app.get("/stats/tools", tags=["Health Check"])
+def tool_resilience_stats():
+    """Per-tool circuit-breaker state, retry/hedge counts and remaining retry budget."""
+    return get_resilience_stats()
+
+@app.get("/stats/admission", tags=["Health Check"])
+def admission_stats():
+    """Turns in flight and queued, turns shed per reason, and how backed up the LLM token bucket is."""
+    return admission_controller.get_stats()
+
+@app.get("/stats/speculation", tags=["Health Check"])
+def speculation_stats():
+    """Speculative extraction hit rate, the head start it gave confirmed tools, and the work thrown away."""
+    return speculation_tracker.get_stats()
+
+@app.get("/stats/model-tiers", tags=["Health Check"])
+def model_tier_stats():
+    """Per stage: which model tier produced each result, how often it escalated, and why."""
+    return model_tiers.get_stats()
+
+@app.get("/stats/output-repair", tags=["Health Check"])
+def output_repair_stats():
+    """Per stage: structured LLM answers used as is, repaired locally, or unusable, the fixes applied, and re-asks."""
+    return output_repairer.get_stats()
+
+@app.get("/stats/sessions", tags=["Health Check"])
+def session_stats():
+    """Cached /ws/chat sessions and connections, and their background history write-backs."""
+    return session_cache.get_stats()
+
+def _memory_kb() -> dict:
+    """Rss, Pss (shared pages split across the processes mapping them) and shared kB, Linux only."""
+    fields = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"):
+                    fields[key.lower() + "_kb"] = int(value.split()[0])
+    except OSError:
+        pass
+    return fields
+
+@app.get("/stats/worker", tags=["Health Check"])
+def worker_stats():
+    """Which worker answered, its memory (Pss stays flat as workers are added), and how it holds the index and state."""
+    status = index_status()
+    return {
+        "pid": os.getpid(),
+        "memory": _memory_kb(),
+        "index": {"source": status["source"], "mmap": status["mmap"]},
+        "state_backend": type(state_manager.state_backend).__name__,
+    }
+
+@app.get("/metrics", tags=["Health Check"])
+def metrics():
+    """Prometheus scrape endpoint: per-stage and per-request latency histograms plus LLM token counters."""
+    return PlainTextResponse(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
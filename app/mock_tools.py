@@ -1,7 +1,10 @@
 from fastapi import APIRouter, Body
+import logging
 from orchestrator.schemas import NoteMakerInput, FlashcardGeneratorInput, ConceptExplainerInput
 import json
 
+logger = logging.getLogger(__name__)
+
 # Create a router to hold all our tool endpoints
 router = APIRouter(prefix="/tools")
 
@@ -34,20 +37,17 @@ CONCEPT_EXPLAINER_SUCCESS_RESPONSE = {
 @router.post("/notemaker", tags=["Mock Tools"])
 async def notemaker_tool(data: NoteMakerInput = Body(...)):
     """Mocks the NoteMaker tool. It receives the validated input and returns a pre-defined success response."""
-    print(f"\n--- 📞 MOCK API: NoteMaker tool called with valid data ---")
-    print(data)
+    logger.debug("Mock NoteMaker tool called with %s", data)
     return NOTE_MAKER_SUCCESS_RESPONSE
 
 @router.post("/flashcards", tags=["Mock Tools"])
 async def flashcards_tool(data: FlashcardGeneratorInput = Body(...)):
     """Mocks the Flashcard Generator tool."""
-    print(f"\n--- 📞 MOCK API: Flashcards tool called with valid data ---")
-    print(data)
+    logger.debug("Mock Flashcards tool called with %s", data)
     return FLASHCARDS_SUCCESS_RESPONSE
 
 @router.post("/conceptexplainer", tags=["Mock Tools"])
 async def concexplainer_tool(data: ConceptExplainerInput = Body(...)):
     """Mocks the Concept Explainer tool."""
-    print(f"\n--- 📞 MOCK API: ConceptExplainer tool called with valid data ---")
-    print(data)
+    logger.debug("Mock ConceptExplainer tool called with %s", data)
     return CONCEPT_EXPLAINER_SUCCESS_RESPONSE
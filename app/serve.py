@@ -0,0 +1,75 @@
+"""
+Multi-worker launcher.
+
+Builds (or validates) the saved tool index once, then starts N uvicorn worker processes.
+Each worker memory-maps the same read-only index file, so the vectors are held once in
+the page cache rather than once per worker, and student state lives in a store every
+worker shares (SQLite in WAL mode) instead of a per-process dict, as do the checkpoints
+of resumable turns.
+
+    python -m app.serve --workers 4
+    STATE_DB_PATH=/var/lib/tutor/state.db python -m app.serve --workers 8 --port 8080
+
+Per-worker memory can be checked at /stats/worker (each request is answered by one worker).
+"""
+import argparse
+import importlib.util
+import logging
+import os
+import sys
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+def _configure_shared_state(workers: int):
+    """
+    Multiple workers need a cross-process state store and turn checkpointer (a resume can
+    land on any worker); both default to SQLite unless one was chosen. Without the optional
+    SQLite checkpointer package, the default falls back to no checkpointer.
+    """
+    backend = os.environ.setdefault("STATE_BACKEND", "sqlite" if workers > 1 else "memory")
+    if workers > 1 and backend == "memory":
+        sys.exit("STATE_BACKEND=memory keeps student state per process; use STATE_BACKEND=sqlite with --workers > 1.")
+    chosen = os.environ.get("GRAPH_CHECKPOINTER")
+    checkpointer = os.environ.setdefault("GRAPH_CHECKPOINTER", "sqlite" if workers > 1 else "memory")
+    if checkpointer == "sqlite" and importlib.util.find_spec("langgraph.checkpoint.sqlite") is None:
+        if chosen:
+            sys.exit("GRAPH_CHECKPOINTER=sqlite needs the optional `langgraph-checkpoint-sqlite` package.")
+        # The SQLite checkpointer is optional (see requirements.txt): run without resumable turns
+        logger.warning("`langgraph-checkpoint-sqlite` is not installed; starting with GRAPH_CHECKPOINTER=none (no /chat/resume).")
+        checkpointer = os.environ["GRAPH_CHECKPOINTER"] = "none"
+    if workers > 1 and checkpointer == "memory":
+        sys.exit("GRAPH_CHECKPOINTER=memory keeps resumable turns per process; use GRAPH_CHECKPOINTER=sqlite (or none) with --workers > 1.")
+    return backend, checkpointer
+
+def _prepare_index():
+    """Builds the index in the parent so workers only ever map the saved file."""
+    # Imported after the environment is set up: orchestrator.config reads it at import time
+    from orchestrator.tool_index import load_index, index_status
+
+    load_index()
+    return index_status()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the orchestrator with several worker processes.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    # Tool calls go back to this server (BASE_API_URL in orchestrator/config.py), so on this port
+    os.environ["ORCHESTRATOR_PORT"] = str(args.port)
+    backend, checkpointer = _configure_shared_state(args.workers)
+    status = _prepare_index()
+    logger.info(
+        "Tool index %s; starting %d workers with STATE_BACKEND=%s, GRAPH_CHECKPOINTER=%s.",
+        status["source"], args.workers, backend, checkpointer
+    )
+    uvicorn.run("app.main:app", host=args.host, port=args.port, workers=args.workers)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,96 @@
+"""
+Throughput benchmark for the in-process (ONNX) embedding provider.
+
+Sends the evaluation messages from N concurrent callers through `OnnxEmbeddings.aembed_query`,
+once with micro-batching disabled (one forward pass per query) and once with the configured
+batch size and wait, and reports queries per second, per-query latency and the mean batch size.
+Needs `onnxruntime` and a local export of the model (see EMBEDDING_MODEL_PATH in config.py).
+
+    python -m benchmarks.embedding_throughput --concurrency 32 --queries 2000
+    python -m benchmarks.embedding_throughput --model-path ./models/all-MiniLM-L6-v2 --batch-wait-ms 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from benchmarks.load_test import latency_summary
+from orchestrator.config import EMBEDDING_MODEL_PATH, EMBEDDING_BATCH_MAX_SIZE, EMBEDDING_BATCH_MAX_WAIT_MS
+from orchestrator.local_embeddings import OnnxEmbeddings
+from tests.evaluation_dataset import EVALUATION_DATASET
+
+async def run_variant(args, batch_max_size: int, batch_max_wait_ms: float) -> dict:
+    model = OnnxEmbeddings(args.model_path, batch_max_size, batch_max_wait_ms)
+    model.embed_documents(["warm up"])  # Load the model outside the timed section
+    messages = [case["message"] for case in EVALUATION_DATASET]
+    latencies = []
+    sent = 0
+
+    async def caller():
+        nonlocal sent
+        while sent < args.queries:
+            message = messages[sent % len(messages)]
+            sent += 1
+            started = time.perf_counter()
+            await model.aembed_query(message)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "batch_max_size": batch_max_size,
+        "batch_max_wait_ms": batch_max_wait_ms,
+        "queries": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_qps": round(len(latencies) / elapsed, 2),
+        "latency": latency_summary(latencies),
+        "batcher": model.batcher.get_stats(),
+    }
+
+async def run(args) -> dict:
+    unbatched = await run_variant(args, 1, 0.0)
+    batched = await run_variant(args, args.batch_size, args.batch_wait_ms)
+    return {
+        "model_path": args.model_path,
+        "concurrency": args.concurrency,
+        "unbatched": unbatched,
+        "batched": batched,
+        "speedup": round(batched["throughput_qps"] / unbatched["throughput_qps"], 2),
+    }
+
+def print_report(report: dict):
+    print(f"\n{report['concurrency']} concurrent callers, model {report['model_path']}")
+    print(f"{'variant':<12}{'qps':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'batch':>8}")
+    for name in ("unbatched", "batched"):
+        variant = report[name]
+        latency = variant["latency"]
+        print(f"{name:<12}{variant['throughput_qps']:>10}{latency['p50_ms']:>10}{latency['p95_ms']:>10}"
+              f"{latency['p99_ms']:>10}{variant['batcher']['mean_batch_size']:>8}")
+    print(f"speedup: {report['speedup']}x")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Batched vs. unbatched in-process embedding throughput.")
+    parser.add_argument("--model-path", default=EMBEDDING_MODEL_PATH)
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent callers.")
+    parser.add_argument("--queries", type=int, default=1000, help="Queries per variant.")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_MAX_SIZE)
+    parser.add_argument("--batch-wait-ms", type=float, default=EMBEDDING_BATCH_MAX_WAIT_MS)
+    parser.add_argument("--output", default=None, help="Write the JSON report here (e.g. benchmarks/results/embeddings.json).")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return report
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
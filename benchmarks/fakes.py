@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from typing import Any, List, Optional
+
+import numpy as np
+from pydantic import PrivateAttr
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+# --- Deterministic Offline Fakes for `llm` and `embeddings` ---
+# Installed with `orchestrator.agent.configure_models`, so the real app, chains and
+# parsers run unchanged while every model call is local, repeatable and has a
+# configurable latency.
+
+class LatencyModel:
+    """
+    A latency distribution parsed from a spec string:
+      "0"                       no delay
+      "constant:MS"             always MS milliseconds
+      "uniform:LOW:HIGH"        uniform between LOW and HIGH ms
+      "lognormal:MEDIAN:SIGMA"  lognormal with the given median (ms) and shape
+    """
+    def __init__(self, spec: str = "0", seed: int = 0):
+        self.spec = spec
+        parts = spec.split(":")
+        self.kind = parts[0] if len(parts) > 1 else "constant"
+        self.params = [float(part) for part in (parts[1:] if len(parts) > 1 else parts)]
+        self._rng = random.Random(seed)
+
+    def sample(self) -> float:
+        """Seconds to wait for one call."""
+        if self.kind == "constant":
+            ms = self.params[0]
+        elif self.kind == "uniform":
+            ms = self._rng.uniform(self.params[0], self.params[1])
+        elif self.kind == "lognormal":
+            ms = self.params[0] * float(np.exp(self._rng.gauss(0.0, self.params[1])))
+        else:
+            raise ValueError(f"Unknown latency distribution: {self.spec}")
+        return max(ms, 0.0) / 1000.0
+
+# Keyword rules the fake selector uses to pick tools from the student's message
+FAKE_SELECTION_RULES = [
+    ("Flashcards", ("flashcard", "memorize", "flash card", "review key")),
+    ("QuizGenerator", ("quiz", "practice problem", "test me", "check if", "check my")),
+    ("AnalogyCreator", ("analogy", "compare", "comparison", "like?")),
+    ("NoteMaker", ("summarize", "notes", "outline", "key points")),
+    ("ConceptExplainer", ("explain", "what is", "how does", "don't get", "tell me about")),
+]
+
+# Canned, schema-valid parameters returned by the fake structured-output calls
+CANNED_PARAMETERS = {
+    "NoteMakerInput": {"topic": "Photosynthesis", "subject": "Biology"},
+    "FlashcardGeneratorInput": {"topic": "Photosynthesis", "subject": "Biology", "count": 5, "difficulty": "medium"},
+    "ConceptExplainerInput": {"concept_to_explain": "Photosynthesis", "current_topic": "Biology", "desired_depth": "intermediate"},
+}
+
+_MESSAGE_RE = re.compile(r"\*\*Student's Latest Message:\*\*\s*(.*?)\n\s*\n", re.S)
+_LISTED_TOOL_RE = re.compile(r"- \*\*(\w+)\*\*:")
+
+def fake_select_tools(prompt_text: str) -> List[str]:
+    match = _MESSAGE_RE.search(prompt_text)
+    message = (match.group(1) if match else prompt_text).lower()
+    tools = [tool for tool, keywords in FAKE_SELECTION_RULES if any(keyword in message for keyword in keywords)]
+    if not tools:
+        listed = _LISTED_TOOL_RE.findall(prompt_text)
+        tools = listed[:1] or ["ConceptExplainer"]
+    return tools
+
+def fake_repairable_json(value: dict) -> str:
+    """`value` with the defects LLMs tend to add: Python-style quoting, wrong-case names and enums, out-of-range numbers, prose."""
+    def damage(item):
+        if isinstance(item, dict):
+            return {key[0].upper() + key[1:]: damage(inner) for key, inner in item.items()}
+        if isinstance(item, list):
+            return [damage(inner) for inner in item] + [damage(item[-1])] if item else []
+        if isinstance(item, bool):
+            return item
+        if isinstance(item, int):
+            return item * 10
+        if isinstance(item, str):
+            return item.lower() if item[:1].isupper() else item.capitalize()
+        return item
+    return f"Here is the JSON you asked for:\n{damage(value)!r}"
+
+class FakeChatModel(BaseChatModel):
+    """
+    Answers the selector, planner and summary prompts with canned output after a sampled delay.
+    With `malformed_rate` > 0 it sometimes answers unusably (prose instead of JSON, or no
+    structured output), which is how a fast tier is made to escalate offline. With
+    `repairable_rate` > 0 it sometimes answers with defects `output_repair` can fix locally.
+    """
+    latency: Any = None
+    calls: int = 0
+    malformed_rate: float = 0.0
+    repairable_rate: float = 0.0
+    seed: int = 0
+    _rng: Any = PrivateAttr(default=None)
+
+    def _sample(self) -> float:
+        if self._rng is None:
+            self._rng = random.Random(self.seed)
+        return self._rng.random()
+
+    def _malformed(self) -> bool:
+        return self.malformed_rate > 0 and self._sample() < self.malformed_rate
+
+    def _repairable(self) -> bool:
+        return self.repairable_rate > 0 and self._sample() < self.repairable_rate
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-orchestrator-chat"
+
+    def _respond(self, prompt_text: str) -> str:
+        if "running summary" in prompt_text:
+            return "The student has been studying a range of science and history topics."
+        if self._malformed():
+            return "I think the student would benefit from a few different study tools here."
+        tools = fake_select_tools(prompt_text)
+        if "parameter schemas" in prompt_text:
+            from orchestrator.tool_registry import tool_registry
+            plan = [{"tool": tool, "parameters": CANNED_PARAMETERS[tool_registry.get_schema(tool).__name__]} for tool in tools]
+            answer = {"tools": plan}
+        else:
+            answer = {"tools": tools}
+        return fake_repairable_json(answer) if self._repairable() else json.dumps(answer)
+
+    def _delay(self) -> float:
+        self.calls += 1
+        return self.latency.sample() if self.latency else 0.0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self._delay())
+        text = self._respond("\n".join(str(message.content) for message in messages))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self._delay())
+        text = self._respond("\n".join(str(message.content) for message in messages))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def with_structured_output(self, schema, include_raw: bool = False, **kwargs):
+        canned = CANNED_PARAMETERS[schema.__name__]
+
+        def answer():
+            if self._malformed():
+                text, parsed = "I could not work out the parameters for this tool.", None
+            elif self._repairable():
+                text, parsed = fake_repairable_json(canned), None
+            else:
+                text, parsed = json.dumps(canned), schema(**canned)
+            if not include_raw:
+                return parsed
+            # Shaped like the real `include_raw=True` output
+            error = None if parsed is not None else ValueError(f"Failed to parse {schema.__name__} from: {text}")
+            return {"raw": AIMessage(content=text), "parsed": parsed, "parsing_error": error}
+
+        def invoke(_):
+            time.sleep(self._delay())
+            return answer()
+
+        async def ainvoke(_):
+            await asyncio.sleep(self._delay())
+            return answer()
+
+        return RunnableLambda(invoke, afunc=ainvoke)
+
+class FakeEmbeddings(Embeddings):
+    """
+    Hashed bag-of-words vectors: deterministic, and similar messages get similar vectors,
+    so the selection cache and fast path behave realistically offline.
+    """
+    def __init__(self, size: int = 384, latency: Optional[LatencyModel] = None):
+        self.size = size
+        self.latency = latency
+        self.calls = 0
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in re.findall(r"[a-z0-9']+", text.lower()):
+            bucket = int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % self.size
+            vector[bucket] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _delay(self) -> float:
+        self.calls += 1
+        return self.latency.sample() if self.latency else 0.0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self._delay())
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self._delay())
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self._delay())
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self._delay())
+        return self._embed(text)
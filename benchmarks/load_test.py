@@ -0,0 +1,270 @@
+"""
+Offline load test for the orchestrator.
+
+Runs the real FastAPI app in-process with fake chat/embedding models (configurable
+latency, canned structured outputs) and in-process mock tools, drives `/chat` with a
+closed-loop or open-loop load generator, and reports throughput plus p50/p95/p99 per
+stage and end to end. No API keys or network access are needed.
+
+    python -m benchmarks.load_test --mode closed --concurrency 16 --requests 400
+    python -m benchmarks.load_test --mode open --rate 50 --duration 30 --llm-latency lognormal:800:0.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import numpy as np
+
+# The saved index must not be mixed with (or overwrite) the real one
+os.environ.setdefault("TOOL_INDEX_DIR", os.path.join(tempfile.gettempdir(), "orchestrator_bench_index"))
+
+import httpx
+
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings, LatencyModel
+from orchestrator.admission import admission_controller, llm_rate_limiter
+from orchestrator.speculation import speculation_tracker
+from orchestrator.model_tiers import model_tiers
+from orchestrator.output_repair import output_repairer
+from orchestrator.telemetry import configure_logging, shutdown_logging
+from tests.evaluation_dataset import EVALUATION_DATASET
+
+def seed_users(count: int) -> list:
+    """
+    Adds `count` synthetic students (copies of a demo profile) to the in-memory store, so
+    per-user turn serialization reflects many students rather than capping the whole load.
+    """
+    from orchestrator.state_manager import mock_student_db
+
+    template = mock_student_db["student456"]["user_info"]
+    user_ids = []
+    for i in range(count):
+        user_id = f"loadtest-{i:04d}"
+        mock_student_db.setdefault(user_id, {
+            "user_info": template.model_copy(update={"user_id": user_id}),
+            "chat_history": [], "conversation_summary": "", "summarized_count": 0,
+        })
+        user_ids.append(user_id)
+    return user_ids
+
+class StageTimer:
+    """Collects per-stage latencies (ms) by wrapping the coroutines each stage awaits."""
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def record(self, stage: str, seconds: float):
+        self.samples[stage].append(seconds * 1000)
+
+    def wrap(self, module, name: str, stage: str):
+        original = getattr(module, name)
+
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await original(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - started)
+
+        setattr(module, name, timed)
+
+    def summary(self) -> dict:
+        return {stage: latency_summary(values) for stage, values in sorted(self.samples.items())}
+
+def latency_summary(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    data = np.asarray(values)
+    return {
+        "count": len(values),
+        "mean_ms": round(float(data.mean()), 2),
+        "p50_ms": round(float(np.percentile(data, 50)), 2),
+        "p95_ms": round(float(np.percentile(data, 95)), 2),
+        "p99_ms": round(float(np.percentile(data, 99)), 2),
+        "max_ms": round(float(data.max()), 2),
+    }
+
+def _install_fakes(args) -> tuple:
+    from orchestrator import agent
+
+    chat_model = FakeChatModel(latency=LatencyModel(args.llm_latency, seed=args.seed))
+    embedding_model = FakeEmbeddings(latency=LatencyModel(args.embedding_latency, seed=args.seed + 1))
+    # The fast tier gets its own fake so its latency and failure rate can differ from the pro tier's
+    fast_model = FakeChatModel(
+        latency=LatencyModel(args.fast_llm_latency or args.llm_latency, seed=args.seed + 2),
+        malformed_rate=args.fast_malformed_rate, repairable_rate=args.fast_repairable_rate, seed=args.seed,
+    )
+    agent.configure_models(chat_model=chat_model, embedding_model=embedding_model, tier_models={"fast": fast_model})
+    # The fakes have no provider quota, so the LLM token bucket only applies when asked for
+    llm_rate_limiter.configure(args.llm_rps)
+    speculation_tracker.enabled = args.speculate or args.speculate_calls
+    speculation_tracker.call_tools = args.speculate_calls
+    speculation_tracker.max_distance = args.speculate_max_distance
+    output_repairer.enabled = not args.no_repair
+    return chat_model, fast_model, embedding_model
+
+def _instrument(timer: StageTimer):
+    from app import api
+    from orchestrator import agent, workflow
+
+    # Module-level names are looked up at call time by the handlers and the graph's nodes,
+    # so wrapping them times each stage
+    timer.wrap(api, "aget_student_state", "state_load")
+    timer.wrap(workflow, "aselect_tools_node", "selection")
+    timer.wrap(workflow, "aextract_parameters_for_tool", "extraction")
+    timer.wrap(workflow, "cached_call_tool_api", "tool_call")
+    timer.wrap(workflow, "aupdate_student_chat_history", "state_save")
+    timer.wrap(agent, "_aembed_and_retrieve", "retrieval")
+
+async def _send(client: httpx.AsyncClient, timer: StageTimer, results: dict, rng: random.Random, user_ids: list):
+    case = rng.choice(EVALUATION_DATASET)
+    payload = {"user_id": rng.choice(user_ids), "message": case["message"]}
+    started = time.perf_counter()
+    try:
+        response = await client.post("/chat", json=payload)
+        status = response.status_code
+    except Exception:
+        status = None
+    timer.record("end_to_end", time.perf_counter() - started)
+    results["completed"] += 1
+    # Shed requests (429) are expected under overload and counted apart from failures
+    results["rejected"] += int(status == 429)
+    results["errors"] += int(status not in (200, 429))
+
+async def run_closed_loop(client, timer, results, args, user_ids):
+    """`concurrency` virtual users, each sending its next request as soon as the last one returns."""
+    rng = random.Random(args.seed)
+    deadline = time.perf_counter() + args.duration if args.duration else None
+    remaining = [args.requests]
+
+    async def user():
+        while (deadline is None or time.perf_counter() < deadline) and remaining[0] > 0:
+            remaining[0] -= 1
+            await _send(client, timer, results, rng, user_ids)
+
+    await asyncio.gather(*(user() for _ in range(args.concurrency)))
+
+async def run_open_loop(client, timer, results, args, user_ids):
+    """Poisson arrivals at `rate` requests/second, independent of how fast responses come back."""
+    rng = random.Random(args.seed)
+    deadline = time.perf_counter() + (args.duration or 10)
+    tasks = []
+    while time.perf_counter() < deadline and len(tasks) < args.requests:
+        tasks.append(asyncio.create_task(_send(client, timer, results, rng, user_ids)))
+        await asyncio.sleep(rng.expovariate(args.rate))
+    await asyncio.gather(*tasks)
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run(args) -> dict:
+    from app.main import app
+    from orchestrator.http_client import start_http_client, close_http_client
+    from orchestrator.tool_index import load_index
+
+    chat_model, fast_model, embedding_model = _install_fakes(args)
+    user_ids = seed_users(args.users)
+    timer = StageTimer()
+    _instrument(timer)
+
+    # Tool calls go through the shared pooled client but stay in-process via the ASGI transport
+    transport = httpx.ASGITransport(app=app)
+    await start_http_client(transport)
+    load_index()
+    results = {"completed": 0, "errors": 0, "rejected": 0}
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://orchestrator", timeout=None) as client:
+            started = time.perf_counter()
+            if args.mode == "closed":
+                await run_closed_loop(client, timer, results, args, user_ids)
+            else:
+                await run_open_loop(client, timer, results, args, user_ids)
+            elapsed = time.perf_counter() - started
+    finally:
+        await close_http_client()
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "config": vars(args),
+        "elapsed_s": round(elapsed, 3),
+        "requests": results["completed"],
+        "errors": results["errors"],
+        "rejected": results["rejected"],
+        "admission": admission_controller.get_stats(),
+        "speculation": speculation_tracker.get_stats(),
+        "throughput_rps": round(results["completed"] / elapsed, 2) if elapsed else 0.0,
+        "model_calls": {"llm": chat_model.calls, "llm_fast": fast_model.calls, "embeddings": embedding_model.calls},
+        "model_tiers": model_tiers.get_stats(),
+        "output_repair": output_repairer.get_stats(),
+        "stages": timer.summary(),
+    }
+
+def print_report(report: dict):
+    print(f"\n{report['requests']} requests in {report['elapsed_s']}s "
+          f"({report['throughput_rps']} req/s, {report['errors']} errors, {report['rejected']} shed with 429)")
+    print(f"{'stage':<14}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for stage, stats in report["stages"].items():
+        if stats["count"]:
+            print(f"{stage:<14}{stats['count']:>8}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+    for stage, stats in report["model_tiers"]["stages"].items():
+        print(f"{stage}: tiers {stats['tiers']}, escalation rate {stats['escalation_rate']} {stats['reasons'] or ''}")
+    for stage, stats in report["output_repair"]["stages"].items():
+        print(f"{stage}: {stats['repaired']}/{stats['outputs']} answers repaired locally, {stats['unrecoverable']} unusable, "
+              f"{stats['reasks_recovered']}/{stats['reasks']} re-asks recovered {stats['fixes'] or ''}")
+    speculation = report["speculation"]
+    if speculation["enabled"]:
+        print(f"speculation: {speculation['hits']} hits / {speculation['misses']} misses (hit rate {speculation['hit_rate']}), "
+              f"{speculation['wasted_extraction_seconds']}s extraction and {speculation['wasted_tool_calls']} tool calls wasted")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for the orchestrator /chat endpoint.")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--concurrency", type=int, default=8, help="Virtual users (closed loop).")
+    parser.add_argument("--users", type=int, default=64, help="Distinct synthetic students sending requests.")
+    parser.add_argument("--rate", type=float, default=20.0, help="Arrivals per second (open loop).")
+    parser.add_argument("--requests", type=int, default=200, help="Maximum number of requests to send.")
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds.")
+    parser.add_argument("--llm-latency", default="lognormal:800:0.4", help="e.g. constant:500, uniform:200:900, lognormal:800:0.4")
+    parser.add_argument("--fast-llm-latency", default=None, help="Latency of the fast model tier (defaults to --llm-latency).")
+    parser.add_argument("--fast-malformed-rate", type=float, default=0.0,
+                        help="Share of fast-tier answers that are unusable, forcing an escalation.")
+    parser.add_argument("--fast-repairable-rate", type=float, default=0.0,
+                        help="Share of fast-tier answers with defects the local repair stage can fix.")
+    parser.add_argument("--no-repair", action="store_true", help="Disable local output repair (parse errors escalate as before).")
+    parser.add_argument("--embedding-latency", default="lognormal:60:0.3")
+    parser.add_argument("--llm-rps", type=float, default=0.0, help="LLM token-bucket rate; 0 leaves it unlimited.")
+    parser.add_argument("--speculate", action="store_true", help="Extract the top retrieved tool's parameters during selection.")
+    parser.add_argument("--speculate-calls", action="store_true", help="Also call that tool early (implies --speculate).")
+    parser.add_argument("--speculate-max-distance", type=float, default=2.0,
+                        help="Top-1 distance cutoff; the hashed fake embeddings sit further apart than the real model's.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write the JSON report here (e.g. benchmarks/results/run.json).")
+    parser.add_argument("--verbose", action="store_true", help="Log every node and span (DEBUG level).")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.verbose:
+        configure_logging("DEBUG")
+    report = asyncio.run(run(args))
+    shutdown_logging()
+    print_report(report)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return report
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from .config import (
+    ADMISSION_MAX_CONCURRENT_TURNS, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT_SECONDS, USER_MAX_PENDING_TURNS,
+    LLM_REQUESTS_PER_SECOND, LLM_BURST, ADMISSION_MAX_LLM_BACKLOG_SECONDS,
+)
+from .telemetry import admission_queue_depth, admission_in_flight, admission_wait, admission_rejected, llm_rate_limit_wait
+
+logger = logging.getLogger(__name__)
+
+# --- Admission Control and LLM Backpressure ---
+# A spike must not turn into an unbounded number of concurrent Gemini calls. Turns take
+# one of a fixed number of slots, wait in a bounded FIFO queue otherwise, and are shed
+# with 429 + Retry-After when the queue is full, the wait is too long, or the LLM token
+# bucket is already backed up. Each student's turns run one at a time, in order, so a
+# double-click can't interleave two turns in the chat history; waiting behind the
+# student's earlier turn counts toward the same queue timeout. Per-user ordering is per
+# process: with several workers, route a student to the same worker to keep it.
+
+class Overloaded(Exception):
+    """Raised instead of admitting a turn; the API turns it into 429 with `retry_after` seconds."""
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Server overloaded ({reason}); retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+class TokenBucketRateLimiter(BaseRateLimiter):
+    """
+    Request token bucket for LLM calls, plugged in as the chat model's `rate_limiter`.
+    Each caller reserves its token up front and sleeps until it is due, so waiters are
+    served in arrival order without polling. A rate of 0 disables the limit.
+    """
+    def __init__(self, requests_per_second: float = LLM_REQUESTS_PER_SECOND, burst: int = LLM_BURST):
+        self._lock = threading.Lock()
+        self.configure(requests_per_second, burst)
+
+    def configure(self, requests_per_second: float, burst: int = LLM_BURST):
+        with self._lock:
+            self.rate = requests_per_second
+            self.burst = burst
+            self._tokens = float(burst)
+            self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self, blocking: bool) -> Optional[float]:
+        """Takes a token (possibly going into debt) and returns how long to wait for it, or None if not blocking."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens < 1 and not blocking:
+                return None
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def backlog_seconds(self) -> float:
+        """How long an LLM call made now would wait for its token."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        delay = self._reserve(blocking)
+        if delay is None:
+            return False
+        if delay:
+            time.sleep(delay)
+        llm_rate_limit_wait.observe(delay)
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        delay = self._reserve(blocking)
+        if delay is None:
+            return False
+        if delay:
+            await asyncio.sleep(delay)
+        llm_rate_limit_wait.observe(delay)
+        return True
+
+llm_rate_limiter = TokenBucketRateLimiter()
+
+class _UserTurns:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = 0
+
+class AdmissionTicket:
+    """Held for the duration of an admitted turn; `release` is idempotent."""
+    def __init__(self, controller: "AdmissionController", user_id: Optional[str]):
+        self._controller = controller
+        self.user_id = user_id
+        self.admitted_at = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(self)
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int = ADMISSION_MAX_CONCURRENT_TURNS, max_queue: int = ADMISSION_MAX_QUEUE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS, user_max_pending: int = USER_MAX_PENDING_TURNS,
+                 rate_limiter: TokenBucketRateLimiter = llm_rate_limiter,
+                 max_llm_backlog: float = ADMISSION_MAX_LLM_BACKLOG_SECONDS):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.user_max_pending = user_max_pending
+        self.rate_limiter = rate_limiter
+        self.max_llm_backlog = max_llm_backlog
+        self.in_flight = 0
+        self._waiters = deque()
+        self._users: Dict[str, _UserTurns] = {}
+        self._turn_seconds = 2.0  # EWMA of how long a slot is held, for Retry-After
+        self.stats = {"admitted": 0, "queued": 0, "rejected": {}}
+
+    def retry_after(self) -> int:
+        """Roughly when a slot frees up for a request arriving now: the queue ahead of it divided by the slots."""
+        return max(1, math.ceil(self._turn_seconds * (len(self._waiters) + 1) / self.max_concurrent))
+
+    def _reject(self, reason: str, retry_after: int = None) -> Overloaded:
+        self.stats["rejected"][reason] = self.stats["rejected"].get(reason, 0) + 1
+        admission_rejected.inc(reason=reason)
+        logger.warning("Shedding turn (%s): %d in flight, %d queued", reason, self.in_flight, len(self._waiters))
+        return Overloaded(reason, retry_after or self.retry_after())
+
+    def _update_gauges(self):
+        admission_in_flight.set(self.in_flight)
+        admission_queue_depth.set(len(self._waiters))
+
+    async def _acquire_slot(self, timeout: float):
+        if self.in_flight < self.max_concurrent and not self._waiters:
+            self.in_flight += 1
+            self._update_gauges()
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject("queue_full")
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.stats["queued"] += 1
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(waiter, max(0.0, timeout))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up; pass it on
+                self._release_slot()
+            else:
+                waiter.cancel()
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            self._update_gauges()
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject("queue_timeout")
+            raise
+
+    async def _acquire_user_lock(self, user: _UserTurns):
+        try:
+            await asyncio.wait_for(user.lock.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self._reject("user_timeout")
+
+    def _release_slot(self):
+        # Hand the slot straight to the oldest live waiter, so in_flight never dips and refills
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self.in_flight -= 1
+        self._update_gauges()
+
+    async def admit(self, user_id: Optional[str] = None) -> AdmissionTicket:
+        """
+        Waits for this user's earlier turns and then for a slot. Raises Overloaded when the
+        turn should be shed instead. Pass user_id=None for work that isn't one student's turn.
+        """
+        started = time.monotonic()
+        backlog = self.rate_limiter.backlog_seconds() if self.rate_limiter else 0.0
+        if backlog > self.max_llm_backlog:
+            raise self._reject("llm_backlog", math.ceil(backlog))
+
+        user = None
+        if user_id is not None:
+            user = self._users.setdefault(user_id, _UserTurns())
+            if user.pending >= self.user_max_pending:
+                raise self._reject("user_busy")
+            user.pending += 1
+        try:
+            if user is not None:
+                await self._acquire_user_lock(user)
+            try:
+                # The turn's whole wait, behind the student's earlier turns and then for a slot, is bounded
+                await self._acquire_slot(self.queue_timeout - (time.monotonic() - started))
+            except BaseException:
+                if user is not None:
+                    user.lock.release()
+                raise
+        except BaseException as e:
+            self._forget_user(user_id, user)
+            admission_wait.observe(time.monotonic() - started, outcome="shed" if isinstance(e, Overloaded) else "cancelled")
+            raise
+        admission_wait.observe(time.monotonic() - started, outcome="admitted")
+        self.stats["admitted"] += 1
+        return AdmissionTicket(self, user_id)
+
+    def _forget_user(self, user_id: Optional[str], user: Optional[_UserTurns]):
+        if user is None:
+            return
+        user.pending -= 1
+        if user.pending == 0:
+            self._users.pop(user_id, None)
+
+    def _release(self, ticket: AdmissionTicket):
+        held = time.monotonic() - ticket.admitted_at
+        self._turn_seconds = 0.9 * self._turn_seconds + 0.1 * held
+        self._release_slot()
+        if ticket.user_id is not None:
+            user = self._users.get(ticket.user_id)
+            if user is not None:
+                user.lock.release()
+                self._forget_user(ticket.user_id, user)
+
+    @asynccontextmanager
+    async def turn(self, user_id: Optional[str] = None):
+        ticket = await self.admit(user_id)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def get_stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": len(self._waiters),
+            "users_waiting": sum(1 for user in self._users.values() if user.pending > 1),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "mean_turn_seconds": round(self._turn_seconds, 3),
+            "llm_backlog_seconds": round(self.rate_limiter.backlog_seconds(), 3) if self.rate_limiter else 0.0,
+            **self.stats,
+        }
+
+admission_controller = AdmissionController()
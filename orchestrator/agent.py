@@ -1,46 +1,259 @@
-from typing import TypedDict, List, Dict
-import httpx 
+from typing import Annotated, TypedDict, List, Dict, Any, Awaitable, Callable, Optional
+from collections import defaultdict
+import asyncio
+import json
+import logging
+import random
+import time
+import httpx
+import numpy as np 
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import AIMessage, HumanMessage
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.output_parsers import PydanticOutputParser
-from langchain_community.vectorstores.faiss import FAISS
-from langchain_huggingface import HuggingFaceEndpointEmbeddings
+from langchain_core.output_parsers import PydanticOutputParser, StrOutputParser
+from langchain_core.exceptions import OutputParserException
 from dotenv import load_dotenv
 
-from .prompts import SCALABLE_TOOL_SELECTOR_PROMPT, PARAMETER_EXTRACTOR_PROMPT
-from .schemas import NoteMakerInput, FlashcardGeneratorInput, ConceptExplainerInput
-from .config import TOOL_REGISTRY, TOOL_API_ENDPOINTS, BASE_API_URL
+from .prompts import SCALABLE_TOOL_SELECTOR_PROMPT, PARAMETER_EXTRACTOR_PROMPT, TOOL_PLANNER_PROMPT, HISTORY_SUMMARY_PROMPT, OUTPUT_REASK_PROMPT
+from .config import RETRIEVER_K, CONTEXT_SUMMARY_MAX_WORDS, BATCH_MAX_CONCURRENCY, FAST_PATH_SHADOW_RATE
+from .context_builder import format_messages_for_summary
+from . import tool_index
+from .tool_registry import tool_registry
+from .tool_index import embeddings, get_retriever, load_index
+from .selection_cache import selection_cache, depends_on_history
+from .fast_router import fast_path_router
+from .tool_cache import tool_result_cache
+from .resilience import get_resilience, RetryableStatusError, CircuitOpenError
+from .http_client import post_json, get_tool_url, get_tool_timeout
+from .telemetry import span, token_usage_handler
+from .admission import llm_rate_limiter
+from .speculation import speculation_tracker, SpeculativeRun
+from .model_tiers import model_tiers, EscalationNeeded
+from .output_repair import output_repairer, describe_error
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # --- 1. Define Graph State for Multi-Tool Workflows ---
+def merge_by_tool(current: Optional[Dict[str, Any]], update: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Reducer for per-tool maps (see workflow.py): an update adds or replaces tools' entries,
+    and a None value removes an entry (how a resume clears timed-out results).
+    """
+    merged = dict(current or {})
+    for tool_name, value in (update or {}).items():
+        if value is None:
+            merged.pop(tool_name, None)
+        else:
+            merged[tool_name] = value
+    return merged
+
 class GraphState(TypedDict):
+    user_id: str
     student_message: str
+    # Recent messages only; older turns live in `conversation_summary` (see context_builder.py)
     chat_history: List[Dict]
+    conversation_summary: str
     user_info: Dict
     # --- NEW: Fields to handle lists of tools ---
     selected_tools: List[str]
+    # Parameters from the single-call planner or from each tool's extraction, keyed by tool name
+    tool_parameters: Annotated[Dict[str, Dict], merge_by_tool]
+    # Each tool's response, keyed by tool name
+    tool_results: Annotated[Dict[str, Dict], merge_by_tool]
     tool_api_responses: List[Dict] 
     final_answer: str
+    # Per-request retriever depth; missing or None means RETRIEVER_K
+    retriever_k: Optional[int]
+    # A confirmed speculative extraction for one selected tool (see speculation.py). Never
+    # written to the compiled graph's state, since checkpoints can't hold a running task.
+    speculation: Optional[SpeculativeRun]
+    # How the tools were chosen: "cache", "fast" or "llm" (set by the selection nodes)
+    selection_path: str
 
 # --- 2. Initialize Models & Retriever ---
-try:
-    embeddings = HuggingFaceEndpointEmbeddings(model="sentence-transformers/all-MiniLM-L6-v2")
-    tool_descriptions = list(TOOL_REGISTRY.values())
-    vector_store = FAISS.from_texts(texts=tool_descriptions, embedding=embeddings)
-    # Retrieve more tools for better context in multi-step tasks
-    retriever = vector_store.as_retriever(search_kwargs={"k": 5}) 
-    print("✅ Tool retriever created successfully.")
-except Exception as e:
-    print(f"❌ Error creating tool retriever: {e}")
-    retriever = None
-
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-pro", temperature=0, convert_system_message_to_human=True)
+# The tool index is loaded lazily from disk (see tool_index.py), so importing this
+# module no longer makes a network call. There is one chat model per tier (fast, pro);
+# each stage cascades through its own tiers (see model_tiers.py and the cascade below).
+def _build_chat_model(model_name: str) -> ChatGoogleGenerativeAI:
+    return ChatGoogleGenerativeAI(
+        model=model_name, temperature=0, convert_system_message_to_human=True, callbacks=[token_usage_handler],
+        rate_limiter=llm_rate_limiter,
+    )
+
+model_tiers.set_models({tier: _build_chat_model(name) for tier, name in model_tiers.tier_names.items()})
+
+def _instrument_model(chat_model):
+    """Keeps per-stage token accounting (telemetry.py) and the shared LLM token bucket (admission.py) on a replacement model."""
+    if token_usage_handler not in (chat_model.callbacks or []):
+        chat_model.callbacks = [*(chat_model.callbacks or []), token_usage_handler]
+    chat_model.rate_limiter = chat_model.rate_limiter or llm_rate_limiter
+    return chat_model
+
+def configure_models(chat_model=None, embedding_model=None, tier_models: Optional[Dict[str, Any]] = None):
+    """
+    Swaps the chat models and/or the embeddings (e.g. for offline fakes in benchmarks).
+    `chat_model` serves every tier; `tier_models` replaces individual tiers by name.
+    """
+    global embeddings
+    models = {tier: chat_model for tier in model_tiers.tier_names} if chat_model is not None else {}
+    models.update(tier_models or {})
+    model_tiers.set_models({tier: _instrument_model(model) for tier, model in models.items()})
+    if embedding_model is not None:
+        embeddings = embedding_model
+        tool_index.set_embeddings(embedding_model)
 
 # --- 3. Define Graph Nodes (Functions) ---
 
+def _history_inputs(state: GraphState) -> dict:
+    """The budgeted conversation context shared by every prompt."""
+    return {"chat_history": state["chat_history"], "conversation_summary": state.get("conversation_summary") or "(none)"}
+
+# --- Model Cascade ---
+# `invoke(model)` runs a stage on one tier's model. Stage chains repair their output
+# locally first (see output_repair.py); an answer that still can't be used, a schema
+# validation error, or a reason returned by `check(result)` moves the stage to its next
+# tier. The last tier's result is used as is. If the last tier's answer can't be parsed,
+# `reask(model, error)` asks that tier once more with its answer and the error.
+ESCALATING_ERRORS = (OutputParserException, ValidationError, EscalationNeeded)
+
+def _escalation_reason(error: Exception) -> str:
+    if isinstance(error, EscalationNeeded):
+        return error.reason
+    return "schema_invalid" if isinstance(error, ValidationError) else "parse_error"
+
+def _accept(stage: str, tier: str, reason: Optional[str], reasons: List[str], last: bool) -> bool:
+    """Records a usable (or last-tier) result and returns True; otherwise notes why the stage escalates."""
+    if reason is None or last:
+        if reason is not None:
+            logger.warning("%s output from the %s tier is still %s; using it", stage, tier, reason)
+        model_tiers.record(stage, tier, reasons)
+        return True
+    reasons.append(reason)
+    logger.info("Escalating %s from the %s tier: %s", stage, tier, reason)
+    return False
+
+def _reask_prompt(prompt: ChatPromptTemplate, error: Optional[OutputParserException]) -> ChatPromptTemplate:
+    """The stage prompt, or for a re-ask the stage prompt followed by the unusable answer and what was wrong with it."""
+    if error is None:
+        return prompt
+    return ChatPromptTemplate.from_messages([
+        *prompt.messages,
+        AIMessage(content=error.llm_output or "(empty answer)"),
+        HumanMessage(content=OUTPUT_REASK_PROMPT.format(error=describe_error(error))),
+    ]).partial(**prompt.partial_variables)
+
+def _can_reask(error: Exception, reask) -> bool:
+    return reask is not None and output_repairer.enabled and isinstance(error, OutputParserException)
+
+def _reask(stage: str, tier: str, reask: Callable[[Any, OutputParserException], Any], error: OutputParserException):
+    logger.info("Re-asking %s on the %s tier after an unusable answer: %s", stage, tier, error)
+    try:
+        result = reask(model_tiers.model(tier), error)
+    except ESCALATING_ERRORS:
+        output_repairer.record_reask(stage, recovered=False)
+        raise
+    output_repairer.record_reask(stage, recovered=True)
+    return result
+
+async def _areask(stage: str, tier: str, reask: Callable[[Any, OutputParserException], Awaitable], error: OutputParserException):
+    logger.info("Re-asking %s on the %s tier after an unusable answer: %s", stage, tier, error)
+    try:
+        result = await reask(model_tiers.model(tier), error)
+    except ESCALATING_ERRORS:
+        output_repairer.record_reask(stage, recovered=False)
+        raise
+    output_repairer.record_reask(stage, recovered=True)
+    return result
+
+def _cascade(stage: str, invoke: Callable[[Any], Any], check: Optional[Callable[[Any], Optional[str]]] = None,
+             reask: Optional[Callable[[Any, OutputParserException], Any]] = None):
+    tiers = model_tiers.tiers_for(stage)
+    reasons = []
+    for position, tier in enumerate(tiers):
+        last = position == len(tiers) - 1
+        try:
+            result = invoke(model_tiers.model(tier))
+            reason = check(result) if check else None
+        except ESCALATING_ERRORS as e:
+            if not last:
+                reason = _escalation_reason(e)
+            elif _can_reask(e, reask):
+                result = _reask(stage, tier, reask, e)
+                reason = check(result) if check else None
+            else:
+                raise
+        if _accept(stage, tier, reason, reasons, last):
+            return result
+
+async def _acascade(stage: str, ainvoke: Callable[[Any], Any], check: Optional[Callable[[Any], Optional[str]]] = None,
+                    start: int = 0, reasons: Optional[List[str]] = None,
+                    reask: Optional[Callable[[Any, OutputParserException], Awaitable]] = None):
+    """Async twin of `_cascade`; `start` and `reasons` resume a cascade whose first tiers already ran."""
+    tiers = model_tiers.tiers_for(stage)
+    reasons = reasons if reasons is not None else []
+    for position in range(start, len(tiers)):
+        tier, last = tiers[position], position == len(tiers) - 1
+        try:
+            result = await ainvoke(model_tiers.model(tier))
+            reason = check(result) if check else None
+        except ESCALATING_ERRORS as e:
+            if not last:
+                reason = _escalation_reason(e)
+            elif _can_reask(e, reask):
+                result = await _areask(stage, tier, reask, e)
+                reason = check(result) if check else None
+            else:
+                raise
+        if _accept(stage, tier, reason, reasons, last):
+            return result
+
+async def _abatch_cascade(stage: str, make_chain: Callable[[Any], Any], inputs: List[dict],
+                          checks: Optional[List[Callable[[Any], Optional[str]]]] = None,
+                          max_concurrency: int = BATCH_MAX_CONCURRENCY) -> list:
+    """
+    Batch twin of `_acascade`: the first tier runs as one `abatch` and only the items it got
+    wrong escalate, one by one. `make_chain(model, error=None)` builds the stage chain (the
+    re-ask variant when given an error). Failures come back as exception objects.
+    """
+    tiers = model_tiers.tiers_for(stage)
+    outputs = await make_chain(model_tiers.model(tiers[0])).abatch(
+        inputs, config={"max_concurrency": max_concurrency}, return_exceptions=True
+    )
+
+    async def settle(i: int, output):
+        check = checks[i] if checks else None
+        reask = lambda model, error: make_chain(model, error).ainvoke(inputs[i])
+        try:
+            try:
+                if isinstance(output, Exception):
+                    raise output
+                reason = check(output) if check else None
+            except ESCALATING_ERRORS as e:
+                if len(tiers) > 1:
+                    reason = _escalation_reason(e)
+                elif _can_reask(e, reask):
+                    output = await _areask(stage, tiers[0], reask, e)
+                    reason = check(output) if check else None
+                else:
+                    raise
+        except Exception as e:
+            return e
+        reasons = []
+        if _accept(stage, tiers[0], reason, reasons, last=len(tiers) == 1):
+            return output
+        try:
+            return await _acascade(
+                stage, lambda model: make_chain(model).ainvoke(inputs[i]), check, start=1, reasons=reasons, reask=reask
+            )
+        except Exception as e:
+            return e
+
+    return list(await asyncio.gather(*(settle(i, output) for i, output in enumerate(outputs))))
+
 # --- Node 3a: Tool Selector ---
 class ToolSelector(BaseModel):
     # --- NEW: Expect a list of tool names ---
@@ -51,126 +264,493 @@ tool_selector_prompt = ChatPromptTemplate.from_template(
     template=SCALABLE_TOOL_SELECTOR_PROMPT,
     partial_variables={"format_instructions": tool_selector_parser.get_format_instructions()}
 )
-tool_selector_chain = tool_selector_prompt | llm | tool_selector_parser
+
+def _repair_selection(result: ToolSelector, fixes: List[str]) -> ToolSelector:
+    """Snaps the selected names to registered tools and drops unknown and repeated ones."""
+    return ToolSelector(tools=output_repairer.repair_tool_names(result.tools, tool_registry.names(), fixes))
+
+def _selector_chain(model, error: Optional[OutputParserException] = None):
+    return _reask_prompt(tool_selector_prompt, error) | model | output_repairer.parser("selection", ToolSelector, _repair_selection)
+
+def _selection_check(retrieved_tool_names: List[str]) -> Callable[[ToolSelector], Optional[str]]:
+    """A selection naming a tool the retriever didn't offer is escalated to the next tier."""
+    allowed = set(retrieved_tool_names)
+    return lambda result: None if set(result.tools) <= allowed else "outside_retrieved"
+
+def _format_retrieved_tools(retrieved_docs) -> tuple:
+    """Maps retrieved docs back to tool names (stored in their metadata) and renders them for the selector prompt."""
+    # A tool removed from the registry may still be in a saved index until it is reloaded
+    retrieved_tool_names = [doc.metadata["tool_name"] for doc in retrieved_docs if doc.metadata.get("tool_name") in tool_registry]
+    formatted_tools = "".join(f"- **{name}**: {tool_registry.get(name).description}\n" for name in retrieved_tool_names)
+    return retrieved_tool_names, formatted_tools
+
+def _retriever_k(state: GraphState) -> int:
+    return state.get("retriever_k") or RETRIEVER_K
+
+async def _aembed_and_retrieve(student_message: str, k: int = RETRIEVER_K) -> tuple:
+    """Embeds the message once and returns (embedding, retrieved docs, L2 distances) for the async nodes."""
+    with span("retrieval"):
+        # The first call may load the index from disk, so keep it off the event loop
+        vector_store = await asyncio.to_thread(load_index)
+        query_embedding = await embeddings.aembed_query(student_message)
+        docs_and_scores = await vector_store.asimilarity_search_with_score_by_vector(query_embedding, k=k)
+    return query_embedding, [doc for doc, _ in docs_and_scores], [score for _, score in docs_and_scores]
+
+_shadow_tasks = set()
+
+async def _shadow_check_fast_path(selector_inputs: dict, fast_tools: List[str], retrieved_tool_names: List[str]):
+    """Re-runs the selector LLM on a sampled fast-path turn to measure the fast path's accuracy."""
+    try:
+        result = await _acascade(
+            "selection", lambda model: _selector_chain(model).ainvoke(selector_inputs), _selection_check(retrieved_tool_names),
+            reask=lambda model, error: _selector_chain(model, error).ainvoke(selector_inputs),
+        )
+        fast_path_router.record_outcome("fast", fast_tools, result.tools)
+    except Exception as e:
+        logger.warning("Fast-path shadow check failed: %s", e)
+
+def _try_fast_path(state: GraphState, retrieved_tool_names: List[str], distances: List[float], formatted_tools: str) -> Optional[List[str]]:
+    """Returns the locally routed tool list when confident, else None (and the LLM path is taken)."""
+    if depends_on_history(state["student_message"], state["chat_history"]):
+        return None
+    fast_tools = fast_path_router.route(state["student_message"], retrieved_tool_names, distances)
+    if fast_tools is None:
+        return None
+    fast_path_router.record_path("fast")
+    if random.random() < FAST_PATH_SHADOW_RATE:
+        task = asyncio.create_task(_shadow_check_fast_path(
+            {"student_message": state["student_message"], **_history_inputs(state), "tools": formatted_tools},
+            fast_tools, retrieved_tool_names,
+        ))
+        _shadow_tasks.add(task)
+        task.add_done_callback(_shadow_tasks.discard)
+    return fast_tools
 
 def select_tools_node(state: GraphState) -> GraphState:
-    print("\n--- 🧠 NODE: SELECTING TOOL(S) ---")
-    student_message = state["student_message"]
-    if not retriever: raise ValueError("Retriever not initialized.")
-    
-    retrieved_docs = retriever.invoke(student_message)
-    retrieved_tool_names = [list(TOOL_REGISTRY.keys())[list(TOOL_REGISTRY.values()).index(doc.page_content)] for doc in retrieved_docs]
-    formatted_tools = "".join(f"- **{name}**: {TOOL_REGISTRY[name]}\n" for name in retrieved_tool_names)
-    
-    print(f"Top {len(retrieved_tool_names)} relevant tools found: {retrieved_tool_names}")
-    
-    # The chain now returns an object with a 'tools' list
-    selected_tools_result = tool_selector_chain.invoke({
-        "student_message": state["student_message"], "chat_history": state["chat_history"], "tools": formatted_tools
-    })
-    
-    state["selected_tools"] = selected_tools_result.tools
-    print(f"Tool(s) selected by LLM: {state['selected_tools']}")
+    logger.debug("NODE: selecting tool(s)")
+    with span("selection", path="llm") as trace:
+        student_message = state["student_message"]
+        retriever = get_retriever(_retriever_k(state))
+
+        with span("retrieval"):
+            retrieved_docs = retriever.invoke(student_message)
+        retrieved_tool_names, formatted_tools = _format_retrieved_tools(retrieved_docs)
+
+        logger.debug("Top %d relevant tools found: %s", len(retrieved_tool_names), retrieved_tool_names)
+
+        # The chain now returns an object with a 'tools' list
+        selector_inputs = {"student_message": state["student_message"], **_history_inputs(state), "tools": formatted_tools}
+        selected_tools_result = _cascade(
+            "selection", lambda model: _selector_chain(model).invoke(selector_inputs), _selection_check(retrieved_tool_names),
+            reask=lambda model, error: _selector_chain(model, error).invoke(selector_inputs),
+        )
+
+        state["selected_tools"] = trace["tools"] = selected_tools_result.tools
+        state["selection_path"] = "llm"
+    logger.info("Tool(s) selected by LLM: %s", state["selected_tools"])
+    return state
+
+async def aselect_tools_node(state: GraphState) -> GraphState:
+    """Async twin of `select_tools_node`; awaits the retriever and the selector chain so the event loop stays free."""
+    logger.debug("NODE: selecting tool(s) (async)")
+    with span("selection") as trace:
+        selected_tools, path = await _aselect_tools(state)
+        state["selected_tools"] = trace["tools"] = selected_tools
+        state["selection_path"] = trace["path"] = path
+    logger.info("Tool(s) selected by %s: %s", path, selected_tools)
     return state
 
+async def _aselect_tools(state: GraphState) -> tuple:
+    """Returns (selected tools, path), where path is "cache", "fast" or "llm"."""
+    student_message = state["student_message"]
+    # Embed once: the same vector serves the semantic cache and the FAISS search
+    query_embedding, retrieved_docs, distances = await _aembed_and_retrieve(student_message, _retriever_k(state))
+
+    use_cache = not selection_cache.should_bypass(student_message, state["chat_history"])
+    if use_cache:
+        cached_tools = selection_cache.lookup(query_embedding)
+        if cached_tools is not None:
+            return cached_tools, "cache"
+    else:
+        selection_cache.record_bypass()
+
+    retrieved_tool_names, formatted_tools = _format_retrieved_tools(retrieved_docs)
+
+    logger.debug("Top %d relevant tools found: %s", len(retrieved_tool_names), retrieved_tool_names)
+
+    # Unambiguous requests are routed locally and skip the selector LLM entirely
+    fast_tools = _try_fast_path(state, retrieved_tool_names, distances, formatted_tools)
+    if fast_tools is not None:
+        return fast_tools, "fast"
+
+    # Start on the likely tool's parameters while the selector decides
+    top_tool = retrieved_docs[0].metadata.get("tool_name") if retrieved_docs else None
+    speculative = speculation_tracker.start(
+        top_tool if top_tool in tool_registry else None, distances[0] if distances else None,
+        lambda run: _speculate(state, run),
+    )
+    selector_inputs = {"student_message": state["student_message"], **_history_inputs(state), "tools": formatted_tools}
+    try:
+        selected_tools_result = await _acascade(
+            "selection", lambda model: _selector_chain(model).ainvoke(selector_inputs), _selection_check(retrieved_tool_names),
+            reask=lambda model, error: _selector_chain(model, error).ainvoke(selector_inputs),
+        )
+    except BaseException:
+        speculation_tracker.discard(speculative)
+        raise
+    fast_path_router.record_path("llm")
+    state["speculation"] = speculation_tracker.confirm(speculative, selected_tools_result.tools)
+
+    if use_cache:
+        selection_cache.store(query_embedding, selected_tools_result.tools)
+    return selected_tools_result.tools, "llm"
+
+# A cached selection may name a removed tool or miss a better new one
+tool_registry.add_listener(lambda event, spec: selection_cache.clear())
+
 # --- Node 3b: Parameter Extractor (Now takes a specific tool as input) ---
-tool_schema_router = {
-    "NoteMaker": NoteMakerInput, "Flashcards": FlashcardGeneratorInput, "ConceptExplainer": ConceptExplainerInput,
-    "QuizGenerator": FlashcardGeneratorInput, "AnalogyCreator": ConceptExplainerInput,
-}
+# Each tool's input schema comes from its ToolSpec (see tool_registry.py)
 parameter_extractor_prompt = ChatPromptTemplate.from_template(PARAMETER_EXTRACTOR_PROMPT)
 
-def extract_parameters_for_tool(state: GraphState, tool_name: str) -> dict:
-    print(f"\n--- 🧠 NODE: EXTRACTING PARAMETERS for {tool_name} ---")
-    output_schema = tool_schema_router.get(tool_name)
+UPSTREAM_CONTEXT_MAX_CHARS = 1500
+
+def _extraction_inputs(state: GraphState, upstream_results: Optional[List[dict]] = None) -> dict:
+    """Prompt inputs for the parameter extractor, including results of tools this one depends on."""
+    upstream = "\n\n".join(_format_tool_response(result)[:UPSTREAM_CONTEXT_MAX_CHARS] for result in upstream_results or [])
+    return {
+        "student_message": state["student_message"], **_history_inputs(state),
+        "user_info": state["user_info"], "upstream_results": upstream or "(none)",
+    }
+
+def _extraction_chain(model, output_schema, error: Optional[OutputParserException] = None):
+    # `include_raw` keeps the model's answer, so an answer the schema rejects can still be repaired
+    return (
+        _reask_prompt(parameter_extractor_prompt, error)
+        | model.with_structured_output(output_schema, include_raw=True)
+        | output_repairer.parser("extraction", output_schema)
+    )
+
+def _extraction_check(output_schema) -> Callable[[Any], Optional[str]]:
+    """Escalates when the model returned nothing or parameters its tool's schema rejects."""
+    def check(result) -> Optional[str]:
+        if result is None:
+            return "no_output"
+        output_schema.model_validate(result.model_dump() if isinstance(result, BaseModel) else result)
+        return None
+    return check
+
+def _as_parameters(result) -> dict:
+    return result.model_dump() if isinstance(result, BaseModel) else dict(result)
+
+def extract_parameters_for_tool(state: GraphState, tool_name: str, upstream_results: Optional[List[dict]] = None) -> dict:
+    logger.debug("NODE: extracting parameters for %s", tool_name)
+    output_schema = tool_registry.get_schema(tool_name)
     if not output_schema: raise ValueError(f"No schema defined for tool: {tool_name}")
         
-    extraction_chain = parameter_extractor_prompt | llm.with_structured_output(output_schema)
+    inputs = _extraction_inputs(state, upstream_results)
+    with span("extraction", tool=tool_name):
+        extracted_params = _cascade(
+            "extraction", lambda model: _extraction_chain(model, output_schema).invoke(inputs), _extraction_check(output_schema),
+            reask=lambda model, error: _extraction_chain(model, output_schema, error).invoke(inputs),
+        )
     
-    extracted_params = extraction_chain.invoke({
-        "student_message": state["student_message"], "chat_history": state["chat_history"], "user_info": state["user_info"]
-    })
-    
-    print(f"Extracted parameters: {extracted_params.model_dump()}")
-    return extracted_params.model_dump()
+    logger.debug("Extracted parameters for %s: %s", tool_name, _as_parameters(extracted_params))
+    return _as_parameters(extracted_params)
+
+async def _speculate(state: GraphState, run: SpeculativeRun) -> tuple:
+    """Extracts (and, if allowed, calls) the speculated tool; returns (parameters, response or None)."""
+    parameters = await aextract_parameters_for_tool(state, run.tool_name)
+    run.extracted_at = time.perf_counter()
+    if not run.call_tool:
+        return parameters, None
+    run.call_started_at = time.perf_counter()
+    response = await cached_call_tool_api(run.tool_name, parameters)
+    run.called_at = time.perf_counter()
+    return parameters, response
+
+async def aclaim_speculation(state: GraphState, tool_name: str) -> Optional[tuple]:
+    """(parameters, response or None) from the turn's confirmed speculative run for this tool, or None."""
+    run = state.get("speculation")
+    if run is None or run.tool_name != tool_name:
+        return None
+    state["speculation"] = None
+    try:
+        return await run.task
+    except Exception as e:
+        speculation_tracker.record_failure(run, e)
+        return None
+
+async def aextract_parameters_for_tool(state: GraphState, tool_name: str, upstream_results: Optional[List[dict]] = None) -> dict:
+    """Async twin of `extract_parameters_for_tool`, so several tools can be extracted concurrently."""
+    logger.debug("NODE: extracting parameters for %s (async)", tool_name)
+    output_schema = tool_registry.get_schema(tool_name)
+    if not output_schema: raise ValueError(f"No schema defined for tool: {tool_name}")
+
+    inputs = _extraction_inputs(state, upstream_results)
+    with span("extraction", tool=tool_name):
+        extracted_params = await _acascade(
+            "extraction", lambda model: _extraction_chain(model, output_schema).ainvoke(inputs), _extraction_check(output_schema),
+            reask=lambda model, error: _extraction_chain(model, output_schema, error).ainvoke(inputs),
+        )
+
+    logger.debug("Extracted parameters for %s: %s", tool_name, _as_parameters(extracted_params))
+    return _as_parameters(extracted_params)
     
+# --- Node 3b (planner mode): Fused Selection + Extraction ---
+class PlannedToolCall(BaseModel):
+    tool: str = Field(..., description="The tool name, exactly as listed.")
+    parameters: Dict[str, Any] = Field(..., description="The tool's input parameters, valid against its parameter schema.")
+
+class ToolPlan(BaseModel):
+    tools: List[PlannedToolCall] = Field(..., description="The tools to use, in the correct sequence, each with its parameters.")
+
+tool_planner_parser = PydanticOutputParser(pydantic_object=ToolPlan)
+tool_planner_prompt = ChatPromptTemplate.from_template(
+    template=TOOL_PLANNER_PROMPT,
+    partial_variables={"format_instructions": tool_planner_parser.get_format_instructions()}
+)
+
+def _repair_plan(plan: ToolPlan, fixes: List[str]) -> ToolPlan:
+    """Snaps each call to a registered tool, drops unknown and repeated tools, and repairs each call's parameters."""
+    calls = []
+    for call in plan.tools:
+        tool = output_repairer.snap(call.tool, tool_registry.names())
+        if tool is None:
+            fixes.append("dropped_tool")
+            continue
+        if tool != call.tool:
+            fixes.append("snapped_tool")
+        if any(planned.tool == tool for planned in calls):
+            fixes.append("duplicate_tool")
+            continue
+        parameters = output_repairer.repair_fields(tool_registry.get_schema(tool), call.parameters, fixes)
+        calls.append(PlannedToolCall(tool=tool, parameters=parameters.model_dump()))
+    if plan.tools and not calls:
+        raise ValueError(f"None of the planned tools are registered: {[call.tool for call in plan.tools]}")
+    return ToolPlan(tools=calls)
+
+def _planner_chain(model, error: Optional[OutputParserException] = None):
+    return _reask_prompt(tool_planner_prompt, error) | model | output_repairer.parser("planning", ToolPlan, _repair_plan)
+
+def _plan_check(plan: ToolPlan) -> Optional[str]:
+    for call in plan.tools:
+        output_schema = tool_registry.get_schema(call.tool)
+        if not output_schema:
+            return "unknown_tool"
+        output_schema.model_validate(call.parameters)
+    return None
+
+def _format_tools_with_schemas(tool_names: List[str]) -> str:
+    formatted = ""
+    for name in tool_names:
+        schema = tool_registry.get_schema(name)
+        if schema:
+            formatted += f"- **{name}**: {tool_registry.get(name).description}\n  Parameter schema: {json.dumps(schema.model_json_schema()['properties'])}\n"
+    return formatted
+
+async def aplan_tools_node(state: GraphState) -> Optional[GraphState]:
+    """
+    Selects the tools and extracts every tool's parameters in one LLM call.
+    Returns None when the plan can't be parsed or validated, so the caller can fall back
+    to the two-phase select -> extract path.
+    """
+    logger.debug("NODE: planning tool(s) + parameters")
+    _, retrieved_docs, _ = await _aembed_and_retrieve(state["student_message"], _retriever_k(state))
+    retrieved_tool_names, _ = _format_retrieved_tools(retrieved_docs)
+
+    try:
+        planner_inputs = {
+            "student_message": state["student_message"], **_history_inputs(state),
+            "user_info": state["user_info"], "tools": _format_tools_with_schemas(retrieved_tool_names),
+        }
+        with span("planning"):
+            plan = await _acascade(
+                "planning", lambda model: _planner_chain(model).ainvoke(planner_inputs), _plan_check,
+                reask=lambda model, error: _planner_chain(model, error).ainvoke(planner_inputs),
+            )
+        tool_parameters = {}
+        for call in plan.tools:
+            output_schema = tool_registry.get_schema(call.tool)
+            if not output_schema:
+                raise ValueError(f"Planner chose a tool with no schema: {call.tool}")
+            tool_parameters[call.tool] = output_schema.model_validate(call.parameters).model_dump()
+    except (OutputParserException, ValidationError, ValueError) as e:
+        logger.warning("Planner output rejected, falling back to two-phase path: %s", e)
+        return None
+
+    state["selected_tools"] = [call.tool for call in plan.tools]
+    state["tool_parameters"] = tool_parameters
+    logger.info("Tool(s) planned by LLM: %s", state["selected_tools"])
+    return state
+
 # --- Node 3c: Tool Orchestrator (Now takes a specific tool and its params) ---
 async def call_tool_api(tool_name: str, parameters: dict) -> dict:
-    print(f"\n--- ⚙️ NODE: ORCHESTRATING TOOL CALL for {tool_name} ---")
-    endpoint_path = TOOL_API_ENDPOINTS.get(tool_name)
+    logger.debug("NODE: orchestrating tool call for %s", tool_name)
+    endpoint_path = tool_registry.get_endpoint(tool_name)
     if not endpoint_path: raise ValueError(f"No API endpoint defined for tool: {tool_name}")
     
-    full_url = f"{BASE_API_URL}{endpoint_path}"
-    print(f"Calling API at {full_url}...")
+    full_url = get_tool_url(tool_name, endpoint_path)
     
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(full_url, json=parameters, timeout=30.0)
-        response.raise_for_status() 
-        api_response = response.json()
-        print("API call successful.")
-        # --- NEW: Add the tool name to the response for the normalizer ---
-        api_response["_tool_name_"] = tool_name 
-        return api_response
-    except httpx.RequestError as e:
-        print(f"API call failed: {e}")
-        return {"error": str(e), "_tool_name_": tool_name}
+    with span("tool_call", tool=tool_name) as trace:
+        try:
+            # Reuses the shared keep-alive pool, behind the tool's breaker, retry budget and hedging
+            response = await get_resilience(tool_name).call(
+                lambda: post_json(full_url, parameters, timeout=get_tool_timeout(tool_name))
+            )
+            response.raise_for_status() 
+            api_response = response.json()
+            trace["http_status"] = response.status_code
+            # --- NEW: Add the tool name to the response for the normalizer ---
+            api_response["_tool_name_"] = tool_name 
+            return api_response
+        except (httpx.RequestError, httpx.HTTPStatusError, RetryableStatusError, CircuitOpenError) as e:
+            # Every downstream failure becomes the formatter's error text instead of a 500 for the whole turn
+            trace["error"] = type(e).__name__
+            logger.warning("API call to %s failed: %s", full_url, e)
+            return {"error": str(e), "_tool_name_": tool_name}
+
+async def cached_call_tool_api(tool_name: str, parameters: dict) -> dict:
+    """`call_tool_api` behind the single-flight result cache (see tool_cache.py)."""
+    return await tool_result_cache.call(tool_name, parameters, call_tool_api)
+
+# --- Batch Variants (used by /chat/batch) ---
+# One embedding request for every message, one vectorized FAISS search, and LangChain
+# `abatch` with a concurrency cap for the LLM stages. Failures are returned per item
+# as exception objects so one bad item never fails the whole batch.
+
+def _search_by_vectors(vector_store, query_embeddings: List[List[float]], ks: List[int]) -> List[tuple]:
+    """
+    Runs every query through the FAISS index in a single vectorized search (at the largest
+    requested depth) and returns (docs, distances) per query, cut to that query's own k.
+    """
+    distances, indices = vector_store.index.search(np.asarray(query_embeddings, dtype=np.float32), max(ks))
+    return [
+        (
+            [vector_store.docstore.search(vector_store.index_to_docstore_id[j]) for j in row[:k] if j != -1],
+            [float(distance) for distance, j in zip(row_distances[:k], row[:k]) if j != -1],
+        )
+        for row, row_distances, k in zip(indices, distances, ks)
+    ]
+
+async def abatch_select_tools(states: List[GraphState], max_concurrency: int = BATCH_MAX_CONCURRENCY) -> list:
+    """Selects tools for many states at once. Each result is the updated state or an Exception."""
+    logger.debug("NODE: selecting tool(s) for a batch of %d", len(states))
+    with span("retrieval", batch_size=len(states)):
+        vector_store = await asyncio.to_thread(load_index)
+        query_embeddings = await embeddings.aembed_documents([state["student_message"] for state in states])
+
+    results = [None] * len(states)
+    to_search = []
+    for i, (state, query_embedding) in enumerate(zip(states, query_embeddings)):
+        if selection_cache.should_bypass(state["student_message"], state["chat_history"]):
+            selection_cache.record_bypass()
+            to_search.append((i, False))
+            continue
+        cached_tools = selection_cache.lookup(query_embedding)
+        if cached_tools is not None:
+            state["selected_tools"] = cached_tools
+            results[i] = state
+        else:
+            to_search.append((i, True))
+
+    if not to_search:
+        return results
+
+    with span("retrieval", batch_size=len(to_search)):
+        retrieved = await asyncio.to_thread(
+            _search_by_vectors, vector_store, [query_embeddings[i] for i, _ in to_search],
+            [_retriever_k(states[i]) for i, _ in to_search]
+        )
+    inputs, checks, to_select = [], [], []
+    for (i, use_cache), (retrieved_docs, distances) in zip(to_search, retrieved):
+        retrieved_tool_names, formatted_tools = _format_retrieved_tools(retrieved_docs)
+        fast_tools = _try_fast_path(states[i], retrieved_tool_names, distances, formatted_tools)
+        if fast_tools is not None:
+            states[i]["selected_tools"] = fast_tools
+            results[i] = states[i]
+            continue
+        inputs.append({"student_message": states[i]["student_message"], **_history_inputs(states[i]), "tools": formatted_tools})
+        checks.append(_selection_check(retrieved_tool_names))
+        to_select.append((i, use_cache))
+
+    with span("selection", path="llm", batch_size=len(inputs)):
+        outputs = await _abatch_cascade("selection", _selector_chain, inputs, checks, max_concurrency) if inputs else []
+    for (i, use_cache), output in zip(to_select, outputs):
+        if isinstance(output, Exception):
+            results[i] = output
+            continue
+        fast_path_router.record_path("llm")
+        states[i]["selected_tools"] = output.tools
+        if use_cache:
+            selection_cache.store(query_embeddings[i], output.tools)
+        results[i] = states[i]
+    return results
+
+async def abatch_extract_parameters(requests: List[tuple], max_concurrency: int = BATCH_MAX_CONCURRENCY) -> list:
+    """
+    Extracts parameters for many (state, tool_name) pairs. Pairs are grouped per tool so each
+    group runs as one `abatch` over that tool's structured-output chain. Each result is a
+    parameter dict or an Exception.
+    """
+    logger.debug("NODE: extracting parameters for a batch of %d", len(requests))
+    results = [None] * len(requests)
+    indices_by_tool = defaultdict(list)
+    for i, (state, tool_name) in enumerate(requests):
+        if tool_registry.get_schema(tool_name) is not None:
+            indices_by_tool[tool_name].append(i)
+        else:
+            results[i] = ValueError(f"No schema defined for tool: {tool_name}")
+
+    async def run_group(tool_name: str, indices: List[int]):
+        output_schema = tool_registry.get_schema(tool_name)
+        inputs = [_extraction_inputs(requests[i][0]) for i in indices]
+        with span("extraction", tool=tool_name, batch_size=len(inputs)):
+            outputs = await _abatch_cascade(
+                "extraction", lambda model, error=None: _extraction_chain(model, output_schema, error), inputs,
+                [_extraction_check(output_schema)] * len(inputs), max_concurrency,
+            )
+        for i, output in zip(indices, outputs):
+            results[i] = output if isinstance(output, Exception) else _as_parameters(output)
+
+    await asyncio.gather(*(run_group(tool_name, indices) for tool_name, indices in indices_by_tool.items()))
+    return results
+
+# --- Conversation Summarizer (runs after the turn, off the critical path) ---
+history_summary_prompt = ChatPromptTemplate.from_template(HISTORY_SUMMARY_PROMPT)
+
+def _summary_chain(model):
+    return history_summary_prompt | model | StrOutputParser()
+
+async def asummarize_history(summary: str, new_messages: List[dict]) -> str:
+    """Folds `new_messages` into the existing summary instead of re-summarizing the whole history."""
+    logger.debug("NODE: summarizing %d older message(s)", len(new_messages))
+    with span("summarization"):
+        summary_inputs = {
+            "summary": summary or "(no summary yet)",
+            "messages": format_messages_for_summary(new_messages),
+            "max_words": CONTEXT_SUMMARY_MAX_WORDS,
+        }
+        updated = await _acascade("summarization", lambda model: _summary_chain(model).ainvoke(summary_inputs))
+    return updated.strip()
 
 # --- Node 3d: Response Normalizer (Now handles a list of responses) ---
+SECTION_SEPARATOR = "\n\n---\n\n"
+
+def _format_tool_response(response: dict) -> str:
+    """Formats a single tool's response; also used to stream each section as soon as it's ready."""
+    tool_name = response.get("_tool_name_")
+    if response.get("_timed_out_"):
+        return f"⏱️ **{tool_name}** took too long and was skipped this time, so this answer is partial. Ask again to retry it."
+    formatter = tool_registry.get_formatter(tool_name)
+    if formatter:
+        return formatter(response)
+    return f"Received a response from an unknown tool: {tool_name}"
+
 def _format_combined_response(responses: List[dict]) -> str:
     if not responses: return "I'm not sure how to help with that. Could you please rephrase your request?"
     
-    formatted_responses = []
-    for response in responses:
-        tool_name = response.get("_tool_name_")
-        formatter = RESPONSE_FORMATTERS.get(tool_name)
-        if formatter:
-            formatted_responses.append(formatter(response))
-        else:
-            formatted_responses.append(f"Received a response from an unknown tool: {tool_name}")
+    with span("normalization", tools=len(responses)):
+        formatted_responses = [_format_tool_response(response) for response in responses]
             
     # Combine all formatted strings with a clear separator
-    return "\n\n---\n\n".join(formatted_responses)
-
-def _format_notemaker_response(response: dict) -> str:
-    """Formats the NoteMaker JSON into a readable string."""
-    if "error" in response:
-        return "Sorry, I encountered an error while creating your notes."
-    title = response.get('title', 'your notes')
-    summary = response.get('summary', 'Here are the notes I created:')
-    sections_str = ""
-    for section in response.get('note_sections', []):
-        key_points = "\n".join(f"  - {point}" for point in section.get('key_points', []))
-        sections_str += f"\n\n### {section.get('title', 'Section')}\n{section.get('content', '')}\n**Key Points:**\n{key_points}"
-    return f"Great! I've prepared a summary for you on **{response.get('topic', 'your topic')}**.\n\n## {title}\n\n**Summary:** {summary}{sections_str}"
-
-def _format_flashcards_response(response: dict) -> str:
-    """Formats the Flashcard Generator JSON into a detailed, readable string."""
-    if "error" in response:
-        return "Sorry, I had trouble creating the flashcards."
-    flashcards = response.get('flashcards', [])
-    topic = response.get('topic', 'your topic')
-    if not flashcards:
-        return f"I couldn't generate any flashcards for **{topic}**. Please try another topic."
-    intro = f"Additionally, I've created {len(flashcards)} flashcards for you on **{topic}**. Here are the details:\n"
-    flashcard_details = []
-    for i, card in enumerate(flashcards):
-        question = card.get('question', 'No question provided.')
-        answer = card.get('answer', 'No answer provided.')
-        card_str = f"\n--- Card #{i+1} ---\n**Question:** {question}\n**Answer:** {answer}"
-        flashcard_details.append(card_str)
-    return intro + "\n".join(flashcard_details)
-
-def _format_conceptexplainer_response(response: dict) -> str:
-    """Formats the Concept Explainer JSON into a readable string."""
-    if "error" in response:
-        return "Sorry, I couldn't find a good explanation for that concept right now."
-    explanation = response.get('explanation', 'Here is the explanation you requested.')
-    return f"Of course! Here is an explanation of the concept:\n\n{explanation}"
-
-RESPONSE_FORMATTERS = {
-    "NoteMaker": _format_notemaker_response, "Flashcards": _format_flashcards_response,
-    "ConceptExplainer": _format_conceptexplainer_response, "QuizGenerator": _format_flashcards_response,
-    "AnalogyCreator": _format_conceptexplainer_response,
-}
-
+    return SECTION_SEPARATOR.join(formatted_responses)
@@ -1,8 +1,193 @@
+import os
 
 # --- API Configuration ---
-BASE_API_URL = "http://127.0.0.1:8000/tools"
+# The tools are served by this app, so the URL follows the port it listens on (app/serve.py
+# sets ORCHESTRATOR_PORT from --port); BASE_API_URL overrides it outright.
+ORCHESTRATOR_PORT = int(os.getenv("ORCHESTRATOR_PORT", "8000"))
+BASE_API_URL = os.getenv("BASE_API_URL", f"http://127.0.0.1:{ORCHESTRATOR_PORT}/tools")
+
+# --- Shared HTTP Client (created once in the FastAPI lifespan) ---
+HTTP_MAX_CONNECTIONS = 100            # Total sockets the pool may open
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 20   # Idle sockets kept warm between tool calls
+HTTP_KEEPALIVE_EXPIRY = 30.0          # Seconds an idle socket is kept before closing
+HTTP_ENABLE_HTTP2 = False             # Requires the optional `h2` package
+DEFAULT_TOOL_TIMEOUT = 30.0           # Seconds, used when a tool has no entry in TOOL_TIMEOUTS
+
+# Per-tool overrides. Tools missing here use BASE_API_URL / DEFAULT_TOOL_TIMEOUT.
+TOOL_BASE_URLS = {
+    # "NoteMaker": "http://notemaker.internal:8000/tools",
+}
+TOOL_TIMEOUTS = {
+    "NoteMaker": 30.0,
+    "Flashcards": 30.0,
+    "ConceptExplainer": 20.0,
+}
+
+# --- Tool Call Resilience (per TOOL_API_ENDPOINTS entry) ---
+TOOL_MAX_ATTEMPTS = 3                 # First try + retries, for connection errors and HTTP 5xx
+RETRY_BASE_DELAY = 0.2                # Seconds; exponential backoff with full jitter
+RETRY_MAX_DELAY = 2.0
+RETRY_BUDGET_RATIO = 0.2              # Retries + hedges may add at most ~20% extra load per tool
+RETRY_BUDGET_MAX_TOKENS = 10.0
+BREAKER_FAILURE_THRESHOLD = 5         # Consecutive failures before the breaker opens
+BREAKER_RESET_SECONDS = 15.0          # Time open before a single half-open probe is allowed
+# Tools safe to call twice; they get a hedged second request after their p95 latency.
+HEDGE_IDEMPOTENT_TOOLS = {"NoteMaker", "Flashcards", "ConceptExplainer", "QuizGenerator", "AnalogyCreator"}
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 20                # No hedging until the tool has this many latency samples
+
+# --- Downstream Tool-Result Cache ---
+# Identical (tool, parameters) calls share one in-flight request and, once finished,
+# a cached result for the tool's TTL. Caching is opt-in: a tool with no entry (or a TTL
+# of 0) is always called. Only list tools whose output is fully determined by their
+# parameters; generative tools (quizzes, flashcards) should give fresh results when asked again.
+TOOL_RESULT_CACHE_MAX_ENTRIES = 512
+TOOL_RESULT_TTLS = {
+    # "SomeDeterministicTool": 600.0,  # Seconds
+}
+
+# --- Conversation Context Budget ---
+CONTEXT_TOKEN_BUDGET = 1500           # Max estimated tokens for summary + recent history in a prompt
+CONTEXT_RECENT_TURNS = 3              # User/assistant turns kept verbatim; older ones go into the summary
+CONTEXT_MAX_MESSAGE_CHARS = 800       # Longer messages (e.g. flashcard dumps) are truncated in prompts
+CONTEXT_SUMMARY_MAX_WORDS = 150
+
+# --- Student State Store ---
+# "memory" is per process; with several workers (app/serve.py) use "sqlite", which they share
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")  # "memory" or "sqlite"
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "student_state.db"))
+
+# --- Tool Execution Scheduler ---
+# A tool waits for the tools it depends on (when both were selected, and the dependency
+# comes earlier in the selected sequence) and receives their results as extra context.
+# Everything else runs concurrently.
+TOOL_DEPENDENCIES = {
+    "QuizGenerator": ["NoteMaker"],   # Quiz the student on the notes just created
+}
+TURN_LATENCY_BUDGET_SECONDS = 25.0    # Whole-turn budget for tool execution, split along each tool's dependency chain
+
+# --- Workflow Graph (see workflow.py) ---
+# Checkpointer for the compiled turn graph: "memory" (per process), "sqlite" (shared by
+# every worker; needs the optional `langgraph-checkpoint-sqlite` package) or "none".
+# A turn whose tools timed out keeps its checkpoint, so /chat/resume can finish it
+# without redoing selection or the completed tools.
+GRAPH_CHECKPOINTER = os.getenv("GRAPH_CHECKPOINTER", "memory")
+GRAPH_CHECKPOINT_DB_PATH = os.getenv("GRAPH_CHECKPOINT_DB_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "graph_checkpoints.db"))
+GRAPH_RESUMABLE_TURNS = 1000          # Interrupted turns kept for resume (per process); older checkpoints are deleted
+
+# --- Admission Control & LLM Rate Limit ---
+# A turn needs one of ADMISSION_MAX_CONCURRENT_TURNS slots. Up to ADMISSION_MAX_QUEUE turns
+# wait for one (first come, first served); beyond that, or after waiting too long, the
+# request is shed with 429 and a Retry-After estimate. A student's own turns run one at a
+# time; waiting behind an earlier one counts toward the same timeout.
+ADMISSION_MAX_CONCURRENT_TURNS = 32
+ADMISSION_MAX_QUEUE = 64
+ADMISSION_QUEUE_TIMEOUT_SECONDS = 10.0
+USER_MAX_PENDING_TURNS = 2            # One running plus one waiting per student; more get 429
+# Token bucket shared by every LLM call in this process (0 disables it). Set it to the
+# provider quota divided by the number of workers.
+LLM_REQUESTS_PER_SECOND = float(os.getenv("LLM_REQUESTS_PER_SECOND", "10"))
+LLM_BURST = 20
+ADMISSION_MAX_LLM_BACKLOG_SECONDS = 15.0  # Shed new turns once queued LLM calls would wait this long
+
+# --- Batch Chat (/chat/batch) ---
+BATCH_MAX_ITEMS = 500
+BATCH_MAX_CONCURRENCY = 16            # Concurrent LLM calls per batched stage
+
+# --- Tool Retrieval Index ---
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# "remote": the HuggingFace inference endpoint (one network round trip per message).
+# "onnx": EMBEDDING_MODEL run in-process on CPU from a local export of the model
+# (tokenizer.json plus EMBEDDING_ONNX_FILE, e.g. the repo's quantized onnx/ variants).
+# Requires the optional `onnxruntime` package.
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "remote")
+EMBEDDING_MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models", "all-MiniLM-L6-v2"))
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model.onnx")
+EMBEDDING_MAX_TOKENS = 256            # The model's max_seq_length; longer messages are truncated
+EMBEDDING_THREADS = 0                 # onnxruntime intra-op threads; 0 lets it use every core
+# Concurrent queries are grouped into one forward pass: a batch runs once it has
+# EMBEDDING_BATCH_MAX_SIZE texts or its first text has waited EMBEDDING_BATCH_MAX_WAIT_MS.
+EMBEDDING_BATCH_MAX_SIZE = 32
+EMBEDDING_BATCH_MAX_WAIT_MS = 2.0
+RETRIEVER_K = 5  # Retrieve more tools for better context in multi-step tasks
+RETRIEVER_MAX_K = 50  # Upper bound for a per-request `retriever_k`
+# Prebuilt FAISS index + registry hash. Build with `python -m orchestrator.tool_index`.
+TOOL_INDEX_DIR = os.getenv("TOOL_INDEX_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".tool_index"))
+
+# --- Semantic Tool-Selection Cache ---
+SELECTION_CACHE_ENABLED = True
+SELECTION_CACHE_THRESHOLD = 0.92      # Cosine similarity needed to reuse a cached selection
+SELECTION_CACHE_MAX_ENTRIES = 1024    # LRU capacity
+SELECTION_CACHE_TTL_SECONDS = 3600.0
+# Messages this short, or containing these words, lean on the chat history for their
+# meaning ("do that again", "more on it"), so they skip the cache when history exists.
+SELECTION_CACHE_MIN_WORDS = 4
+SELECTION_CACHE_CONTEXT_WORDS = {"it", "this", "that", "these", "those", "them", "again", "more", "same", "another", "also"}
+
+# --- Local Fast-Path Router ---
+# Skips the selector LLM when a local keyword model and the FAISS scores agree on a
+# single tool with at least FAST_PATH_THRESHOLD combined probability.
+FAST_PATH_ENABLED = True
+FAST_PATH_THRESHOLD = 0.8
+FAST_PATH_MAX_SECOND_PROBABILITY = 0.15   # A strong runner-up hints at a multi-tool request
+FAST_PATH_CLASSIFIER_WEIGHT = 0.6         # Share of the keyword model vs. retrieval scores
+FAST_PATH_RETRIEVAL_TEMPERATURE = 0.1     # Softmax temperature applied to FAISS L2 distances
+FAST_PATH_SHADOW_RATE = 0.05              # Share of fast-path turns re-checked by the LLM in the background
+
+# --- Model Tiers ---
+# Each stage tries its tiers in order. A stage moves to the next tier only when the
+# output fails to parse or validate even after local repair, or (selection) names a tool
+# outside the retrieved set; the last tier's answer is used as is.
+MODEL_TIERS = {
+    "fast": os.getenv("FAST_MODEL", "gemini-2.5-flash"),
+    "pro": os.getenv("PRO_MODEL", "gemini-2.5-pro"),
+}
+STAGE_MODEL_TIERS = {
+    "selection": ["fast", "pro"],
+    "extraction": ["fast", "pro"],
+    "planning": ["pro"],
+    "summarization": ["pro"],
+}
+
+# --- Structured Output Repair (see output_repair.py) ---
+# Selection, extraction and planning answers are repaired locally before they can
+# escalate to the next tier; an answer that still can't be used gets one targeted re-ask
+# of the last tier with the error.
+OUTPUT_REPAIR_ENABLED = True
+OUTPUT_REPAIR_SNAP_CUTOFF = 0.8           # Minimum similarity for snapping a misspelled tool name
+# Enum values are only snapped on case and separators ("Bullet Points" -> "bullet_points")
+# or through these exact synonyms, and only to a value the field allows. Anything else
+# ("not hard", "medium-hard") is unusable, so the stage escalates instead of guessing.
+OUTPUT_REPAIR_VALUE_SYNONYMS = {
+    "bullets": "bullet_points", "bulleted": "bullet_points", "bullet_list": "bullet_points",
+    "outlined": "outline", "prose": "narrative",
+    "simple": "easy", "moderate": "medium", "difficult": "hard",
+    "beginner": "basic", "detailed": "comprehensive", "in_depth": "comprehensive",
+}
+OUTPUT_REPAIR_MAX_PASSES = 3              # Validate -> fix rounds before an answer counts as unrecoverable
+
+# --- Speculative Extraction ---
+# Opt-in: while the selector LLM runs, extract parameters for the top retrieved tool if
+# its FAISS distance is at most SPECULATIVE_MAX_DISTANCE (squared L2 between unit vectors,
+# so 1.2 means cosine similarity 0.4). The result is used if the selector picks that tool.
+SPECULATIVE_EXTRACTION_ENABLED = False
+SPECULATIVE_MAX_DISTANCE = 1.2
+SPECULATIVE_TOOL_CALLS = False            # Also call the tool early (only tools in HEDGE_IDEMPOTENT_TOOLS)
+
+# --- Single-Call Planner ---
+# When enabled, tool selection and parameter extraction are fused into one LLM call.
+# Any plan that fails schema validation falls back to the two-phase path.
+PLANNER_MODE_ENABLED = False
+
+# --- Observability (spans, /metrics, logging) ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Upper bounds (seconds) of the stage-latency histogram buckets exposed at /metrics
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
 
 # --- Tool Routing & Registration ---
+# These seed the built-in tools of `tool_registry` (orchestrator/tool_registry.py), which
+# also holds each tool's input schema and formatter. Tools added at runtime go through
+# `tool_registry.register(...)` instead.
 
 # The scalable router dictionary for API calls
 TOOL_API_ENDPOINTS = {
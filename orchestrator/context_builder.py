@@ -0,0 +1,60 @@
+from typing import List
+
+from .config import CONTEXT_TOKEN_BUDGET, CONTEXT_RECENT_TURNS, CONTEXT_MAX_MESSAGE_CHARS
+
+# --- Token-Budgeted Conversation Context ---
+# Prompts get a rolling summary of older turns plus the last few turns verbatim,
+# instead of the whole, ever-growing chat history.
+
+TRUNCATION_MARKER = " …[truncated]"
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) so budgeting needs no tokenizer download."""
+    return (len(text) + 3) // 4 if text else 0
+
+def truncate_message(message: dict, max_chars: int = CONTEXT_MAX_MESSAGE_CHARS) -> dict:
+    content = message["content"]
+    if len(content) <= max_chars:
+        return message
+    return {**message, "content": content[:max_chars].rstrip() + TRUNCATION_MARKER}
+
+def recent_window_start(history_length: int, recent_turns: int = CONTEXT_RECENT_TURNS) -> int:
+    """Index of the first message kept verbatim; everything before it belongs in the summary."""
+    return max(0, history_length - recent_turns * 2)
+
+def pending_summary_range(message_count: int, summarized_count: int, recent_turns: int = CONTEXT_RECENT_TURNS) -> tuple:
+    """[start, end) of the messages that have left the verbatim window but are not yet in the summary."""
+    return summarized_count, max(summarized_count, recent_window_start(message_count, recent_turns))
+
+def build_context(chat_history: List[dict], summary: str = "", budget: int = CONTEXT_TOKEN_BUDGET,
+                  recent_turns: int = CONTEXT_RECENT_TURNS, history_length: int = None) -> dict:
+    """
+    Fits the summary and the most recent messages into `budget` estimated tokens.
+    The summary is always kept; the oldest verbatim messages are dropped first.
+    `chat_history` may be just the tail of the history; `history_length` is the full count.
+    """
+    recent = [truncate_message(msg) for msg in chat_history[recent_window_start(len(chat_history), recent_turns):]]
+    summary_tokens = estimate_tokens(summary)
+    message_tokens = [estimate_tokens(msg["content"]) for msg in recent]
+
+    dropped = 0
+    while recent and summary_tokens + sum(message_tokens) > budget:
+        recent.pop(0)
+        message_tokens.pop(0)
+        dropped += 1
+
+    return {
+        "chat_history": recent,
+        "conversation_summary": summary,
+        "token_counts": {
+            "summary": summary_tokens,
+            "history": sum(message_tokens),
+            "total": summary_tokens + sum(message_tokens),
+            "budget": budget,
+            "dropped_messages": dropped,
+            "full_history_messages": len(chat_history) if history_length is None else history_length,
+        },
+    }
+
+def format_messages_for_summary(messages: List[dict]) -> str:
+    return "\n".join(f"{msg['role']}: {truncate_message(msg)['content']}" for msg in messages)
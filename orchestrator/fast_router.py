@@ -0,0 +1,169 @@
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+from .config import (
+    FAST_PATH_ENABLED, FAST_PATH_THRESHOLD, FAST_PATH_CLASSIFIER_WEIGHT,
+    FAST_PATH_RETRIEVAL_TEMPERATURE, FAST_PATH_MAX_SECOND_PROBABILITY,
+)
+from .router_examples import FAST_PATH_TRAINING_EXAMPLES
+from .tool_registry import tool_registry
+
+# --- Confidence-Gated Fast-Path Router ---
+# Scores a message locally from (a) the FAISS distances the retriever already computed
+# and (b) a small keyword model trained on labeled examples. When both agree on one
+# tool with enough confidence, that tool is returned and the selector LLM is skipped.
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+_CLAUSE_SPLIT_RE = re.compile(r"\b(?:and|then|also|plus)\b|[,;]")
+_STOPWORDS = {
+    "a", "an", "the", "of", "for", "on", "in", "to", "me", "my", "i", "you", "can", "could", "please",
+    "is", "are", "it", "and", "or", "with", "some", "about", "this", "that", "be", "so", "do", "use",
+}
+
+def _features(text: str) -> List[str]:
+    words = [word for word in _TOKEN_RE.findall(text.lower()) if word not in _STOPWORDS]
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+class KeywordToolClassifier:
+    """Multinomial naive Bayes over unigrams and bigrams. Trains in milliseconds, predicts in microseconds."""
+    def __init__(self, alpha: float = 0.5):
+        self.alpha = alpha
+        self.labels = []
+        self._log_priors = {}
+        self._log_likelihoods = {}
+        self._log_unseen = {}
+
+    def fit(self, examples: List[tuple]) -> "KeywordToolClassifier":
+        label_counts = Counter(label for _, label in examples)
+        feature_counts = defaultdict(Counter)
+        for text, label in examples:
+            feature_counts[label].update(_features(text))
+        vocabulary = {feature for counts in feature_counts.values() for feature in counts}
+        total = sum(label_counts.values())
+
+        self.labels = sorted(label_counts)
+        for label in self.labels:
+            denominator = sum(feature_counts[label].values()) + self.alpha * len(vocabulary)
+            self._log_priors[label] = math.log(label_counts[label] / total)
+            self._log_likelihoods[label] = {
+                feature: math.log((count + self.alpha) / denominator) for feature, count in feature_counts[label].items()
+            }
+            self._log_unseen[label] = math.log(self.alpha / denominator)
+        return self
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        features = _features(text)
+        if not self.labels:
+            return {}
+        known = {feature for likelihoods in self._log_likelihoods.values() for feature in likelihoods}
+        features = [feature for feature in features if feature in known]
+        scores = {
+            label: self._log_priors[label] + sum(self._log_likelihoods[label].get(f, self._log_unseen[label]) for f in features)
+            for label in self.labels
+        }
+        return _softmax(scores)
+
+def _softmax(scores: Dict[str, float]) -> Dict[str, float]:
+    if not scores:
+        return {}
+    top = max(scores.values())
+    exps = {label: math.exp(score - top) for label, score in scores.items()}
+    total = sum(exps.values())
+    return {label: value / total for label, value in exps.items()}
+
+def _default_training_set() -> List[tuple]:
+    # Only currently registered tools may be predicted
+    examples = [
+        (example["message"], example["expected_tool"]) for example in FAST_PATH_TRAINING_EXAMPLES
+        if example["expected_tool"] in tool_registry
+    ]
+    # The registry descriptions list each tool's trigger keywords, so they train the model too
+    examples += [(description, name) for name, description in tool_registry.descriptions().items()]
+    return examples
+
+class FastPathRouter:
+    def __init__(self, threshold: float = FAST_PATH_THRESHOLD, enabled: bool = FAST_PATH_ENABLED,
+                 classifier_weight: float = FAST_PATH_CLASSIFIER_WEIGHT):
+        self.threshold = threshold
+        self.enabled = enabled
+        self.classifier_weight = classifier_weight
+        self.classifier = KeywordToolClassifier().fit(_default_training_set())
+        self._lock = threading.Lock()
+        self.stats = {path: {"taken": 0, "labeled": 0, "correct": 0} for path in ("fast", "llm")}
+
+    def on_registry_change(self, event: str, spec):
+        """Refits on the current registry (milliseconds), so added tools can be predicted and removed ones can't."""
+        self.classifier = KeywordToolClassifier().fit(_default_training_set())
+
+    @staticmethod
+    def retrieval_probabilities(tool_names: List[str], distances: List[float]) -> Dict[str, float]:
+        """Turns FAISS L2 distances into a distribution over the retrieved tools (closer = likelier)."""
+        scores = {}
+        for name, distance in zip(tool_names, distances):
+            scores.setdefault(name, -float(distance) / FAST_PATH_RETRIEVAL_TEMPERATURE)
+        return _softmax(scores)
+
+    def score(self, message: str, tool_names: List[str], distances: List[float]) -> Dict[str, float]:
+        classifier = self.classifier.predict_proba(message)
+        retrieval = self.retrieval_probabilities(tool_names, distances)
+        tools = set(classifier) | set(retrieval)
+        weight = self.classifier_weight
+        return {tool: weight * classifier.get(tool, 0.0) + (1 - weight) * retrieval.get(tool, 0.0) for tool in tools}
+
+    def route(self, message: str, tool_names: List[str], distances: List[float]) -> Optional[List[str]]:
+        """Returns a single-tool list when confident, or None to defer to the selector LLM."""
+        if not self.enabled or not tool_names:
+            return None
+        scores = self.score(message, tool_names, distances)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        best_tool, best_score = ranked[0]
+        second_score = ranked[1][1] if len(ranked) > 1 else 0.0
+        # Both signals must agree on the winner, and a strong runner-up suggests a multi-tool request
+        if best_score < self.threshold or second_score > FAST_PATH_MAX_SECOND_PROBABILITY or tool_names[0] != best_tool:
+            return None
+        if self._is_multi_intent(message):
+            return None
+        return [best_tool]
+
+    def _is_multi_intent(self, message: str) -> bool:
+        """True when separate clauses ("make flashcards ... and explain ...") point at different tools."""
+        clauses = [clause for clause in _CLAUSE_SPLIT_RE.split(message.lower()) if _features(clause)]
+        if len(clauses) < 2:
+            return False
+        clause_tools = set()
+        for clause in clauses:
+            probabilities = self.classifier.predict_proba(clause)
+            clause_tools.add(max(probabilities, key=probabilities.get))
+        return len(clause_tools) > 1
+
+    def record_path(self, path: str):
+        with self._lock:
+            self.stats[path]["taken"] += 1
+
+    def record_outcome(self, path: str, predicted: List[str], expected: List[str]):
+        """
+        Records a labeled outcome for the path's accuracy. Evaluation runs (tests/run_evaluation.py)
+        label both paths against the dataset; shadow checks label the fast path against the selector LLM.
+        """
+        with self._lock:
+            self.stats[path]["labeled"] += 1
+            # Order isn't scored: the scheduler derives execution order from tool dependencies
+            self.stats[path]["correct"] += int(sorted(predicted) == sorted(expected))
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            report = {"threshold": self.threshold, "enabled": self.enabled}
+            total = sum(path["taken"] for path in self.stats.values())
+            for name, path in self.stats.items():
+                report[name] = {
+                    **path,
+                    "accuracy": round(path["correct"] / path["labeled"], 4) if path["labeled"] else None,
+                }
+            report["fast_path_rate"] = round(self.stats["fast"]["taken"] / total, 4) if total else 0.0
+            return report
+
+fast_path_router = FastPathRouter()
+tool_registry.add_listener(fast_path_router.on_registry_change)
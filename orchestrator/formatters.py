@@ -0,0 +1,39 @@
+# --- Per-Tool Response Formatters ---
+# Each registered tool has one of these (see tool_registry.py); it turns the tool's JSON
+# response into the markdown section shown to the student.
+
+def format_notemaker_response(response: dict) -> str:
+    """Formats the NoteMaker JSON into a readable string."""
+    if "error" in response:
+        return "Sorry, I encountered an error while creating your notes."
+    title = response.get('title', 'your notes')
+    summary = response.get('summary', 'Here are the notes I created:')
+    sections_str = ""
+    for section in response.get('note_sections', []):
+        key_points = "\n".join(f"  - {point}" for point in section.get('key_points', []))
+        sections_str += f"\n\n### {section.get('title', 'Section')}\n{section.get('content', '')}\n**Key Points:**\n{key_points}"
+    return f"Great! I've prepared a summary for you on **{response.get('topic', 'your topic')}**.\n\n## {title}\n\n**Summary:** {summary}{sections_str}"
+
+def format_flashcards_response(response: dict) -> str:
+    """Formats the Flashcard Generator JSON into a detailed, readable string."""
+    if "error" in response:
+        return "Sorry, I had trouble creating the flashcards."
+    flashcards = response.get('flashcards', [])
+    topic = response.get('topic', 'your topic')
+    if not flashcards:
+        return f"I couldn't generate any flashcards for **{topic}**. Please try another topic."
+    intro = f"Additionally, I've created {len(flashcards)} flashcards for you on **{topic}**. Here are the details:\n"
+    flashcard_details = []
+    for i, card in enumerate(flashcards):
+        question = card.get('question', 'No question provided.')
+        answer = card.get('answer', 'No answer provided.')
+        card_str = f"\n--- Card #{i+1} ---\n**Question:** {question}\n**Answer:** {answer}"
+        flashcard_details.append(card_str)
+    return intro + "\n".join(flashcard_details)
+
+def format_conceptexplainer_response(response: dict) -> str:
+    """Formats the Concept Explainer JSON into a readable string."""
+    if "error" in response:
+        return "Sorry, I couldn't find a good explanation for that concept right now."
+    explanation = response.get('explanation', 'Here is the explanation you requested.')
+    return f"Of course! Here is an explanation of the concept:\n\n{explanation}"
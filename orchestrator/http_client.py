@@ -0,0 +1,102 @@
+import logging
+
+import httpx
+
+from .config import (
+    BASE_API_URL, TOOL_BASE_URLS, TOOL_TIMEOUTS, DEFAULT_TOOL_TIMEOUT,
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY, HTTP_ENABLE_HTTP2,
+)
+from .telemetry import get_request_id
+
+logger = logging.getLogger(__name__)
+
+# --- Shared, app-lifetime client for all downstream tool calls ---
+# One pool means keep-alive connections are reused across tools and turns instead
+# of paying a fresh TCP handshake (and an ephemeral port) for every call.
+_client = None
+_stats = {"requests": 0, "errors": 0, "in_flight": 0, "peak_in_flight": 0}
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _build_client(transport: httpx.AsyncBaseTransport = None) -> httpx.AsyncClient:
+    http2 = HTTP_ENABLE_HTTP2
+    if http2 and not _http2_available():
+        logger.warning("HTTP/2 requested but the `h2` package is not installed; falling back to HTTP/1.1.")
+        http2 = False
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(limits=limits, http2=http2, timeout=DEFAULT_TOOL_TIMEOUT, transport=transport)
+
+async def start_http_client(transport: httpx.AsyncBaseTransport = None) -> httpx.AsyncClient:
+    """
+    Creates the shared client. Called from the FastAPI lifespan on startup; `transport`
+    lets benchmarks route tool calls in-process (e.g. an `httpx.ASGITransport`).
+    """
+    global _client
+    if transport is not None and _client is not None:
+        await close_http_client()
+    if _client is None or _client.is_closed:
+        _client = _build_client(transport)
+        logger.info("Shared HTTP client started.")
+    return _client
+
+async def close_http_client():
+    """Closes the shared client and its pooled connections. Called on shutdown."""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+        logger.info("Shared HTTP client closed.")
+    _client = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Returns the shared client, creating it lazily for scripts that run outside the app lifespan."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+def get_tool_url(tool_name: str, endpoint_path: str) -> str:
+    return f"{TOOL_BASE_URLS.get(tool_name, BASE_API_URL)}{endpoint_path}"
+
+def get_tool_timeout(tool_name: str) -> float:
+    return TOOL_TIMEOUTS.get(tool_name, DEFAULT_TOOL_TIMEOUT)
+
+async def post_json(url: str, payload: dict, timeout: float) -> httpx.Response:
+    """POSTs through the shared pool while keeping the counters used by `get_pool_stats`."""
+    client = get_http_client()
+    _stats["requests"] += 1
+    _stats["in_flight"] += 1
+    _stats["peak_in_flight"] = max(_stats["peak_in_flight"], _stats["in_flight"])
+    try:
+        # Forward the request ID so the tool's logs can be joined with ours
+        return await client.post(url, json=payload, timeout=timeout, headers={"X-Request-ID": get_request_id()})
+    except httpx.RequestError:
+        _stats["errors"] += 1
+        raise
+    finally:
+        _stats["in_flight"] -= 1
+
+def get_pool_stats() -> dict:
+    """Request counters plus a snapshot of the underlying connection pool, for sizing the limits."""
+    stats = dict(_stats)
+    stats.update({
+        "max_connections": HTTP_MAX_CONNECTIONS,
+        "max_keepalive_connections": HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        "client_open": _client is not None and not _client.is_closed,
+    })
+    # httpcore does not publish pool metrics, so peek at its connection list when available.
+    pool = getattr(getattr(_client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None)
+    if connections is not None:
+        stats["open_connections"] = len(connections)
+        stats["idle_connections"] = sum(1 for conn in connections if conn.is_idle())
+        stats["active_connections"] = stats["open_connections"] - stats["idle_connections"]
+    return stats
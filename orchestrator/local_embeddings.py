@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from .config import (
+    EMBEDDING_MODEL_PATH, EMBEDDING_ONNX_FILE, EMBEDDING_MAX_TOKENS, EMBEDDING_THREADS,
+    EMBEDDING_BATCH_MAX_SIZE, EMBEDDING_BATCH_MAX_WAIT_MS,
+)
+from .telemetry import embedding_batch_size
+
+logger = logging.getLogger(__name__)
+
+# --- In-Process Embeddings with Cross-Request Micro-Batching ---
+# Runs the sentence-transformers model on CPU with onnxruntime instead of calling the
+# HuggingFace endpoint, so embedding a message costs a forward pass, not a network hop.
+# Queries from concurrent requests (any thread or event loop) are queued, and one
+# background thread runs them as a single padded batch once the batch is full or its
+# oldest query has waited EMBEDDING_BATCH_MAX_WAIT_MS. onnxruntime releases the GIL and
+# spreads each batch across cores.
+
+class OnnxEncoder:
+    """Tokenizer + ONNX session for a BERT-style sentence-transformers export (mean pooling, unit length)."""
+    def __init__(self, model_path: str = EMBEDDING_MODEL_PATH, onnx_file: str = EMBEDDING_ONNX_FILE,
+                 max_tokens: int = EMBEDDING_MAX_TOKENS, threads: int = EMBEDDING_THREADS):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("EMBEDDING_PROVIDER=onnx needs the optional `onnxruntime` package") from e
+        from tokenizers import Tokenizer
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_tokens)
+        self.tokenizer.enable_padding()
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_path, onnx_file), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.asarray([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.asarray([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        token_embeddings = self.session.run(None, feeds)[0]
+        # Mean over real tokens, then L2-normalize (the model's Pooling + Normalize modules)
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+class MicroBatcher:
+    """Groups single-text requests from any thread into batched `encode` calls on one worker thread."""
+    def __init__(self, encode, max_size: int = EMBEDDING_BATCH_MAX_SIZE, max_wait_ms: float = EMBEDDING_BATCH_MAX_WAIT_MS):
+        self.encode = encode
+        self.max_size = max_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.SimpleQueue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self.stats = {"batches": 0, "texts": 0}
+
+    def submit(self, text: str) -> Future:
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                vectors = self.encode([text for text, _ in batch])
+            except Exception as e:
+                logger.error("Embedding batch of %d failed: %s", len(batch), e)
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.stats["batches"] += 1
+            self.stats["texts"] += len(batch)
+            embedding_batch_size.observe(len(batch))
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector.tolist())
+
+    def get_stats(self) -> dict:
+        batches = self.stats["batches"]
+        return {**self.stats, "mean_batch_size": round(self.stats["texts"] / batches, 2) if batches else None}
+
+class OnnxEmbeddings(Embeddings):
+    """
+    LangChain `Embeddings` backed by `OnnxEncoder`, so it plugs into the FAISS index unchanged.
+    The model loads on first use. Queries go through the micro-batcher; document lists are
+    already batches and are encoded directly.
+    """
+    def __init__(self, model_path: str = EMBEDDING_MODEL_PATH, batch_max_size: int = EMBEDDING_BATCH_MAX_SIZE,
+                 batch_max_wait_ms: float = EMBEDDING_BATCH_MAX_WAIT_MS):
+        self.model_path = model_path
+        self._encoder: Optional[OnnxEncoder] = None
+        self._load_lock = threading.Lock()
+        self.batcher = MicroBatcher(self._encode, batch_max_size, batch_max_wait_ms)
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        if self._encoder is None:
+            with self._load_lock:
+                if self._encoder is None:
+                    started = time.perf_counter()
+                    self._encoder = OnnxEncoder(self.model_path)
+                    logger.info("Embedding model loaded from %s (%.0fms).", self.model_path, (time.perf_counter() - started) * 1000)
+        return self._encoder.encode(texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), self.batcher.max_size):
+            vectors.extend(self._encode(texts[start:start + self.batcher.max_size]).tolist())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.batcher.submit(text).result()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self.batcher.submit(text))
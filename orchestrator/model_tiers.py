@@ -0,0 +1,69 @@
+import threading
+from typing import Dict, List, Optional
+
+from .config import MODEL_TIERS, STAGE_MODEL_TIERS
+from .telemetry import model_tier_calls, model_escalations
+
+# --- Model Tiers per Stage ---
+# Selection and extraction are short classification and slot-filling tasks, so they try
+# a fast model first and escalate to the larger one only when its output can't be used
+# (see the cascade helpers in agent.py). This module holds the tier -> model mapping and
+# counts, per stage, which tier produced each result and why stages escalated.
+
+class EscalationNeeded(Exception):
+    """Raised (or returned as a reason) when a tier's output parsed but can't be used."""
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+class ModelTiers:
+    def __init__(self, tier_names: Dict[str, str] = MODEL_TIERS, stage_tiers: Dict[str, List[str]] = STAGE_MODEL_TIERS):
+        self.tier_names = dict(tier_names)
+        self.stage_tiers = {stage: list(tiers) for stage, tiers in stage_tiers.items()}
+        self._models = {}
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def set_models(self, models: Dict[str, object]):
+        """Installs chat models by tier name (e.g. fakes offline); tiers not given keep their model."""
+        self._models.update(models)
+
+    def model(self, tier: str):
+        return self._models[tier]
+
+    def tiers_for(self, stage: str) -> List[str]:
+        return self.stage_tiers.get(stage) or [self.fallback_tier()]
+
+    def fallback_tier(self) -> str:
+        """The largest tier: the last one listed in MODEL_TIERS."""
+        return list(self.tier_names)[-1]
+
+    def record(self, stage: str, tier: str, reasons: List[str]):
+        """One stage result, produced by `tier` after escalating once per reason in `reasons`."""
+        with self._lock:
+            stage_stats = self.stats.setdefault(stage, {"results": 0, "escalated": 0, "tiers": {}, "reasons": {}})
+            stage_stats["results"] += 1
+            stage_stats["escalated"] += int(bool(reasons))
+            stage_stats["tiers"][tier] = stage_stats["tiers"].get(tier, 0) + 1
+            for reason in reasons:
+                stage_stats["reasons"][reason] = stage_stats["reasons"].get(reason, 0) + 1
+        model_tier_calls.inc(stage=stage, tier=tier)
+        for reason in reasons:
+            model_escalations.inc(stage=stage, reason=reason)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "tiers": dict(self.tier_names),
+                "stages": {
+                    stage: {
+                        **stage_stats,
+                        "tiers": dict(stage_stats["tiers"]),
+                        "reasons": dict(stage_stats["reasons"]),
+                        "escalation_rate": round(stage_stats["escalated"] / stage_stats["results"], 4),
+                    }
+                    for stage, stage_stats in self.stats.items()
+                },
+            }
+
+model_tiers = ModelTiers()
@@ -0,0 +1,373 @@
+import ast
+import difflib
+import logging
+import os
+import re
+import threading
+from enum import Enum
+from typing import Any, Callable, List, Literal, Optional, Type, get_args, get_origin
+
+from pydantic import BaseModel, ValidationError
+from langchain_core.exceptions import OutputParserException
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableLambda
+from langchain_core.utils.json import parse_json_markdown
+
+from .config import OUTPUT_REPAIR_ENABLED, OUTPUT_REPAIR_SNAP_CUTOFF, OUTPUT_REPAIR_VALUE_SYNONYMS, OUTPUT_REPAIR_MAX_PASSES
+from .telemetry import output_repairs, output_repair_fixes
+
+logger = logging.getLogger(__name__)
+
+# --- Local Repair of Structured LLM Output ---
+# Selection, extraction and planning answers that almost parse are fixed here instead of
+# escalating to the next model tier: JSON defects (prose around the object, Python
+# literals, trailing commas, unquoted keys), tool names that miss a registry key by case
+# or a few letters, field names off by case, out-of-range numbers (clamped to the schema's
+# ge/le), enum values off by case or separators (or given as a known synonym), and
+# duplicate tools. An answer that still
+# can't be used raises OutputParserException, and the model cascade in agent.py re-asks
+# the last tier once with the error.
+
+def _normalize(value: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", str(value).lower())
+
+def _normalize_value(value: Any) -> str:
+    """Case and separators only: "Bullet Points" and "bullet-points" both become "bullet_points"."""
+    return re.sub(r"[\s_-]+", "_", str(value).strip().lower())
+
+def describe_error(error: Exception) -> str:
+    """The error message without LangChain's troubleshooting link."""
+    return str(error).split("\nFor troubleshooting")[0]
+
+# --- JSON Defects ---
+_FENCE_RE = re.compile(r"```(?:json|python)?\s*(.*?)\s*```", re.S)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_UNQUOTED_KEY_RE = re.compile(r'([{,]\s*)([A-Za-z_][\w\-]*)\s*:')
+_PYTHON_LITERALS = (("True", "true"), ("False", "false"), ("None", "null"))
+
+def _extract_json_span(text: str) -> str:
+    """The text from the first `{` or `[` to the last matching closer, dropping prose around it."""
+    fenced = _FENCE_RE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return text
+    start = min(starts)
+    end = text.rfind("}" if text[start] == "{" else "]")
+    return text[start:end + 1] if end > start else text[start:]
+
+def _python_literals(text: str) -> str:
+    for python, json_literal in _PYTHON_LITERALS:
+        text = re.sub(rf"\b{python}\b", json_literal, text)
+    return text
+
+def _single_quotes(text: str) -> str:
+    return text.replace("'", '"') if '"' not in text else text
+
+# Applied in order, each on top of the previous one, until the text parses
+_JSON_FIXES = [
+    ("smart_quotes", lambda text: text.translate(str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"}))),
+    ("trailing_comma", lambda text: _TRAILING_COMMA_RE.sub(r"\1", text)),
+    ("python_literals", _python_literals),
+    ("single_quotes", _single_quotes),
+    ("unquoted_keys", lambda text: _UNQUOTED_KEY_RE.sub(r'\1"\2":', text)),
+]
+
+def load_json(text: str, fixes: List[str]) -> Any:
+    """Parses JSON from an LLM answer, appending the name of each defect it had to fix to `fixes`."""
+    try:
+        # What the LangChain parsers accept as is: fenced blocks and truncated objects
+        return parse_json_markdown(text)
+    except ValueError:
+        pass
+    candidate = _extract_json_span(text)
+    if candidate != text.strip():
+        fixes.append("extracted_json")
+    try:
+        return parse_json_markdown(candidate)
+    except ValueError:
+        pass
+    try:
+        # A Python literal: single quotes, True/None, trailing commas
+        value = ast.literal_eval(candidate)
+        if isinstance(value, (dict, list)):
+            fixes.append("python_literal")
+            return value
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        pass
+    for name, fix in _JSON_FIXES:
+        fixed = fix(candidate)
+        if fixed == candidate:
+            continue
+        fixes.append(name)
+        candidate = fixed
+        try:
+            return parse_json_markdown(candidate)
+        except ValueError:
+            continue
+    raise OutputParserException(f"No JSON object found in the output: {text[:200]!r}", llm_output=text)
+
+# --- Schema Defects ---
+
+def _choices(annotation) -> Optional[list]:
+    if get_origin(annotation) is Literal:
+        return list(get_args(annotation))
+    if isinstance(annotation, type) and issubclass(annotation, Enum):
+        return [member.value for member in annotation]
+    return None
+
+def _nested_schema(annotation) -> Optional[Type[BaseModel]]:
+    """The model a field holds directly or as list items, if any."""
+    if get_origin(annotation) is list:
+        annotation = (get_args(annotation) or (None,))[0]
+    return annotation if isinstance(annotation, type) and issubclass(annotation, BaseModel) else None
+
+def _coerce(value: Any, annotation) -> Any:
+    """`value` converted to a plain int, float, bool, str or list field type; raises ValueError when it can't be."""
+    if annotation is bool:
+        word = _normalize(value)
+        if word in ("true", "yes", "y", "1"):
+            return True
+        if word in ("false", "no", "n", "0", "none"):
+            return False
+    elif annotation in (int, float):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return round(value) if annotation is int else float(value)
+        number = re.search(r"-?\d+(?:\.\d+)?", str(value))
+        if number:
+            return round(float(number.group())) if annotation is int else float(number.group())
+    elif annotation is str:
+        if isinstance(value, (list, tuple)):
+            return ", ".join(str(item) for item in value)
+        if value is not None and not isinstance(value, dict):
+            return str(value)
+    elif get_origin(annotation) is list and isinstance(value, str):
+        return [item.strip() for item in value.split(",") if item.strip()]
+    raise ValueError(f"can't convert {value!r} to {annotation}")
+
+def _clamp(value: Any, error_type: str, ctx: dict) -> Any:
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        raise ValueError(f"can't clamp {value!r}")
+    step = 1 if isinstance(value, int) else 0
+    bounds = {
+        "greater_than_equal": lambda: ctx["ge"], "less_than_equal": lambda: ctx["le"],
+        "greater_than": lambda: ctx["gt"] + step, "less_than": lambda: ctx["lt"] - step,
+    }
+    if not step and error_type in ("greater_than", "less_than"):
+        raise ValueError("no float strictly inside an open bound")
+    return bounds[error_type]()
+
+class OutputRepairer:
+    """Repairs structured LLM answers against a pydantic schema and counts, per stage, what it had to fix."""
+    def __init__(self, enabled: bool = OUTPUT_REPAIR_ENABLED, snap_cutoff: float = OUTPUT_REPAIR_SNAP_CUTOFF,
+                 value_synonyms: dict = OUTPUT_REPAIR_VALUE_SYNONYMS, max_passes: int = OUTPUT_REPAIR_MAX_PASSES):
+        self.enabled = enabled
+        self.snap_cutoff = snap_cutoff
+        self.value_synonyms = value_synonyms
+        self.max_passes = max_passes
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    # --- Building Blocks ---
+
+    def snap(self, value: Any, choices: List[Any]) -> Optional[Any]:
+        """The tool name `value` most plausibly meant (case, separators, a few letters or a suffix off), or None."""
+        if value in choices:
+            return value
+        key = _normalize(value)
+        if not key:
+            return None
+        normalized = {_normalize(choice): choice for choice in choices}
+        if key in normalized:
+            return normalized[key]
+        scored = sorted(((difflib.SequenceMatcher(None, key, candidate).ratio(), candidate) for candidate in normalized), reverse=True)
+        if scored and scored[0][0] >= self.snap_cutoff and (len(scored) == 1 or scored[0][0] > scored[1][0]):
+            return normalized[scored[0][1]]
+        # "Flashcard" / "FlashcardGenerator" for "Flashcards" (a long shared prefix) or "NoteMakerTool"
+        # for "NoteMaker" (the whole choice), as long as only one choice fits
+        for related in (
+            lambda candidate: len(os.path.commonprefix([key, candidate])) >= max(5, self.snap_cutoff * min(len(key), len(candidate))),
+            lambda candidate: len(candidate) >= 4 and candidate in key,
+        ):
+            matches = [choice for candidate, choice in normalized.items() if related(candidate)]
+            if len(matches) == 1:
+                return matches[0]
+        return None
+
+    def snap_value(self, value: Any, choices: List[Any]) -> Optional[Any]:
+        """The enum choice `value` names, differing only in case and separators or as a listed synonym, or None."""
+        if value in choices:
+            return value
+        normalized = {_normalize_value(choice): choice for choice in choices}
+        key = _normalize_value(value)
+        return normalized.get(key) or normalized.get(self.value_synonyms.get(key))
+
+    def repair_tool_names(self, names: List[str], choices: List[str], fixes: List[str]) -> List[str]:
+        """Snaps each name to a registered tool and drops unknown and repeated ones, keeping the order."""
+        repaired = []
+        for name in names:
+            snapped = self.snap(name, choices)
+            if snapped is None:
+                fixes.append("dropped_tool")
+                continue
+            if snapped != name:
+                fixes.append("snapped_tool")
+            if snapped in repaired:
+                fixes.append("duplicate_tool")
+                continue
+            repaired.append(snapped)
+        if names and not repaired:
+            raise ValueError(f"None of the selected tools are registered: {names}")
+        return repaired
+
+    def repair_fields(self, schema: Type[BaseModel], data: Any, fixes: List[str]) -> BaseModel:
+        """Validates `data` against `schema` (nested models first), fixing the fields the errors point at; raises ValidationError or ValueError."""
+        fields = schema.model_fields
+        if isinstance(data, list) and len(fields) == 1:
+            data = {next(iter(fields)): data}
+            fixes.append("wrapped_list")
+        if not isinstance(data, dict):
+            raise ValueError(f"Expected a JSON object for {schema.__name__}, got {type(data).__name__}")
+        data = dict(data)
+        names = {_normalize(field.alias or name): name for name, field in fields.items()}
+        for key in list(data):
+            target = names.get(_normalize(key))
+            if key not in fields and target is not None and target not in data:
+                data[target] = data.pop(key)
+                fixes.append("renamed_key")
+        for name, field in fields.items():
+            nested = _nested_schema(field.annotation)
+            if nested is None or name not in data:
+                continue
+            if isinstance(data[name], list):
+                data[name] = [self.repair_fields(nested, item, fixes) for item in data[name]]
+            elif isinstance(data[name], dict):
+                data[name] = self.repair_fields(nested, data[name], fixes)
+
+        for _ in range(self.max_passes):
+            try:
+                return schema.model_validate(data)
+            except ValidationError as e:
+                errors = e
+            for error in errors.errors():
+                if len(error["loc"]) != 1 or error["loc"][0] not in fields:
+                    raise errors
+                name, field = error["loc"][0], fields[error["loc"][0]]
+                value, error_type, ctx = data.get(name), error["type"], error.get("ctx", {})
+                try:
+                    if value is None:
+                        raise ValueError("null")
+                    if error_type in ("greater_than_equal", "less_than_equal", "greater_than", "less_than"):
+                        number = _coerce(value, field.annotation) if isinstance(value, str) else value
+                        data[name], fix = _clamp(number, error_type, ctx), "clamped"
+                    elif error_type == "string_too_long":
+                        data[name], fix = value[:ctx["max_length"]], "truncated"
+                    elif _choices(field.annotation) is not None and error_type != "missing":
+                        snapped = self.snap_value(value, _choices(field.annotation))
+                        if snapped is None:
+                            raise ValueError(f"{value!r} is not one of {_choices(field.annotation)}")
+                        data[name], fix = snapped, "snapped_value"
+                    elif error_type != "missing":
+                        data[name], fix = _coerce(value, field.annotation), "coerced"
+                    else:
+                        raise ValueError("missing")
+                except (ValueError, TypeError, KeyError):
+                    # A value the model gave but that can't be read ("twenty", "maybe") is unusable,
+                    # like an unknown enum value; only a null optional field gets the schema default
+                    if field.is_required() or value is not None:
+                        raise errors
+                    data[name], fix = field.get_default(call_default_factory=True), "defaulted"
+                fixes.append(fix)
+        return schema.model_validate(data)
+
+    # --- Chain Step ---
+
+    def parse(self, stage: str, text: str, schema: Type[BaseModel],
+              fixup: Optional[Callable[[BaseModel, List[str]], BaseModel]] = None) -> BaseModel:
+        """
+        Parses an LLM answer into `schema`, repairing it locally. `fixup(result, fixes)` applies
+        stage rules (tool names) on top. Raises OutputParserException when it can't be used.
+        """
+        return self._repair(stage, text, lambda fixes: self.repair_fields(schema, load_json(text, fixes), fixes), fixup)
+
+    def _repair(self, stage: str, text: str, build: Callable[[List[str]], BaseModel],
+                fixup: Optional[Callable[[BaseModel, List[str]], BaseModel]]) -> BaseModel:
+        fixes = []
+        try:
+            result = build(fixes)
+            if fixup is not None:
+                result = fixup(result, fixes)
+        except (OutputParserException, ValidationError, ValueError) as e:
+            self._record(stage, "unrecoverable", fixes)
+            raise OutputParserException(f"Unusable {stage} output: {describe_error(e)}", llm_output=text) from e
+        self._record(stage, "repaired" if fixes else "clean", fixes)
+        if fixes:
+            logger.info("Repaired %s output locally: %s", stage, ", ".join(dict.fromkeys(fixes)))
+        return result
+
+    def parse_output(self, stage: str, output: Any, schema: Type[BaseModel],
+                     fixup: Optional[Callable[[BaseModel, List[str]], BaseModel]] = None) -> BaseModel:
+        """`parse` for a chat model message, or for a `with_structured_output(..., include_raw=True)` result."""
+        if isinstance(output, dict) and "raw" in output:
+            parsed, raw = output.get("parsed"), output["raw"]
+            raw_text = raw.text if isinstance(raw, BaseMessage) else str(raw or "")
+            if parsed is not None and output.get("parsing_error") is None:
+                return self._repair(stage, raw_text, lambda fixes: parsed, fixup) if self.enabled else parsed
+            if not self.enabled:
+                error = output.get("parsing_error")
+                raise OutputParserException(f"Invalid {stage} output: {error or 'empty'}", llm_output=raw_text) from error
+            return self.parse(stage, raw_text, schema, fixup)
+        text = output.text if isinstance(output, BaseMessage) else str(output or "")
+        if not self.enabled:
+            try:
+                return schema.model_validate(parse_json_markdown(text))
+            except (ValueError, ValidationError) as e:
+                raise OutputParserException(f"Invalid {stage} output: {e}", llm_output=text) from e
+        return self.parse(stage, text, schema, fixup)
+
+    def parser(self, stage: str, schema: Type[BaseModel],
+               fixup: Optional[Callable[[BaseModel, List[str]], BaseModel]] = None) -> RunnableLambda:
+        """The chain step that turns a model answer into a validated `schema` instance."""
+        return RunnableLambda(lambda output: self.parse_output(stage, output, schema, fixup), name=f"repair_{stage}")
+
+    # --- Counters ---
+
+    def _stage_stats(self, stage: str) -> dict:
+        return self.stats.setdefault(stage, {
+            "outputs": 0, "clean": 0, "repaired": 0, "unrecoverable": 0, "reasks": 0, "reasks_recovered": 0, "fixes": {},
+        })
+
+    def _record(self, stage: str, outcome: str, fixes: List[str]):
+        with self._lock:
+            stage_stats = self._stage_stats(stage)
+            stage_stats["outputs"] += 1
+            stage_stats[outcome] += 1
+            for fix in fixes:
+                stage_stats["fixes"][fix] = stage_stats["fixes"].get(fix, 0) + 1
+        output_repairs.inc(stage=stage, outcome=outcome)
+        for fix in fixes:
+            output_repair_fixes.inc(stage=stage, fix=fix)
+
+    def record_reask(self, stage: str, recovered: bool):
+        with self._lock:
+            stage_stats = self._stage_stats(stage)
+            stage_stats["reasks"] += 1
+            stage_stats["reasks_recovered"] += int(recovered)
+        output_repairs.inc(stage=stage, outcome="reask_recovered" if recovered else "reask_failed")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "stages": {
+                    stage: {
+                        **stage_stats,
+                        "fixes": dict(stage_stats["fixes"]),
+                        "repair_rate": round(stage_stats["repaired"] / stage_stats["outputs"], 4) if stage_stats["outputs"] else 0.0,
+                    }
+                    for stage, stage_stats in self.stats.items()
+                },
+            }
+
+output_repairer = OutputRepairer()
@@ -5,7 +5,10 @@ You are an expert AI agent. Your task is to analyze a student's request and iden
 **Here are the most relevant tools for this specific request:**
 {tools}
 
-**Conversation History:**
+**Summary of Earlier Conversation:**
+{conversation_summary}
+
+**Recent Conversation History:**
 {chat_history}
 
 **Student's Latest Message:**
@@ -22,14 +25,20 @@ You are an expert AI assistant. Your task is to extract structured information t
 **Student Profile (State Manager Data):**
 {user_info}
 
-**Conversation History:**
+**Summary of Earlier Conversation:**
+{conversation_summary}
+
+**Recent Conversation History:**
 {chat_history}
 
 **Student's Latest Message:**
 {student_message}
 
+**Results From Earlier Tools in This Turn:**
+{upstream_results}
+
 **Instructions:**
-1.  Analyze the student's message in the context of their profile and the conversation.
+1.  Analyze the student's message in the context of their profile and the conversation. If earlier tools produced results this turn, keep this tool's topic consistent with them.
 2.  Extract all necessary information to fill the fields for the tool's required input schema.
 3.  **Crucially, use the Student Profile to infer values.** For example:
     - If the student's emotional state is 'Anxious' or 'Confused', or their mastery level is low (1-3), infer a 'difficulty' of 'easy' or a 'desired_depth' of 'basic'.
@@ -37,4 +46,51 @@ You are an expert AI assistant. Your task is to extract structured information t
     - If the student's learning style is 'Visual', set 'include_examples' to true.
 4.  If a parameter cannot be found or inferred, use a sensible default (e.g., 5 for `count`, 'structured' for `note_taking_style`).
 5.  You MUST provide the output in the requested structured JSON format.
-"""
\ No newline at end of file
+"""
+
+TOOL_PLANNER_PROMPT = """
+You are an expert AI agent. In a single step, decide which educational tools are needed to fulfill the student's request AND fill in each tool's input parameters.
+
+**Here are the most relevant tools for this specific request, with their parameter schemas:**
+{tools}
+
+**Student Profile (State Manager Data):**
+{user_info}
+
+**Summary of Earlier Conversation:**
+{conversation_summary}
+
+**Recent Conversation History:**
+{chat_history}
+
+**Student's Latest Message:**
+{student_message}
+
+**Instructions:**
+1.  Identify the sequence of tools that should be used. One or more tools may be required. If no tools are relevant, return an empty list.
+2.  For each selected tool, fill its `parameters` object so that it is valid against that tool's parameter schema. Use only the field names from the schema.
+3.  **Use the Student Profile to infer values.** Anxious/Confused students or low mastery (1-3) imply 'easy' difficulty or 'basic' depth; Focused students with high mastery (7+) imply 'hard' or 'advanced'; 'Visual' learners get `include_examples` set to true.
+4.  If a parameter cannot be found or inferred, use a sensible default (e.g., 5 for `count`, 'structured' for `note_taking_style`).
+
+{format_instructions}
+"""
+
+
+HISTORY_SUMMARY_PROMPT = """
+You maintain a running summary of a tutoring conversation between a student and an AI tutor.
+
+**Current Summary:**
+{summary}
+
+**New Messages to Fold In:**
+{messages}
+
+Update the summary so it also covers the new messages. Keep the topics studied, the tools used (notes, flashcards, explanations, quizzes), what the student struggled with, and any preferences they stated. Drop pleasantries and the verbatim content of generated material. Write at most {max_words} words of plain prose and return only the updated summary.
+"""
+
+
+OUTPUT_REASK_PROMPT = """
+Your previous answer could not be used: {error}
+
+Answer the same request again. Return only the corrected JSON, with every tool name and field value taken from the options given above.
+"""
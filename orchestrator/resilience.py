@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+import httpx
+
+from .config import (
+    TOOL_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY, RETRY_BUDGET_RATIO,
+    RETRY_BUDGET_MAX_TOKENS, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS, HEDGE_IDEMPOTENT_TOOLS,
+    HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES,
+)
+from .tool_registry import tool_registry
+
+logger = logging.getLogger(__name__)
+
+# --- Resilience for Downstream Tool APIs ---
+# Each registered tool gets its own retry budget, circuit breaker and latency
+# window. Retries and hedged requests both spend from the budget, so an outage can't
+# multiply the load on a struggling tool.
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a tool whose breaker is open."""
+
+class RetryableStatusError(Exception):
+    def __init__(self, response: httpx.Response):
+        super().__init__(f"HTTP {response.status_code} from {response.request.url}")
+        self.response = response
+
+class RetryBudget:
+    """Each call deposits RETRY_BUDGET_RATIO of a token; each retry or hedge withdraws a whole one."""
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, max_tokens: float = RETRY_BUDGET_MAX_TOKENS):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+        return self.state == "closed"
+
+    def record_success(self):
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def release_probe(self):
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning("Circuit opened after %d consecutive failure(s)", self.consecutive_failures)
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+class ToolResilience:
+    def __init__(self, tool_name: str):
+        self.tool_name = tool_name
+        self.breaker = CircuitBreaker()
+        self.budget = RetryBudget()
+        self.latencies = deque(maxlen=200)
+        self.idempotent = tool_name in HEDGE_IDEMPOTENT_TOOLS
+        self.stats = {"calls": 0, "attempts": 0, "retries": 0, "retries_denied": 0, "hedges": 0,
+                      "hedge_wins": 0, "short_circuited": 0, "failures": 0}
+
+    def hedge_delay(self):
+        """The tool's recent p95 latency, or None while there are too few samples to trust."""
+        if not self.idempotent or len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE))]
+
+    async def _attempt(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        self.stats["attempts"] += 1
+        started = time.monotonic()
+        response = await send()
+        if response.status_code >= 500:
+            raise RetryableStatusError(response)
+        self.latencies.append(time.monotonic() - started)
+        return response
+
+    async def _hedged_attempt(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        delay = self.hedge_delay()
+        first = asyncio.create_task(self._attempt(send))
+        if delay is None:
+            return await first
+        pending = {first}
+        try:
+            # Inside the try, so a caller cancelled while waiting out the delay cancels `first` too
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done or not self.budget.try_withdraw():
+                return await first
+
+            self.stats["hedges"] += 1
+            second = asyncio.create_task(self._attempt(send))
+            pending = {first, second}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+            # Both copies failed: surface the original request's error
+            return first.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """Sends through the breaker with budgeted, jittered retries (and a hedge for idempotent tools)."""
+        self.stats["calls"] += 1
+        if not self.breaker.allow():
+            self.stats["short_circuited"] += 1
+            raise CircuitOpenError(f"{self.tool_name} is temporarily unavailable (circuit open)")
+        self.budget.deposit()
+
+        for attempt in range(1, TOOL_MAX_ATTEMPTS + 1):
+            try:
+                response = await self._hedged_attempt(send)
+                self.breaker.record_success()
+                return response
+            except (httpx.RequestError, RetryableStatusError) as e:
+                self.breaker.record_failure()
+                if attempt == TOOL_MAX_ATTEMPTS or self.breaker.state == "open":
+                    self.stats["failures"] += 1
+                    raise
+                if not self.budget.try_withdraw():
+                    self.stats["retries_denied"] += 1
+                    self.stats["failures"] += 1
+                    raise
+                self.stats["retries"] += 1
+                backoff = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+                logger.info("Retrying %s in %.2fs after: %s", self.tool_name, backoff, e)
+                await asyncio.sleep(backoff)
+            except BaseException:
+                # Cancelled by the scheduler's deadline, or an error that isn't the tool's (a bug, a bad
+                # response body): release a half-open probe slot without judging the tool, or the
+                # breaker would never let another call through
+                self.breaker.release_probe()
+                raise
+
+    def get_stats(self) -> dict:
+        hedge_delay = self.hedge_delay()
+        return {
+            **self.stats,
+            "breaker_state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "retry_budget_tokens": round(self.budget.tokens, 2),
+            "hedge_delay_ms": round(hedge_delay * 1000, 1) if hedge_delay is not None else None,
+        }
+
+# Tools registered at runtime get theirs on first call (see get_resilience)
+tool_resilience = {tool_name: ToolResilience(tool_name) for tool_name in tool_registry.names()}
+
+def get_resilience(tool_name: str) -> ToolResilience:
+    if tool_name not in tool_resilience:
+        tool_resilience[tool_name] = ToolResilience(tool_name)
+    return tool_resilience[tool_name]
+
+def get_resilience_stats() -> dict:
+    return {tool_name: resilience.get_stats() for tool_name, resilience in tool_resilience.items()}
@@ -0,0 +1,50 @@
+# Labeled messages for the local fast-path router, in the same shape as
+# tests/evaluation_dataset.py. Kept separate from the evaluation set so the
+# router is never scored on its own training data.
+
+FAST_PATH_TRAINING_EXAMPLES = [
+    # --- NoteMaker ---
+    {"message": "Take notes on the French Revolution for me.", "expected_tool": "NoteMaker"},
+    {"message": "Summarize chapter 4 on cell respiration.", "expected_tool": "NoteMaker"},
+    {"message": "Make an outline of the key points about plate tectonics.", "expected_tool": "NoteMaker"},
+    {"message": "Can you organize the main ideas of the Cold War into notes?", "expected_tool": "NoteMaker"},
+    {"message": "Write a structured summary of the causes of the Great Depression.", "expected_tool": "NoteMaker"},
+    {"message": "List the key points of Newton's laws as bullet points.", "expected_tool": "NoteMaker"},
+    {"message": "I need study notes on the Roman Empire.", "expected_tool": "NoteMaker"},
+
+    # --- Flashcards ---
+    {"message": "Make flashcards on the periodic table elements.", "expected_tool": "Flashcards"},
+    {"message": "Create 10 flashcards for Spanish vocabulary.", "expected_tool": "Flashcards"},
+    {"message": "Help me memorize the bones of the human body.", "expected_tool": "Flashcards"},
+    {"message": "I want flash cards to review key terms in economics.", "expected_tool": "Flashcards"},
+    {"message": "Flashcards for important dates of the Civil War please.", "expected_tool": "Flashcards"},
+    {"message": "Give me cards to memorize the capitals of Europe.", "expected_tool": "Flashcards"},
+    {"message": "Generate flashcards so I can review for my biology test.", "expected_tool": "Flashcards"},
+
+    # --- ConceptExplainer ---
+    {"message": "Explain how photosynthesis works.", "expected_tool": "ConceptExplainer"},
+    {"message": "What is a derivative in calculus?", "expected_tool": "ConceptExplainer"},
+    {"message": "How does the immune system fight infections?", "expected_tool": "ConceptExplainer"},
+    {"message": "Tell me about the theory of relativity.", "expected_tool": "ConceptExplainer"},
+    {"message": "Can you explain what inflation means?", "expected_tool": "ConceptExplainer"},
+    {"message": "I don't understand how electricity flows in a circuit.", "expected_tool": "ConceptExplainer"},
+    {"message": "What are covalent bonds?", "expected_tool": "ConceptExplainer"},
+
+    # --- QuizGenerator ---
+    {"message": "Quiz me on the solar system.", "expected_tool": "QuizGenerator"},
+    {"message": "Give me practice problems on fractions.", "expected_tool": "QuizGenerator"},
+    {"message": "Test me on world war one.", "expected_tool": "QuizGenerator"},
+    {"message": "Create a multiple-choice quiz about the human heart.", "expected_tool": "QuizGenerator"},
+    {"message": "I want to check my understanding of chemical reactions with some questions.", "expected_tool": "QuizGenerator"},
+    {"message": "Make a practice test for my geometry exam.", "expected_tool": "QuizGenerator"},
+    {"message": "Assess how well I know the parts of speech.", "expected_tool": "QuizGenerator"},
+
+    # --- AnalogyCreator ---
+    {"message": "Give me an analogy for how a cell membrane works.", "expected_tool": "AnalogyCreator"},
+    {"message": "Compare DNA replication to something in everyday life.", "expected_tool": "AnalogyCreator"},
+    {"message": "What is electric current like? Use a comparison.", "expected_tool": "AnalogyCreator"},
+    {"message": "Explain black holes using a real-world analogy.", "expected_tool": "AnalogyCreator"},
+    {"message": "Is there a simple comparison that makes recursion easier to get?", "expected_tool": "AnalogyCreator"},
+    {"message": "Describe the stock market like it's something familiar.", "expected_tool": "AnalogyCreator"},
+    {"message": "Relate how a neural network learns to a real-world example.", "expected_tool": "AnalogyCreator"},
+]
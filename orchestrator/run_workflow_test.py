@@ -1,55 +1,51 @@
-from orchestrator.agent import (
-    GraphState, 
-    select_tool_node, 
-    extract_parameters_node, 
-    tool_orchestrator_node, 
-    response_normalizer_node
-)
-from orchestrator.state_manager import get_student_state, update_student_chat_history
-
-def run_full_workflow():
+import asyncio
+
+from orchestrator.agent import GraphState
+from orchestrator.context_builder import build_context
+from orchestrator.state_manager import aget_student_state
+from orchestrator.workflow import run_turn
+
+async def run_full_workflow():
     """
     Runs a full end-to-end test of the orchestrator workflow, simulating a real user interaction.
     """
     print("--- 🚀 STARTING FULL WORKFLOW TEST ---")
-    
+
     # --- Step 1: A new request arrives from a student ---
     user_id = "student123"
     test_message = "Okay, great. Now can you summarize the main causes of World War II for me?"
 
     # --- Step 2: Fetch the student's state (long-term memory) from the State Manager ---
     print(f"\n--- FETCHING STATE for user: {user_id} ---")
-    student_state = get_student_state(user_id)
+    student_state = await aget_student_state(user_id)
     print(f"Retrieved chat history with {len(student_state['chat_history'])} messages.")
+    context = build_context(
+        student_state["chat_history"], student_state["conversation_summary"],
+        history_length=student_state["message_count"]
+    )
 
     # --- Step 3: Populate the initial state for the agent's current task ---
     initial_state = GraphState(
+        user_id=user_id,
         student_message=test_message,
-        chat_history=student_state["chat_history"],
+        chat_history=context["chat_history"],
+        conversation_summary=context["conversation_summary"],
         user_info=student_state["user_info"],
-        selected_tool="", 
-        extracted_parameters={}, 
-        api_response={}, 
-        final_answer=""
+        selected_tools=[], tool_parameters={}, tool_results={}, tool_api_responses=[], final_answer="",
+        retriever_k=None
     )
-    
-    # --- Step 4: Run the agent's "thought process" by calling each node in sequence ---
-    state_after_selection = select_tool_node(initial_state)
-    state_after_extraction = extract_parameters_node(state_after_selection)
-    state_after_tool_call = tool_orchestrator_node(state_after_extraction)
-    final_state = response_normalizer_node(state_after_tool_call)
-    
-    # --- Step 5: Update the State Manager with the new conversation turn ---
-    print("\n--- 💾 SAVING STATE ---")
-    new_messages_to_save = [
-        {"role": "user", "content": test_message},
-        {"role": "assistant", "content": final_state["final_answer"]}
-    ]
-    update_student_chat_history(user_id, new_messages_to_save)
-    print("Conversation history has been updated.")
-    
+
+    # --- Step 4: Run the compiled workflow graph ---
+    # Selection, the tool DAG (extract -> call per tool), normalization and the state save
+    # (Step 5 in the old hand-wired version) are all nodes of the graph.
+    final_state = await run_turn(initial_state)
+    print("\n--- ⏱️ NODE TIMINGS ---")
+    for timing in final_state["node_timings"]:
+        print(f"{timing['node']:<10} {timing['tool'] or '':<16} {timing['ms']:>8.1f}ms {timing['status']}")
+
     # --- Step 6: Present the final result ---
     print("\n--- ✅ FULL WORKFLOW TEST COMPLETE ---")
+    print(f"Tools used: {final_state['selected_tools']}")
     print("\nFinal Human-Readable Answer to be shown to the student:")
     print("---------------------------------------------------------")
     print(final_state['final_answer'])
@@ -57,5 +53,4 @@ def run_full_workflow():
 
 
 if __name__ == "__main__":
-    run_full_workflow()
-
+    asyncio.run(run_full_workflow())
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List
+
+from .config import TOOL_DEPENDENCIES, TURN_LATENCY_BUDGET_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# --- Dependency-Aware Tool Execution ---
+# The selected tools form a small DAG, run inside the workflow's `run_tools` node
+# (workflow.py). Each tool starts as soon as its own dependencies have finished, not when
+# every tool of an earlier level has. The turn's latency budget is split evenly along
+# each tool's longest dependency chain, so a tool with nothing downstream may use the whole
+# budget while a tool that others wait on must finish within its share. Stragglers are
+# cancelled and come back as a marked timeout response, so the turn still returns a
+# partial answer through `_format_combined_response`.
+
+def build_tool_dag(selected_tools: List[str]) -> Dict[int, List[int]]:
+    """Maps each position in `selected_tools` to the earlier positions it depends on (so no cycles)."""
+    dag = {}
+    for i, tool_name in enumerate(selected_tools):
+        wanted = TOOL_DEPENDENCIES.get(tool_name, [])
+        dag[i] = [j for j in range(i) if selected_tools[j] in wanted]
+    return dag
+
+def dag_levels(dag: Dict[int, List[int]]) -> Dict[int, int]:
+    """Longest chain of dependencies above each tool (0 for tools that depend on nothing)."""
+    levels = {}
+    for i in sorted(dag):
+        levels[i] = 1 + max((levels[j] for j in dag[i]), default=-1)
+    return levels
+
+def dag_heights(dag: Dict[int, List[int]]) -> Dict[int, int]:
+    """Longest chain of dependents below each tool (0 for tools nothing waits on)."""
+    heights = {i: 0 for i in dag}
+    for i in sorted(dag, reverse=True):
+        for j in dag[i]:
+            heights[j] = max(heights[j], heights[i] + 1)
+    return heights
+
+def timed_out_response(tool_name: str, budget: float) -> dict:
+    return {"error": f"Timed out after its {budget:.1f}s deadline", "_timed_out_": True, "_tool_name_": tool_name}
+
+def schedule_tools(selected_tools: List[str], run_tool: Callable[[str, List[dict]], Awaitable[dict]],
+                   budget: float = TURN_LATENCY_BUDGET_SECONDS) -> List[asyncio.Task]:
+    """
+    Starts one task per selected tool and returns them in selected order. `run_tool(tool_name,
+    upstream_results)` receives the successful results of the tool's dependencies.
+    """
+    dag = build_tool_dag(selected_tools)
+    levels, heights = dag_levels(dag), dag_heights(dag)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    tasks: List[asyncio.Task] = []
+
+    async def run_node(i: int) -> dict:
+        tool_name = selected_tools[i]
+        chain_length = levels[i] + 1 + heights[i]
+        deadline = started + budget * (levels[i] + 1) / chain_length
+        upstream = [await tasks[j] for j in dag[i]]
+        upstream_ok = [result for result in upstream if "error" not in result]
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return timed_out_response(tool_name, deadline - started)
+        try:
+            return await asyncio.wait_for(run_tool(tool_name, upstream_ok), timeout=remaining)
+        except asyncio.TimeoutError:
+            logger.warning("%s missed its deadline and was cancelled", tool_name)
+            return timed_out_response(tool_name, deadline - started)
+
+    for i in range(len(selected_tools)):
+        tasks.append(asyncio.create_task(run_node(i)))
+    return tasks
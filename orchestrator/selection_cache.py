@@ -0,0 +1,100 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+from .config import (
+    SELECTION_CACHE_ENABLED, SELECTION_CACHE_THRESHOLD, SELECTION_CACHE_MAX_ENTRIES,
+    SELECTION_CACHE_TTL_SECONDS, SELECTION_CACHE_MIN_WORDS, SELECTION_CACHE_CONTEXT_WORDS,
+)
+
+# --- Semantic Cache for Tool Selection ---
+# Maps a message embedding to the tool list the selector LLM returned for it. A new
+# message whose embedding is close enough to a cached one reuses that list and skips
+# the selector call entirely.
+
+def depends_on_history(message: str, chat_history: List[dict]) -> bool:
+    """Heuristic: short or referential messages ("do that again") only make sense with the history."""
+    if not chat_history:
+        return False
+    words = re.findall(r"[a-z']+", message.lower())
+    return len(words) < SELECTION_CACHE_MIN_WORDS or any(word in SELECTION_CACHE_CONTEXT_WORDS for word in words)
+
+class SelectionCache:
+    def __init__(self, threshold: float = SELECTION_CACHE_THRESHOLD, max_entries: int = SELECTION_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = SELECTION_CACHE_TTL_SECONDS, enabled: bool = SELECTION_CACHE_ENABLED):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._entries = OrderedDict()  # key -> (unit vector, tools, stored_at)
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "bypassed": 0, "evictions": 0, "expired": 0}
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def should_bypass(self, message: str, chat_history: List[dict]) -> bool:
+        """True when the history likely changes what the message means, so a cached plan can't be trusted."""
+        return not self.enabled or depends_on_history(message, chat_history)
+
+    def _drop_expired(self, now: float):
+        expired = [key for key, (_, _, stored_at) in self._entries.items() if now - stored_at > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+        self.stats["expired"] += len(expired)
+
+    def lookup(self, embedding) -> Optional[List[str]]:
+        """Returns the cached tool list of the most similar entry above the threshold, or None."""
+        query = self._normalize(embedding)
+        with self._lock:
+            self._drop_expired(time.monotonic())
+            if not self._entries:
+                self.stats["misses"] += 1
+                return None
+            keys = list(self._entries.keys())
+            matrix = np.stack([self._entries[key][0] for key in keys])
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.stats["misses"] += 1
+                return None
+            key = keys[best]
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return list(self._entries[key][1])
+
+    def store(self, embedding, tools: List[str]):
+        with self._lock:
+            self._entries[self._next_key] = (self._normalize(embedding), list(tools), time.monotonic())
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def record_bypass(self):
+        with self._lock:
+            self.stats["bypassed"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+                "threshold": self.threshold,
+            }
+
+selection_cache = SelectionCache()
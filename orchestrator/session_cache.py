@@ -0,0 +1,150 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from .context_builder import build_context
+from .state_manager import RECENT_MESSAGES_LIMIT, aget_student_state, aupdate_student_chat_history
+from .telemetry import session_cache_sessions
+
+logger = logging.getLogger(__name__)
+
+# --- Session Cache for Connected Students ---
+# While a student has a /ws/chat socket open, the server keeps their profile, the verbatim
+# window of recent messages (already plain dicts) and the budgeted prompt context built
+# from it. A turn appends to the window and rebuilds the context from that bounded window,
+# so its cost doesn't grow with the history, and the new messages are written to the state
+# store in the background, in order. Sessions are per process; the store stays the source
+# of truth, and a session is reloaded from it on the next connect.
+
+class StudentSession:
+    def __init__(self, user_id: str, student_state: dict):
+        self.user_id = user_id
+        self.user_info = student_state["user_info"]
+        self.recent = deque(student_state["chat_history"], maxlen=RECENT_MESSAGES_LIMIT)
+        self.conversation_summary = student_state["conversation_summary"]
+        self.summarized_count = student_state["summarized_count"]
+        self.message_count = student_state["message_count"]
+        self.connections = 0
+        self.context = None
+        self._pending: List[dict] = []  # Appended messages not yet in the store
+        self._writer: Optional[asyncio.Task] = None
+        self._on_saved: Optional[Callable[[str], None]] = None
+        self.stats = {"turns": 0, "writes": 0, "write_failures": 0}
+        self._rebuild_context()
+
+    def _rebuild_context(self):
+        self.context = build_context(list(self.recent), self.conversation_summary, history_length=self.message_count)
+
+    def append_turn(self, messages: List[dict], on_saved: Callable[[str], None] = None):
+        """Adds a turn to the cached window right away and queues it; `on_saved(user_id)` runs after each write."""
+        self.recent.extend(messages)
+        self.message_count += len(messages)
+        self._rebuild_context()
+        self._pending.extend(messages)
+        self.stats["turns"] += 1
+        if on_saved is not None:
+            self._on_saved = on_saved
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_back())
+
+    async def _write_back(self):
+        # One writer at a time, so the store receives turns in the order they were appended
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                await aupdate_student_chat_history(self.user_id, batch)
+            except Exception as e:
+                # Kept for the next turn's (or the disconnect's) write-back
+                self._pending[:0] = batch
+                self.stats["write_failures"] += 1
+                logger.warning("Session write-back failed for %s (%d messages pending): %s", self.user_id, len(self._pending), e)
+                return
+            self.stats["writes"] += 1
+            if self._on_saved is not None:
+                self._on_saved(self.user_id)
+
+    def apply_summary(self, summary: str, summarized_count: int):
+        """Picks up a rolling summary stored by the background refresh."""
+        if summarized_count >= self.summarized_count:
+            self.conversation_summary = summary
+            self.summarized_count = summarized_count
+            self._rebuild_context()
+
+    async def flush(self):
+        """Waits for queued messages to reach the store, retrying once if the last write-back failed."""
+        if self._writer is not None:
+            await self._writer
+        if self._pending:
+            self._writer = asyncio.create_task(self._write_back())
+            await self._writer
+        if self._pending:
+            logger.error("Dropping %d unsaved messages for %s", len(self._pending), self.user_id)
+            self._pending = []
+
+    @property
+    def pending_messages(self) -> int:
+        return len(self._pending)
+
+class SessionCache:
+    def __init__(self):
+        self._sessions: Dict[str, StudentSession] = {}
+        self._loading: Dict[str, asyncio.Future] = {}
+        self.stats = {"loads": 0, "reused": 0}
+        self._closed_stats = {"turns": 0, "writes": 0, "write_failures": 0}  # From sessions already dropped
+
+    def get(self, user_id: str) -> Optional[StudentSession]:
+        return self._sessions.get(user_id)
+
+    async def open(self, user_id: str) -> StudentSession:
+        """Returns the student's session, loading it from the store on their first connection."""
+        session = self._sessions.get(user_id)
+        if session is None:
+            loading = self._loading.get(user_id)
+            if loading is None:
+                self.stats["loads"] += 1
+                # Sockets opened together for one student share a single load
+                loading = self._loading[user_id] = asyncio.ensure_future(aget_student_state(user_id))
+                try:
+                    student_state = await loading
+                finally:
+                    self._loading.pop(user_id, None)
+            else:
+                student_state = await asyncio.shield(loading)
+            session = self._sessions.get(user_id)
+            if session is None:
+                session = self._sessions[user_id] = StudentSession(user_id, student_state)
+                session_cache_sessions.set(len(self._sessions))
+        else:
+            self.stats["reused"] += 1
+        session.connections += 1
+        return session
+
+    async def close(self, session: StudentSession):
+        """Drops a connection; the session is flushed and forgotten once its last socket closes."""
+        session.connections -= 1
+        if session.connections > 0:
+            return
+        await session.flush()
+        # A socket may have reconnected while the flush was running
+        if session.connections == 0 and self._sessions.get(session.user_id) is session:
+            del self._sessions[session.user_id]
+            for key, value in session.stats.items():
+                self._closed_stats[key] += value
+            session_cache_sessions.set(len(self._sessions))
+
+    async def aclose(self):
+        """Flushes every session at shutdown."""
+        await asyncio.gather(*(session.flush() for session in list(self._sessions.values())), return_exceptions=True)
+
+    def get_stats(self) -> dict:
+        sessions = list(self._sessions.values())
+        return {
+            "sessions": len(sessions),
+            "connections": sum(session.connections for session in sessions),
+            "pending_messages": sum(session.pending_messages for session in sessions),
+            **self.stats,
+            **{key: total + sum(session.stats[key] for session in sessions) for key, total in self._closed_stats.items()},
+        }
+
+session_cache = SessionCache()
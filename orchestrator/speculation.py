@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional
+
+from .config import (
+    SPECULATIVE_EXTRACTION_ENABLED, SPECULATIVE_MAX_DISTANCE, SPECULATIVE_TOOL_CALLS,
+    HEDGE_IDEMPOTENT_TOOLS, TOOL_DEPENDENCIES,
+)
+from .telemetry import speculation_outcomes, speculation_wasted_seconds
+
+logger = logging.getLogger(__name__)
+
+# --- Speculative Extraction ---
+# When the selector LLM has to be called, the retriever's top tool is usually among the
+# tools it returns. If that tool scored well, its parameter extraction (and, for
+# idempotent tools, optionally the tool call) starts alongside the selector call. A
+# confirmed run hands its result to the turn, taking one LLM round trip off the critical
+# path; an unconfirmed one is cancelled and counted as wasted work.
+
+class SpeculativeRun:
+    """One speculative extraction (+ call). The coroutine fills in the timestamps as it goes."""
+    def __init__(self, tool_name: str, call_tool: bool):
+        self.tool_name = tool_name
+        self.call_tool = call_tool
+        self.started_at = time.perf_counter()
+        self.extracted_at: Optional[float] = None
+        self.call_started_at: Optional[float] = None
+        self.called_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+class SpeculationTracker:
+    def __init__(self, enabled: bool = SPECULATIVE_EXTRACTION_ENABLED, max_distance: float = SPECULATIVE_MAX_DISTANCE,
+                 call_tools: bool = SPECULATIVE_TOOL_CALLS):
+        self.enabled = enabled
+        self.max_distance = max_distance
+        self.call_tools = call_tools
+        self.stats = {
+            "started": 0, "hits": 0, "misses": 0, "failed": 0,
+            "head_start_seconds": 0.0, "wasted_extraction_seconds": 0.0, "wasted_tool_calls": 0,
+        }
+
+    def start(self, tool_name: Optional[str], distance: Optional[float],
+              run: Callable[[SpeculativeRun], Awaitable[tuple]]) -> Optional[SpeculativeRun]:
+        """Starts `run(speculative_run)` for the top retrieved tool if it scored well enough, else returns None."""
+        if not self.enabled or tool_name is None or distance is None or distance > self.max_distance:
+            return None
+        speculative = SpeculativeRun(tool_name, self.call_tools and tool_name in HEDGE_IDEMPOTENT_TOOLS)
+        speculative.task = asyncio.create_task(run(speculative))
+        self.stats["started"] += 1
+        return speculative
+
+    def confirm(self, speculative: Optional[SpeculativeRun], selected_tools: List[str]) -> Optional[SpeculativeRun]:
+        """
+        Keeps the run if the selector chose its tool and that tool doesn't wait on another
+        selected tool (its parameters would then depend on upstream results). Otherwise cancels it.
+        """
+        if speculative is None:
+            return None
+        wanted = TOOL_DEPENDENCIES.get(speculative.tool_name, [])
+        if speculative.tool_name in selected_tools and not any(tool in selected_tools for tool in wanted):
+            now = time.perf_counter()
+            self.stats["hits"] += 1
+            self.stats["head_start_seconds"] += (speculative.extracted_at or now) - speculative.started_at
+            speculation_outcomes.inc(outcome="hit")
+            return speculative
+        self.discard(speculative)
+        return None
+
+    def discard(self, speculative: Optional[SpeculativeRun]):
+        """Cancels an unconfirmed run and records the work it had already done."""
+        if speculative is None:
+            return
+        speculative.task.cancel()
+        now = time.perf_counter()
+        extraction_seconds = (speculative.extracted_at or now) - speculative.started_at
+        self.stats["misses"] += 1
+        self.stats["wasted_extraction_seconds"] += extraction_seconds
+        speculation_outcomes.inc(outcome="miss")
+        speculation_wasted_seconds.inc(extraction_seconds, kind="extraction")
+        if speculative.call_started_at is not None:
+            self.stats["wasted_tool_calls"] += 1
+            speculation_wasted_seconds.inc((speculative.called_at or now) - speculative.call_started_at, kind="tool_call")
+        logger.debug("Speculative %s discarded after %.1fms", speculative.tool_name, extraction_seconds * 1000)
+
+    def record_failure(self, speculative: SpeculativeRun, error: BaseException):
+        self.stats["failed"] += 1
+        speculation_outcomes.inc(outcome="failed")
+        logger.warning("Speculative run for %s failed, extracting again: %s", speculative.tool_name, error)
+
+    def get_stats(self) -> dict:
+        decided = self.stats["hits"] + self.stats["misses"]
+        return {
+            **{key: round(value, 3) if isinstance(value, float) else value for key, value in self.stats.items()},
+            "enabled": self.enabled,
+            "hit_rate": round(self.stats["hits"] / decided, 4) if decided else None,
+        }
+
+speculation_tracker = SpeculationTracker()
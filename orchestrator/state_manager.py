@@ -1,7 +1,19 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import List
 
 from .schemas import UserInfo, ChatMessage
+from .config import STATE_BACKEND, STATE_DB_PATH, CONTEXT_RECENT_TURNS
+from .telemetry import span
 
-# This dictionary acts as our mock database for the hackathon.
+logger = logging.getLogger(__name__)
+
+# This dictionary acts as our mock database for the hackathon (and seeds the SQLite store).
 # The keys are user_id's.
 mock_student_db = {
     "student123": {
@@ -16,7 +28,10 @@ mock_student_db = {
         "chat_history": [
             ChatMessage(role="user", content="Tell me about the causes of WWI."),
             ChatMessage(role="assistant", content="Certainly. The main causes were Militarism, Alliances, Imperialism, and Nationalism.")
-        ]
+        ],
+        # Rolling summary of the messages before index `summarized_count`
+        "conversation_summary": "",
+        "summarized_count": 0
     },
     "student456": {
         "user_info": UserInfo(
@@ -27,30 +42,296 @@ mock_student_db = {
             emotional_state_summary="Anxious about the upcoming test.",
             mastery_level_summary="Level 2: Building foundational knowledge."
         ),
-        "chat_history": []
+        "chat_history": [],
+        "conversation_summary": "",
+        "summarized_count": 0
     }
 }
 
-def get_student_state(user_id: str) -> dict:
+# Turns only ever read the verbatim window; older messages are reached through the summary.
+RECENT_MESSAGES_LIMIT = CONTEXT_RECENT_TURNS * 2
+
+# --- Pluggable State Backends ---
+class StateBackend(ABC):
     """
-    Retrieves a student's profile and chat history from the mock database.
+    Async interface every student-state store implements. Writes for one user are
+    serialized through a per-user lock so concurrent turns can't interleave.
     """
-    student_data = mock_student_db.get(user_id)
-    if not student_data:
-        raise ValueError(f"No student found with user_id: {user_id}")
-    
-    # Return the data in a dictionary format that can be used to build the GraphState
+    def __init__(self):
+        self._user_locks = {}
+
+    def _user_lock(self, user_id: str) -> asyncio.Lock:
+        lock = self._user_locks.get(user_id)
+        if lock is None:
+            lock = self._user_locks[user_id] = asyncio.Lock()
+        return lock
+
+    @abstractmethod
+    async def get_student(self, user_id: str) -> dict:
+        """Profile, summary and message count; raises ValueError for an unknown user."""
+
+    @abstractmethod
+    async def get_recent_messages(self, user_id: str, limit: int) -> List[dict]:
+        ...
+
+    @abstractmethod
+    async def get_messages(self, user_id: str, start: int, end: int) -> List[dict]:
+        ...
+
+    @abstractmethod
+    async def append_messages(self, user_id: str, messages: List[dict]):
+        ...
+
+    @abstractmethod
+    async def update_summary(self, user_id: str, summary: str, summarized_count: int):
+        ...
+
+class InMemoryStateBackend(StateBackend):
+    """The original module-level dict. Fast, but per-process and lost on restart."""
+    def __init__(self, db: dict = mock_student_db):
+        super().__init__()
+        self.db = db
+
+    def _student(self, user_id: str) -> dict:
+        student_data = self.db.get(user_id)
+        if not student_data:
+            raise ValueError(f"No student found with user_id: {user_id}")
+        return student_data
+
+    async def get_student(self, user_id: str) -> dict:
+        student_data = self._student(user_id)
+        return {
+            "user_info": student_data["user_info"].model_dump(),
+            "conversation_summary": student_data["conversation_summary"],
+            "summarized_count": student_data["summarized_count"],
+            "message_count": len(student_data["chat_history"]),
+        }
+
+    async def get_recent_messages(self, user_id: str, limit: int) -> List[dict]:
+        return [msg.model_dump() for msg in self._student(user_id)["chat_history"][-limit:]] if limit > 0 else []
+
+    async def get_messages(self, user_id: str, start: int, end: int) -> List[dict]:
+        return [msg.model_dump() for msg in self._student(user_id)["chat_history"][start:end]]
+
+    async def append_messages(self, user_id: str, messages: List[dict]):
+        if user_id not in self.db:
+            return
+        validated = [ChatMessage(**msg) for msg in messages]
+        async with self._user_lock(user_id):
+            self.db[user_id]["chat_history"].extend(validated)
+
+    async def update_summary(self, user_id: str, summary: str, summarized_count: int):
+        if user_id not in self.db:
+            return
+        async with self._user_lock(user_id):
+            self.db[user_id]["conversation_summary"] = summary
+            self.db[user_id]["summarized_count"] = summarized_count
+
+class SQLiteStateBackend(StateBackend):
+    """
+    Durable store shared by every worker on the host. WAL mode lets readers run
+    alongside the single writer; history is append-only rows keyed by (user_id, seq),
+    so reading the last N messages is an index range scan.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS students (
+            user_id TEXT PRIMARY KEY,
+            user_info TEXT NOT NULL,
+            conversation_summary TEXT NOT NULL DEFAULT '',
+            summarized_count INTEGER NOT NULL DEFAULT 0,
+            message_count INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            user_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (user_id, seq)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path: str = STATE_DB_PATH, seed: dict = mock_student_db):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.executescript(self.SCHEMA)
+        self._seed(conn, seed or {})
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must stay on the thread that created them, so keep one per worker thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _seed(self, conn: sqlite3.Connection, seed: dict):
+        """Inserts the demo profiles (and their starting history) the first time the database is created."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for user_id, data in seed.items():
+                history = data["chat_history"]
+                inserted = conn.execute(
+                    "INSERT OR IGNORE INTO students (user_id, user_info, message_count) VALUES (?, ?, ?)",
+                    (user_id, data["user_info"].model_dump_json(), len(history)),
+                ).rowcount
+                if inserted:
+                    conn.executemany(
+                        "INSERT INTO messages (user_id, seq, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                        [(user_id, seq, msg.role, msg.content, time.time()) for seq, msg in enumerate(history)],
+                    )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _get_student(self, user_id: str) -> dict:
+        row = self._connection().execute(
+            "SELECT user_info, conversation_summary, summarized_count, message_count FROM students WHERE user_id = ?",
+            (user_id,),
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"No student found with user_id: {user_id}")
+        return {"user_info": json.loads(row[0]), "conversation_summary": row[1], "summarized_count": row[2], "message_count": row[3]}
+
+    def _get_recent_messages(self, user_id: str, limit: int) -> List[dict]:
+        rows = self._connection().execute(
+            "SELECT role, content FROM messages WHERE user_id = ? ORDER BY seq DESC LIMIT ?", (user_id, limit)
+        ).fetchall()
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+    def _get_messages(self, user_id: str, start: int, end: int) -> List[dict]:
+        rows = self._connection().execute(
+            "SELECT role, content FROM messages WHERE user_id = ? AND seq >= ? AND seq < ? ORDER BY seq", (user_id, start, end)
+        ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def _append_messages(self, user_id: str, messages: List[ChatMessage]):
+        conn = self._connection()
+        # IMMEDIATE takes the write lock up front, which also serializes writers across processes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT message_count FROM students WHERE user_id = ?", (user_id,)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return
+            start = row[0]
+            conn.executemany(
+                "INSERT INTO messages (user_id, seq, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(user_id, start + i, msg.role, msg.content, time.time()) for i, msg in enumerate(messages)],
+            )
+            conn.execute("UPDATE students SET message_count = ? WHERE user_id = ?", (start + len(messages), user_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _update_summary(self, user_id: str, summary: str, summarized_count: int):
+        # Another worker may have stored a summary that covers more turns; never move backwards
+        self._connection().execute(
+            "UPDATE students SET conversation_summary = ?, summarized_count = ? WHERE user_id = ? AND summarized_count <= ?",
+            (summary, summarized_count, user_id, summarized_count),
+        )
+
+    async def get_student(self, user_id: str) -> dict:
+        return await asyncio.to_thread(self._get_student, user_id)
+
+    async def get_recent_messages(self, user_id: str, limit: int) -> List[dict]:
+        return await asyncio.to_thread(self._get_recent_messages, user_id, limit) if limit > 0 else []
+
+    async def get_messages(self, user_id: str, start: int, end: int) -> List[dict]:
+        return await asyncio.to_thread(self._get_messages, user_id, start, end)
+
+    async def append_messages(self, user_id: str, messages: List[dict]):
+        validated = [ChatMessage(**msg) for msg in messages]
+        async with self._user_lock(user_id):
+            await asyncio.to_thread(self._append_messages, user_id, validated)
+
+    async def update_summary(self, user_id: str, summary: str, summarized_count: int):
+        async with self._user_lock(user_id):
+            await asyncio.to_thread(self._update_summary, user_id, summary, summarized_count)
+
+def _create_backend(name: str = STATE_BACKEND) -> StateBackend:
+    if name == "memory":
+        return InMemoryStateBackend()
+    if name == "sqlite":
+        return SQLiteStateBackend()
+    raise ValueError(f"Unknown STATE_BACKEND: {name}")
+
+state_backend = _create_backend()
+
+def set_state_backend(backend: StateBackend):
+    """Swaps the active store (e.g. for tests or a shared multi-worker deployment)."""
+    global state_backend
+    state_backend = backend
+
+# --- Async API (used by the FastAPI handlers) ---
+async def aget_student_state(user_id: str, recent_messages: int = RECENT_MESSAGES_LIMIT) -> dict:
+    """
+    Retrieves a student's profile, summary and only the most recent messages; older
+    history is never loaded on the hot path.
+    """
+    with span("state_load"):
+        student = await state_backend.get_student(user_id)
+        student["chat_history"] = await state_backend.get_recent_messages(user_id, recent_messages)
+    return student
+
+async def aget_message_range(user_id: str, start: int, end: int) -> List[dict]:
+    """Messages with index in [start, end), e.g. the ones about to be folded into the summary."""
+    return await state_backend.get_messages(user_id, start, end)
+
+async def aupdate_student_chat_history(user_id: str, new_messages: list):
+    """
+    Appends a conversation turn. Only the new messages are validated.
+    """
+    with span("state_save", messages=len(new_messages)):
+        await state_backend.append_messages(user_id, new_messages)
+    logger.debug("History updated for %s", user_id)
+
+async def aupdate_conversation_summary(user_id: str, summary: str, summarized_count: int):
+    """
+    Stores the rolling summary covering the first `summarized_count` messages of the history.
+    """
+    await state_backend.update_summary(user_id, summary, summarized_count)
+    logger.debug("Summary updated for %s (%d messages)", user_id, summarized_count)
+
+# --- Sync API (kept for scripts that run outside an event loop) ---
+def _run_sync(coro):
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    coro.close()
+    raise RuntimeError("Inside an event loop, use the async state functions (aget_student_state, ...).")
+
+async def _aget_full_student_state(user_id: str) -> dict:
+    student = await state_backend.get_student(user_id)
     return {
-        "user_info": student_data["user_info"].model_dump(),
-        "chat_history": [msg.model_dump() for msg in student_data["chat_history"]]
+        "user_info": student["user_info"],
+        "chat_history": await state_backend.get_messages(user_id, 0, student["message_count"]),
+        "conversation_summary": student["conversation_summary"],
+        "summarized_count": student["summarized_count"],
     }
 
+def get_student_state(user_id: str) -> dict:
+    """
+    Retrieves a student's profile, summary and full chat history from the state store,
+    in the same shape as before the async backends (turns use `aget_student_state`).
+    """
+    return _run_sync(_aget_full_student_state(user_id))
+
 def update_student_chat_history(user_id: str, new_messages: list):
     """
-    Updates the chat history for a student in the mock database.
+    Updates the chat history for a student in the state store.
     """
-    if user_id in mock_student_db:
-        mock_student_db[user_id]["chat_history"].extend(
-            [ChatMessage(**msg) for msg in new_messages]
-        )
-        print(f"\n--- 💾 STATE MANAGER: History updated for {user_id} ---")
+    _run_sync(aupdate_student_chat_history(user_id, new_messages))
+
+def update_conversation_summary(user_id: str, summary: str, summarized_count: int):
+    """
+    Stores the rolling summary covering the first `summarized_count` messages of the history.
+    """
+    _run_sync(aupdate_conversation_summary(user_id, summary, summarized_count))
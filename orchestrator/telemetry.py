@@ -0,0 +1,272 @@
+import contextvars
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from .config import LOG_LEVEL, METRICS_LATENCY_BUCKETS
+from .context_builder import estimate_tokens
+
+# --- Tracing Spans, Prometheus Metrics and Non-Blocking Logging ---
+# Every stage of a turn (retrieval, selection, extraction, tool call, normalization,
+# state save) runs inside a `span`. A span carries the request ID, tool name and LLM
+# token counts, feeds the latency histograms served at /metrics, and is logged through
+# a queue so the hot path never blocks on stdout.
+
+logger = logging.getLogger(__name__)
+
+_request_id = contextvars.ContextVar("request_id", default="-")
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+def set_request_id(request_id: str) -> contextvars.Token:
+    return _request_id.set(request_id)
+
+def reset_request_id(token: contextvars.Token):
+    _request_id.reset(token)
+
+def get_request_id() -> str:
+    return _request_id.get()
+
+# --- Metrics (Prometheus text exposition format) ---
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+INF_LABEL = 'le="+Inf"'
+
+class Histogram:
+    """A labeled, cumulative-bucket histogram (the subset of prometheus_client we need)."""
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...], buckets=METRICS_LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, dict] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    le = 'le="%s"' % bound
+                    lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, INF_LABEL)} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {series['count']}")
+        return "\n".join(lines)
+
+class Counter:
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return "\n".join(lines)
+
+class Gauge:
+    """A value that goes up and down (e.g. queue depth); unlabeled, which is all we need."""
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def render(self) -> str:
+        return f"# HELP {self.name} {self.description}\n# TYPE {self.name} gauge\n{self.name} {self.value}"
+
+stage_duration = Histogram(
+    "orchestrator_stage_duration_seconds", "Latency of each orchestrator stage.", ("stage", "tool", "status")
+)
+http_request_duration = Histogram(
+    "orchestrator_http_request_duration_seconds", "End-to-end latency of HTTP requests.", ("method", "route", "status")
+)
+llm_tokens = Counter(
+    "orchestrator_llm_tokens_total", "LLM tokens used per stage (estimated when the model reports no usage).", ("stage", "type")
+)
+
+admission_queue_depth = Gauge("orchestrator_admission_queue_depth", "Turns waiting for an admission slot.")
+admission_in_flight = Gauge("orchestrator_admission_in_flight", "Turns currently holding an admission slot.")
+admission_wait = Histogram(
+    "orchestrator_admission_wait_seconds", "Time a turn waited before it was admitted or shed.", ("outcome",)
+)
+admission_rejected = Counter(
+    "orchestrator_admission_rejected_total", "Turns shed with 429, by reason.", ("reason",)
+)
+llm_rate_limit_wait = Histogram(
+    "orchestrator_llm_rate_limit_wait_seconds", "Time an LLM call waited for the request token bucket.", ()
+)
+speculation_outcomes = Counter(
+    "orchestrator_speculation_total", "Speculative extractions by outcome (hit, miss, failed).", ("outcome",)
+)
+speculation_wasted_seconds = Counter(
+    "orchestrator_speculation_wasted_seconds_total", "Time spent on discarded speculative work.", ("kind",)
+)
+model_tier_calls = Counter(
+    "orchestrator_model_tier_calls_total", "LLM stage results by the model tier that produced them.", ("stage", "tier")
+)
+model_escalations = Counter(
+    "orchestrator_model_escalations_total", "Moves to the next model tier, by stage and reason.", ("stage", "reason")
+)
+output_repairs = Counter(
+    "orchestrator_output_repairs_total",
+    "Structured LLM answers by stage and outcome (clean, repaired, unrecoverable, reask_recovered, reask_failed).", ("stage", "outcome")
+)
+output_repair_fixes = Counter(
+    "orchestrator_output_repair_fixes_total", "Local fixes applied to structured LLM answers, by stage and kind.", ("stage", "fix")
+)
+embedding_batch_size = Histogram(
+    "orchestrator_embedding_batch_size", "Texts per in-process embedding forward pass.", (), buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+graph_node_duration = Histogram(
+    "orchestrator_graph_node_duration_seconds", "Latency of each workflow graph node run, and of each tool inside run_tools.", ("node", "tool", "status")
+)
+session_cache_sessions = Gauge("orchestrator_session_cache_sessions", "Students with a cached /ws/chat session.")
+
+METRICS = [
+    stage_duration, http_request_duration, llm_tokens,
+    admission_queue_depth, admission_in_flight, admission_wait, admission_rejected, llm_rate_limit_wait,
+    speculation_outcomes, speculation_wasted_seconds, model_tier_calls, model_escalations, embedding_batch_size,
+    session_cache_sessions, graph_node_duration, output_repairs, output_repair_fixes,
+]
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def render_metrics() -> str:
+    return "\n".join(metric.render() for metric in METRICS) + "\n"
+
+# --- Spans ---
+
+@contextmanager
+def span(stage: str, **attributes):
+    """
+    Times a stage and records it in `stage_duration`. Yields the span's attribute dict, so
+    callers (and the token callback) can attach details such as the path taken or token counts.
+    """
+    record = {"stage": stage, **attributes}
+    token = _current_span.set(record)
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield record
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        _current_span.reset(token)
+        stage_duration.observe(duration, stage=stage, tool=record.get("tool", ""), status=status)
+        if logger.isEnabledFor(logging.DEBUG):
+            details = " ".join(f"{key}={value}" for key, value in record.items() if key != "stage")
+            logger.debug("span %s %.1fms status=%s %s", stage, duration * 1000, status, details)
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """Adds each LLM call's token counts to the current span and the token counter."""
+    # Run in the caller's context so the current span (a contextvar) is visible
+    run_inline = True
+
+    def __init__(self):
+        self._prompt_tokens = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._prompt_tokens[run_id] = sum(estimate_tokens(str(message.content)) for batch in messages for message in batch)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._prompt_tokens[run_id] = sum(estimate_tokens(prompt) for prompt in prompts)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt_tokens = self._prompt_tokens.pop(run_id, 0)
+        generation = response.generations[0][0] if response.generations and response.generations[0] else None
+        usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+        if usage:
+            prompt_tokens, completion_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        else:
+            completion_tokens = estimate_tokens(generation.text) if generation else 0
+
+        current = _current_span.get()
+        stage = current["stage"] if current else "unknown"
+        if current is not None:
+            current["prompt_tokens"] = current.get("prompt_tokens", 0) + prompt_tokens
+            current["completion_tokens"] = current.get("completion_tokens", 0) + completion_tokens
+        llm_tokens.inc(prompt_tokens, stage=stage, type="prompt")
+        llm_tokens.inc(completion_tokens, stage=stage, type="completion")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._prompt_tokens.pop(run_id, None)
+
+token_usage_handler = TokenUsageHandler()
+
+# --- Logging ---
+
+class _RequestIdFilter(logging.Filter):
+    """Stamps the request ID on the record in the caller's thread, before it is queued."""
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = get_request_id()
+        return True
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+
+def configure_logging(level: str = LOG_LEVEL):
+    """
+    Routes the `orchestrator` and `app` loggers through a queue; a background thread does the
+    actual (blocking) write to stderr. Safe to call more than once.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+    log_queue = queue.SimpleQueue()
+    queue_handler = _queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(_RequestIdFilter())
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+    for name in ("orchestrator", "app"):
+        package_logger = logging.getLogger(name)
+        package_logger.setLevel(level)
+        package_logger.addHandler(queue_handler)
+        package_logger.propagate = False
+    _listener = QueueListener(log_queue, stream_handler)
+    _listener.start()
+
+def shutdown_logging():
+    """Flushes queued records and stops the logging thread. Called on app shutdown."""
+    global _listener, _queue_handler
+    if _listener is not None:
+        for name in ("orchestrator", "app"):
+            logging.getLogger(name).removeHandler(_queue_handler)
+            logging.getLogger(name).propagate = True
+        _listener.stop()
+        _listener, _queue_handler = None, None
@@ -0,0 +1,87 @@
+import asyncio
+import copy
+import json
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from .config import TOOL_RESULT_CACHE_MAX_ENTRIES, TOOL_RESULT_TTLS
+
+# --- Request Coalescing + Result Cache for Downstream Tool Calls ---
+# Sits in front of `call_tool_api`. Concurrent identical calls share one in-flight
+# request (single-flight), and successful results are kept for the tool's TTL.
+
+def canonical_key(tool_name: str, parameters: dict) -> tuple:
+    """(tool name, parameters serialized with sorted keys) so dict ordering never splits the cache."""
+    return tool_name, json.dumps(parameters, sort_keys=True, separators=(",", ":"), default=str)
+
+class ToolResultCache:
+    def __init__(self, max_entries: int = TOOL_RESULT_CACHE_MAX_ENTRIES, ttls: dict = TOOL_RESULT_TTLS):
+        self.max_entries = max_entries
+        self.ttls = ttls
+        self._results = OrderedDict()  # key -> (result, expires_at)
+        self._in_flight = {}           # key -> asyncio.Task
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "bypassed": 0, "evictions": 0}
+
+    def _ttl(self, tool_name: str) -> float:
+        return self.ttls.get(tool_name, 0.0)
+
+    def _get_fresh(self, key: tuple):
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        result, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._results[key]
+            return None
+        self._results.move_to_end(key)
+        return result
+
+    def _store(self, key: tuple, result: dict, ttl: float):
+        self._results[key] = (result, time.monotonic() + ttl)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def call(self, tool_name: str, parameters: dict, fetch: Callable[[str, dict], Awaitable[dict]]) -> dict:
+        """Returns the tool result, reusing a cached or in-flight identical call when the tool allows it."""
+        ttl = self._ttl(tool_name)
+        if ttl <= 0:
+            self.stats["bypassed"] += 1
+            return await fetch(tool_name, parameters)
+
+        key = canonical_key(tool_name, parameters)
+        cached = self._get_fresh(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return copy.deepcopy(cached)
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["misses"] += 1
+            task = asyncio.create_task(fetch(tool_name, parameters))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done, key=key: self._on_done(key, done, ttl))
+        # Shield so one caller being cancelled doesn't cancel the request other callers share
+        result = await asyncio.shield(task)
+        return copy.deepcopy(result)
+
+    def _on_done(self, key: tuple, task: asyncio.Task, ttl: float):
+        self._in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        # Failed calls come back as {"error": ...}; never serve those from cache
+        if "error" not in result:
+            self._store(key, result, ttl)
+
+    def clear(self):
+        self._results.clear()
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "entries": len(self._results), "in_flight": len(self._in_flight)}
+
+tool_result_cache = ToolResultCache()
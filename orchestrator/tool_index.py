@@ -0,0 +1,235 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+from langchain_community.vectorstores.faiss import FAISS
+from langchain_huggingface import HuggingFaceEndpointEmbeddings
+from dotenv import load_dotenv
+
+from .config import EMBEDDING_MODEL, EMBEDDING_PROVIDER, RETRIEVER_K, TOOL_INDEX_DIR
+from .tool_registry import tool_registry
+
+# --- Persisted Tool-Embedding Index ---
+# The registry is embedded once by the build step and saved next to a hash of its
+# text. Workers then load (memory-map) the saved index instead of calling the
+# embedding endpoint at import time, and only rebuild when the registry changes.
+# Each document's docstore ID and `tool_name` metadata is the tool name, so results map
+# back to tools in O(1) and runtime registry changes touch only that tool's vector.
+# With several workers, a file lock makes exactly one of them build a stale index while
+# the others wait and then map the same file, so the vectors sit in the page cache once.
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "index.pkl"
+META_FILE = "meta.json"
+LOCK_FILE = ".lock"
+INDEX_FORMAT = 2  # Bumped when the saved layout changes (v2: docstore IDs are tool names)
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+def _make_embeddings(provider: str = EMBEDDING_PROVIDER):
+    if provider == "onnx":
+        from .local_embeddings import OnnxEmbeddings
+        return OnnxEmbeddings()
+    if provider != "remote":
+        raise ValueError(f"Unknown EMBEDDING_PROVIDER {provider!r} (expected 'remote' or 'onnx')")
+    return HuggingFaceEndpointEmbeddings(model=EMBEDDING_MODEL)
+
+embeddings = _make_embeddings()
+
+_lock = threading.Lock()
+_vector_store = None
+_status = {"state": "not_loaded", "source": None, "registry_hash": None, "load_ms": None, "mmap": False, "error": None}
+
+def registry_hash(registry: dict = None) -> str:
+    """Content hash of the registry text and embedding model; any change invalidates the saved index."""
+    payload = json.dumps({
+        "format": INDEX_FORMAT, "model": EMBEDDING_MODEL, "embeddings": type(embeddings).__name__,
+        "tools": tool_registry.descriptions() if registry is None else registry,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _read_meta(index_dir: str) -> dict:
+    try:
+        with open(os.path.join(index_dir, META_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+@contextmanager
+def _index_file_lock(index_dir: str, exclusive: bool):
+    """Cross-process lock on the index directory: shared while loading, exclusive while building."""
+    os.makedirs(index_dir, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(index_dir, LOCK_FILE), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _save(vector_store: FAISS, index_dir: str):
+    """
+    Writes to a temporary directory and renames each file into place, metadata last. Renaming
+    creates new inodes, so workers that already mapped the old index file keep a valid mapping.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=index_dir)
+    try:
+        vector_store.save_local(tmp_dir)
+        with open(os.path.join(tmp_dir, META_FILE), "w") as f:
+            json.dump({"registry_hash": registry_hash(), "model": EMBEDDING_MODEL, "tools": tool_registry.names()}, f, indent=2)
+        for name in (INDEX_FILE, DOCSTORE_FILE, META_FILE):
+            os.replace(os.path.join(tmp_dir, name), os.path.join(index_dir, name))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def _build_and_save(index_dir: str) -> FAISS:
+    """Embeds the registry (one network round trip) and saves the FAISS index plus its hash. Caller holds the lock."""
+    descriptions = tool_registry.descriptions()
+    names = list(descriptions)
+    vector_store = FAISS.from_texts(
+        texts=[descriptions[name] for name in names],
+        embedding=embeddings,
+        metadatas=[{"tool_name": name} for name in names],
+        ids=names,
+    )
+    _save(vector_store, index_dir)
+    logger.info("Tool index built and saved to %s.", index_dir)
+    return vector_store
+
+def build_index(index_dir: str = TOOL_INDEX_DIR) -> FAISS:
+    """Builds and saves the index, e.g. once before starting several workers."""
+    with _index_file_lock(index_dir, exclusive=True):
+        return _build_and_save(index_dir)
+
+def _load_saved_index(index_dir: str) -> tuple:
+    """
+    Loads a saved index. Flat indexes are memory-mapped in place (IO_FLAG_MMAP_IFC), so every
+    worker shares one copy of the vectors through the page cache. Returns (store, mapped).
+    """
+    import faiss
+
+    index_path = os.path.join(index_dir, INDEX_FILE)
+    mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    try:
+        index, mapped = faiss.read_index(index_path, mmap_flag | faiss.IO_FLAG_READ_ONLY), True
+    except RuntimeError:
+        index, mapped = faiss.read_index(index_path), False
+    # The docstore pickle is written by our own build step, never taken from user input.
+    with open(os.path.join(index_dir, DOCSTORE_FILE), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    vector_store = FAISS(embedding_function=embeddings, index=index, docstore=docstore, index_to_docstore_id=index_to_docstore_id)
+    return vector_store, mapped
+
+def _load_or_build(index_dir: str, current_hash: str) -> tuple:
+    """Returns (store, source, mapped). Only one process rebuilds a stale index; the rest load its result."""
+    with _index_file_lock(index_dir, exclusive=False):
+        if _read_meta(index_dir).get("registry_hash") == current_hash:
+            vector_store, mapped = _load_saved_index(index_dir)
+            return vector_store, "disk", mapped
+    with _index_file_lock(index_dir, exclusive=True):
+        # Another worker may have rebuilt it while we waited for the lock
+        if _read_meta(index_dir).get("registry_hash") == current_hash:
+            vector_store, mapped = _load_saved_index(index_dir)
+            return vector_store, "disk", mapped
+        logger.warning("Saved tool index missing or stale; rebuilding from the tool registry.")
+        return _build_and_save(index_dir), "rebuilt", False
+
+def load_index(index_dir: str = TOOL_INDEX_DIR) -> FAISS:
+    """Returns the tool index, loading it on first use and rebuilding only if the registry changed."""
+    global _vector_store
+    if _vector_store is not None:
+        return _vector_store
+    with _lock:
+        if _vector_store is not None:
+            return _vector_store
+        _status.update(state="loading", error=None)
+        started = time.perf_counter()
+        current_hash = registry_hash()
+        try:
+            vector_store, source, mapped = _load_or_build(index_dir, current_hash)
+        except Exception as e:
+            logger.error("Error loading tool index: %s", e)
+            _status.update(state="failed", error=str(e))
+            raise
+        _vector_store = vector_store
+        _status.update(
+            state="ready", source=source, registry_hash=current_hash, mmap=mapped,
+            load_ms=round((time.perf_counter() - started) * 1000, 2),
+        )
+        logger.info("Tool index ready (%s, %.1fms).", source, _status["load_ms"])
+        return _vector_store
+
+def reset_index():
+    """Forgets the loaded index so the next `load_index` call reloads (or rebuilds) it."""
+    global _vector_store
+    with _lock:
+        _vector_store = None
+        _status.update(state="not_loaded", source=None, registry_hash=None, load_ms=None, mmap=False, error=None)
+
+def set_embeddings(embedding_model):
+    """Swaps the embedding model (e.g. for an offline fake); the index must be reloaded with it."""
+    global embeddings
+    embeddings = embedding_model
+    reset_index()
+
+def _writable(vector_store: FAISS):
+    """Copies a memory-mapped (read-only) index into memory before its first in-place change."""
+    import faiss
+
+    if _status["mmap"]:
+        # clone_index would keep viewing the mapping (and faiss aborts on resizing it), so round-trip through bytes
+        vector_store.index = faiss.deserialize_index(faiss.serialize_index(vector_store.index))
+        _status.update(source="disk+updates", mmap=False)
+
+def _on_registry_change(event: str, spec):
+    """Applies one tool's add/update/remove to the loaded index; an unloaded index picks it up on load."""
+    with _lock:
+        if _vector_store is None:
+            return
+        existing = _vector_store.docstore.search(spec.name)
+        unchanged = event == "updated" and getattr(existing, "page_content", None) == spec.description
+        if unchanged:
+            return
+        _writable(_vector_store)
+        if event in ("updated", "removed") and spec.name in _vector_store.index_to_docstore_id.values():
+            _vector_store.delete([spec.name])
+        if event in ("added", "updated"):
+            _vector_store.add_texts([spec.description], metadatas=[{"tool_name": spec.name}], ids=[spec.name])
+        _status["registry_hash"] = registry_hash()
+        logger.info("Tool index %s %s incrementally (%d tools).", event, spec.name, _vector_store.index.ntotal)
+
+tool_registry.add_listener(_on_registry_change)
+
+def save_index(index_dir: str = TOOL_INDEX_DIR):
+    """Persists the loaded index, including runtime registry changes, so the next start loads it from disk."""
+    with _lock:
+        if _vector_store is None:
+            return
+        with _index_file_lock(index_dir, exclusive=True):
+            _save(_vector_store, index_dir)
+
+def get_retriever(k: int = RETRIEVER_K):
+    return load_index().as_retriever(search_kwargs={"k": k})
+
+def index_status() -> dict:
+    return dict(_status)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    build_index()
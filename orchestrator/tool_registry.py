@@ -0,0 +1,100 @@
+import threading
+from typing import Callable, Dict, List, Optional, Type
+
+from pydantic import BaseModel
+
+from .config import TOOL_REGISTRY, TOOL_API_ENDPOINTS
+from .schemas import NoteMakerInput, FlashcardGeneratorInput, ConceptExplainerInput
+from .formatters import format_notemaker_response, format_flashcards_response, format_conceptexplainer_response
+
+# --- Single Source of Truth for Tools ---
+# Everything the orchestrator knows about a tool (retrieval description, endpoint, input
+# schema, response formatter) lives in one ToolSpec. Registering, updating or removing a
+# tool notifies listeners, so the FAISS index, the fast-path router and the selection
+# cache update incrementally instead of being rebuilt.
+
+class ToolSpec:
+    def __init__(self, name: str, description: str, endpoint: str, input_schema: Type[BaseModel],
+                 formatter: Optional[Callable[[dict], str]] = None):
+        self.name = name
+        self.description = description
+        self.endpoint = endpoint
+        self.input_schema = input_schema
+        self.formatter = formatter
+
+    def __repr__(self) -> str:
+        return f"ToolSpec({self.name!r}, endpoint={self.endpoint!r}, schema={self.input_schema.__name__})"
+
+class ToolRegistry:
+    def __init__(self):
+        self._tools: Dict[str, ToolSpec] = {}
+        self._listeners: List[Callable[[str, ToolSpec], None]] = []
+        self._lock = threading.RLock()
+
+    def add_listener(self, callback: Callable[[str, ToolSpec], None]):
+        """`callback(event, spec)` runs after every change; event is "added", "updated" or "removed"."""
+        self._listeners.append(callback)
+
+    def _notify(self, event: str, spec: ToolSpec):
+        for callback in list(self._listeners):
+            callback(event, spec)
+
+    def register(self, name: str, description: str, endpoint: str, input_schema: Type[BaseModel],
+                 formatter: Optional[Callable[[dict], str]] = None) -> ToolSpec:
+        """
+        Adds a tool, or replaces it if the name is taken. A loaded index embeds only this
+        tool's description (a network call for remote embeddings), so call this off the event loop.
+        """
+        spec = ToolSpec(name, description, endpoint, input_schema, formatter)
+        with self._lock:
+            event = "updated" if name in self._tools else "added"
+            self._tools[name] = spec
+            self._notify(event, spec)
+        return spec
+
+    def remove(self, name: str) -> ToolSpec:
+        with self._lock:
+            spec = self._tools.pop(name, None)
+            if spec is None:
+                raise KeyError(f"Unknown tool: {name}")
+            self._notify("removed", spec)
+        return spec
+
+    def get(self, name: str) -> Optional[ToolSpec]:
+        return self._tools.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tools
+
+    def __len__(self) -> int:
+        return len(self._tools)
+
+    def names(self) -> List[str]:
+        return list(self._tools)
+
+    def descriptions(self) -> Dict[str, str]:
+        return {name: spec.description for name, spec in self._tools.items()}
+
+    def get_schema(self, name: str) -> Optional[Type[BaseModel]]:
+        spec = self._tools.get(name)
+        return spec.input_schema if spec else None
+
+    def get_endpoint(self, name: str) -> Optional[str]:
+        spec = self._tools.get(name)
+        return spec.endpoint if spec else None
+
+    def get_formatter(self, name: str) -> Optional[Callable[[dict], str]]:
+        spec = self._tools.get(name)
+        return spec.formatter if spec else None
+
+_DEFAULT_TOOLS = [
+    ("NoteMaker", NoteMakerInput, format_notemaker_response),
+    ("Flashcards", FlashcardGeneratorInput, format_flashcards_response),
+    ("ConceptExplainer", ConceptExplainerInput, format_conceptexplainer_response),
+    ("QuizGenerator", FlashcardGeneratorInput, format_flashcards_response),
+    ("AnalogyCreator", ConceptExplainerInput, format_conceptexplainer_response),
+]
+
+tool_registry = ToolRegistry()
+for _name, _schema, _formatter in _DEFAULT_TOOLS:
+    tool_registry.register(_name, TOOL_REGISTRY[_name], TOOL_API_ENDPOINTS[_name], _schema, _formatter)
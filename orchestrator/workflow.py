@@ -0,0 +1,364 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.config import get_stream_writer
+from langgraph.graph import END, START, StateGraph
+
+from .agent import (
+    GraphState, aselect_tools_node, aplan_tools_node, aextract_parameters_for_tool,
+    aclaim_speculation, asummarize_history, cached_call_tool_api, _format_combined_response,
+)
+from .config import PLANNER_MODE_ENABLED, GRAPH_CHECKPOINTER, GRAPH_CHECKPOINT_DB_PATH, GRAPH_RESUMABLE_TURNS
+from .context_builder import pending_summary_range
+from .scheduler import schedule_tools
+from .session_cache import session_cache
+from .speculation import SpeculativeRun
+from .state_manager import aget_student_state, aget_message_range, aupdate_student_chat_history, aupdate_conversation_summary
+from .telemetry import graph_node_duration
+
+logger = logging.getLogger(__name__)
+
+# --- Compiled Turn Workflow ---
+# One turn as a LangGraph StateGraph, compiled once at startup:
+#
+#   select -> run_tools -> normalize -> save
+#
+# `run_tools` runs the selected tools as a DAG (see scheduler.py): each tool extracts its
+# parameters and is called as soon as its own dependencies have results, within its
+# chain's share of the latency budget. Each tool's result is streamed as it finishes. If
+# a tool misses its deadline, the turn returns a partial answer and keeps its checkpoint.
+# `resume_turn` then re-runs only the timed-out tools, reusing the selection and any
+# parameters already extracted. Per-node timings come from the graph's own callbacks
+# (`NodeTimings`), plus one entry per tool from `run_tools`.
+#
+# /chat, /chat/stream, /chat/resume and /ws/chat run turns through this graph. /chat/batch
+# doesn't: it batches selection, extraction and tool calls across its items (app/api.py),
+# and only shares `save_turn` with it.
+
+NO_TOOL_ANSWER = "I'm not sure which tool to use for your request. Could you please rephrase?"
+
+# turn_id -> the turn's confirmed speculative run; kept out of the (checkpointed) state
+_speculations: Dict[str, SpeculativeRun] = {}
+
+def _turn_id(config: RunnableConfig) -> str:
+    return config["configurable"]["thread_id"]
+
+# --- Nodes ---
+
+async def select_node(state: GraphState, config: RunnableConfig) -> dict:
+    # In planner mode one LLM call also yields every tool's parameters; a rejected plan
+    # falls back to selection followed by per-tool extraction.
+    selection = await aplan_tools_node(dict(state)) if PLANNER_MODE_ENABLED else None
+    if selection is None:
+        selection = await aselect_tools_node(dict(state))
+    if selection.get("speculation") is not None:
+        _speculations[_turn_id(config)] = selection["speculation"]
+    return {
+        # Results and parameters are keyed by tool name, so each tool runs once per turn
+        "selected_tools": list(dict.fromkeys(selection.get("selected_tools", []))),
+        "tool_parameters": selection.get("tool_parameters") or {},
+    }
+
+def route_tools(state: GraphState) -> str:
+    return "run_tools" if state.get("selected_tools") else "normalize"
+
+async def _claim_speculation(turn_id: str, tool_name: str) -> Optional[tuple]:
+    run = _speculations.get(turn_id)
+    if run is None or run.tool_name != tool_name:
+        return None
+    del _speculations[turn_id]
+    return await aclaim_speculation({"speculation": run}, tool_name)
+
+async def _run_tool(turn_id: str, state: GraphState, tool_name: str, upstream_results: List[dict], parameters: Dict[str, dict]) -> dict:
+    """Extracts the tool's parameters (unless already known) and calls it; runs inside the tool's deadline."""
+    response = None
+    if tool_name not in parameters:
+        # A confirmed speculative run may already have the parameters, or even the response
+        speculated = await _claim_speculation(turn_id, tool_name)
+        if speculated is not None:
+            parameters[tool_name], response = speculated
+    if tool_name not in parameters:
+        parameters[tool_name] = await aextract_parameters_for_tool(state, tool_name, upstream_results)
+    if response is None:
+        response = await cached_call_tool_api(tool_name, parameters[tool_name])
+    return response
+
+async def run_tools_node(state: GraphState, config: RunnableConfig) -> dict:
+    """Runs the selected tools as a DAG; tools that already have a result (a resumed turn) aren't run again."""
+    selected_tools = state["selected_tools"]
+    done = dict(state.get("tool_results") or {})
+    parameters = dict(state.get("tool_parameters") or {})
+    turn_id = _turn_id(config)
+    write = get_stream_writer()
+
+    async def run_tool(tool_name: str, upstream_results: List[dict]) -> dict:
+        if tool_name in done:
+            return done[tool_name]
+        started, status = time.perf_counter(), "error"
+        try:
+            response = await _run_tool(turn_id, state, tool_name, upstream_results, parameters)
+            status = "ok"
+            return response
+        except asyncio.CancelledError:
+            status = "timeout"
+            raise
+        finally:
+            write({"timing": {"node": "run_tool", "tool": tool_name, "ms": round((time.perf_counter() - started) * 1000, 2), "status": status}})
+
+    def stream_result(tool_name: str, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is None and tool_name not in done:
+            write({"tool_results": {tool_name: task.result()}})
+
+    tasks = schedule_tools(selected_tools, run_tool)
+    for tool_name, task in zip(selected_tools, tasks):
+        task.add_done_callback(lambda task, tool_name=tool_name: stream_result(tool_name, task))
+    try:
+        responses = await asyncio.gather(*tasks)
+    finally:
+        # The turn was cancelled (e.g. the client went away) or a tool failed
+        for task in tasks:
+            task.cancel()
+    # Extracted parameters are kept even when the call timed out, so a resume skips the LLM
+    return {"tool_parameters": parameters, "tool_results": dict(zip(selected_tools, responses))}
+
+def normalize_node(state: GraphState) -> dict:
+    selected_tools = state.get("selected_tools") or []
+    if not selected_tools:
+        return {"tool_api_responses": [], "final_answer": NO_TOOL_ANSWER}
+    responses = [state["tool_results"][tool_name] for tool_name in selected_tools]
+    return {"tool_api_responses": responses, "final_answer": _format_combined_response(responses)}
+
+async def save_node(state: GraphState, config: RunnableConfig) -> dict:
+    if config["configurable"].get("resumed"):
+        # The interrupted run already saved the student's message with its partial answer, so
+        # only the completed answer is added (after it: /chat/resume holds the student's turn lock)
+        await save_messages(state["user_id"], [{"role": "assistant", "content": state["final_answer"]}])
+    else:
+        await save_turn(state["user_id"], state["student_message"], state["final_answer"])
+    return {}
+
+def build_workflow(checkpointer=None):
+    graph = StateGraph(GraphState)
+    graph.add_node("select", select_node)
+    graph.add_node("run_tools", run_tools_node)
+    graph.add_node("normalize", normalize_node)
+    graph.add_node("save", save_node)
+    graph.add_edge(START, "select")
+    graph.add_conditional_edges("select", route_tools, ["run_tools", "normalize"])
+    graph.add_edge("run_tools", "normalize")
+    graph.add_edge("normalize", "save")
+    graph.add_edge("save", END)
+    return graph.compile(checkpointer=checkpointer)
+
+# --- Per-Node Timings ---
+class NodeTimings(BaseCallbackHandler):
+    """Times every node run of one turn from the graph's chain callbacks; `run_tools` adds one entry per tool."""
+    # Called inline rather than through an executor; it only reads the clock
+    run_inline = True
+    ignore_llm = ignore_chat_model = ignore_retriever = ignore_agent = True
+
+    def __init__(self):
+        self._started = {}
+        self.timings: List[dict] = []
+
+    def on_chain_start(self, serialized, inputs, *, run_id, tags=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        # Node runs carry a graph:step tag; chains nested inside a node (prompts, models, edges) don't
+        if node is None or kwargs.get("name") != node or not any(tag.startswith("graph:step:") for tag in tags or []):
+            return
+        self._started[run_id] = (node, None, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id, "ok")
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, "error")
+
+    def _finish(self, run_id, status: str):
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        node, tool_name, started_at = started
+        self.record(node, tool_name, round((time.perf_counter() - started_at) * 1000, 2), status)
+
+    def record(self, node: str, tool: Optional[str], ms: float, status: str):
+        graph_node_duration.observe(ms / 1000, node=node, tool=tool or "", status=status)
+        self.timings.append({"node": node, "tool": tool, "ms": ms, "status": status})
+
+# --- Checkpointer & Lifecycle ---
+_workflow = None
+_checkpointer_context = None  # The SQLite saver's async context manager, exited at shutdown
+_resumable = deque()          # Turn IDs whose checkpoints are kept for resume, oldest first
+
+async def _open_checkpointer(kind: str):
+    global _checkpointer_context
+    if kind == "none":
+        return None
+    if kind == "memory":
+        return InMemorySaver()
+    if kind == "sqlite":
+        try:
+            from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+        except ImportError as e:
+            raise ImportError("GRAPH_CHECKPOINTER=sqlite needs the optional `langgraph-checkpoint-sqlite` package") from e
+        _checkpointer_context = AsyncSqliteSaver.from_conn_string(GRAPH_CHECKPOINT_DB_PATH)
+        return await _checkpointer_context.__aenter__()
+    raise ValueError(f"Unknown GRAPH_CHECKPOINTER: {kind}")
+
+async def start_workflow(checkpointer: str = GRAPH_CHECKPOINTER):
+    """Compiles the turn graph with its checkpointer. Called once from the app's lifespan."""
+    global _workflow
+    _workflow = build_workflow(await _open_checkpointer(checkpointer))
+    logger.info("Turn workflow compiled (checkpointer: %s).", checkpointer)
+
+async def close_workflow():
+    global _workflow, _checkpointer_context
+    _workflow = None
+    if _checkpointer_context is not None:
+        await _checkpointer_context.__aexit__(None, None, None)
+        _checkpointer_context = None
+
+def get_workflow():
+    """The compiled graph. Outside the app (scripts), it is compiled on first use with an in-memory checkpointer."""
+    global _workflow
+    if _workflow is None:
+        _workflow = build_workflow(InMemorySaver() if GRAPH_CHECKPOINTER != "none" else None)
+    return _workflow
+
+async def _finish_turn(turn_id: str, results: Dict[str, dict], timings: NodeTimings) -> dict:
+    """Keeps the checkpoint of a turn with timed-out tools (for resume) and deletes the rest."""
+    checkpointer = get_workflow().checkpointer
+    resumable = checkpointer is not None and any(response.get("_timed_out_") for response in results.values())
+    if checkpointer is not None:
+        if resumable:
+            _resumable.append(turn_id)
+            while len(_resumable) > GRAPH_RESUMABLE_TURNS:
+                await checkpointer.adelete_thread(_resumable.popleft())
+        else:
+            await checkpointer.adelete_thread(turn_id)
+    return {"turn_id": turn_id, "resumable": resumable, "node_timings": timings.timings}
+
+def _discard_speculation(turn_id: str):
+    run = _speculations.pop(turn_id, None)
+    if run is not None:
+        run.task.cancel()
+
+# --- Running Turns ---
+async def astream_turn(initial_state: Optional[GraphState], turn_id: Optional[str] = None) -> AsyncIterator[tuple]:
+    """
+    Runs a turn and yields (node, update) as each node finishes, ("tool", {"tool_results":
+    {name: response}}) as each tool finishes, then ("turn", {"turn_id", "resumable",
+    "node_timings"}). Pass `initial_state=None` with the `turn_id` of a prepared resume
+    (see `resume_turn`).
+    """
+    turn_id = turn_id or uuid.uuid4().hex
+    timings = NodeTimings()
+    config = {"configurable": {"thread_id": turn_id, "resumed": initial_state is None}, "callbacks": [timings]}
+    results = {}
+    try:
+        # One checkpoint per turn, written when the run ends: a finished turn (even one with
+        # timed-out tools) holds every completed tool, which is all a resume needs
+        stream = get_workflow().astream(initial_state, config, stream_mode=["updates", "custom"], durability="exit")
+        async for mode, chunk in stream:
+            if mode == "custom":
+                if "timing" in chunk:
+                    timings.record(**chunk["timing"])
+                else:
+                    yield "tool", chunk
+                continue
+            for node, values in chunk.items():
+                results.update((values or {}).get("tool_results") or {})
+                yield node, values or {}
+    finally:
+        _discard_speculation(turn_id)
+    yield "turn", await _finish_turn(turn_id, results, timings)
+
+async def run_turn(initial_state: Optional[GraphState], turn_id: Optional[str] = None) -> dict:
+    """Runs a turn to completion; returns its final state plus `turn_id`, `resumable` and `node_timings`."""
+    final_state = dict(initial_state or {})
+    async for node, values in astream_turn(initial_state, turn_id):
+        if node == "turn":
+            final_state.update(values)
+        elif node != "tool":
+            for key, value in values.items():
+                final_state[key] = {**final_state.get(key, {}), **value} if key in ("tool_results", "tool_parameters") else value
+    return final_state
+
+async def prepare_resume(turn_id: str, user_id: str) -> GraphState:
+    """
+    Clears the timed-out results of an interrupted turn, so the next run of `turn_id` re-runs
+    only those tools (with fresh deadlines). Raises LookupError if there is nothing to resume.
+    """
+    graph = get_workflow()
+    if graph.checkpointer is None:
+        raise LookupError("Resuming turns needs a checkpointer (GRAPH_CHECKPOINTER)")
+    config = {"configurable": {"thread_id": turn_id}}
+    snapshot = await graph.aget_state(config)
+    state = snapshot.values
+    if not state or state.get("user_id") != user_id:
+        raise LookupError(f"No resumable turn {turn_id} for user {user_id}")
+    timed_out = [tool_name for tool_name, response in (state.get("tool_results") or {}).items() if response.get("_timed_out_")]
+    if not timed_out:
+        raise LookupError(f"Turn {turn_id} has no timed-out tools to resume")
+    await graph.aupdate_state(config, {"tool_results": {tool_name: None for tool_name in timed_out}}, as_node="select")
+    logger.info("Resuming turn %s for %s: re-running %s", turn_id, user_id, timed_out)
+    return state
+
+async def resume_turn(turn_id: str, user_id: str) -> dict:
+    """Finishes an interrupted turn from its checkpoint and saves the completed answer."""
+    state = await prepare_resume(turn_id, user_id)
+    final_state = await run_turn(None, turn_id)
+    return {
+        **state, **final_state,
+        "tool_results": {**state["tool_results"], **final_state.get("tool_results", {})},
+        "tool_parameters": {**(state.get("tool_parameters") or {}), **final_state.get("tool_parameters", {})},
+    }
+
+# --- Turn Persistence ---
+# user_id -> background summary task (also keeps a reference so the task isn't garbage-collected)
+_summary_tasks = {}
+
+async def _refresh_summary(user_id: str):
+    """Folds messages that left the verbatim window into the stored summary."""
+    try:
+        student_state = await aget_student_state(user_id, recent_messages=0)
+        start, end = pending_summary_range(student_state["message_count"], student_state["summarized_count"])
+        if start == end:
+            return
+        pending = await aget_message_range(user_id, start, end)
+        summary = await asummarize_history(student_state["conversation_summary"], pending)
+        await aupdate_conversation_summary(user_id, summary, end)
+        session = session_cache.get(user_id)
+        if session is not None:
+            session.apply_summary(summary, end)
+    except Exception as e:
+        # The summary catches up on a later turn; a failure here must never affect the student.
+        logger.warning("Summary refresh failed for %s: %s", user_id, e)
+    finally:
+        _summary_tasks.pop(user_id, None)
+
+def schedule_summary_refresh(user_id: str):
+    """Runs the summary update in the background so it never adds latency to the turn."""
+    if user_id in _summary_tasks:
+        return
+    _summary_tasks[user_id] = asyncio.create_task(_refresh_summary(user_id))
+
+async def save_messages(user_id: str, new_messages: List[dict]):
+    """Persists messages once, then refreshes the rolling summary in the background."""
+    session = session_cache.get(user_id)
+    if session is not None:
+        # Written back in the background, queued behind the session's earlier turns
+        session.append_turn(new_messages, on_saved=schedule_summary_refresh)
+        return
+    await aupdate_student_chat_history(user_id, new_messages)
+    schedule_summary_refresh(user_id)
+
+async def save_turn(user_id: str, message: str, final_answer: str):
+    await save_messages(user_id, [{"role": "user", "content": message}, {"role": "assistant", "content": final_answer}])
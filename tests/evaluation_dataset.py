@@ -53,5 +53,27 @@ EVALUATION_DATASET = [
     {
         "message": "Let's work on the American Revolution.",
         "expected_tool": "ConceptExplainer" # A very general request. The default safe action is to start with an explanation.
+    },
+
+    # --- Multi-Tool Requests (expected_tools lists every tool, in order) ---
+    {
+        "message": "Explain how vaccines work and then quiz me on it.",
+        "expected_tools": ["ConceptExplainer", "QuizGenerator"]
+    },
+    {
+        "message": "Summarize the causes of the French Revolution and make flashcards from the notes.",
+        "expected_tools": ["NoteMaker", "Flashcards"]
+    },
+    {
+        "message": "Give me an analogy for voltage, then explain it properly.",
+        "expected_tools": ["AnalogyCreator", "ConceptExplainer"]
+    },
+    {
+        "message": "Make notes on the Industrial Revolution and test me on them afterwards.",
+        "expected_tools": ["NoteMaker", "QuizGenerator"]
     }
-]
\ No newline at end of file
+]
+
+def expected_tools(case: dict) -> list:
+    """The tools a case expects, whether it uses `expected_tool` or `expected_tools`."""
+    return case.get("expected_tools") or [case["expected_tool"]]
\ No newline at end of file
@@ -1,81 +1,261 @@
 # run_evaluation.py
+"""
+Evaluates tool selection against the evaluation dataset.
 
+Cases run concurrently (bounded), and every LLM and embedding response is cached on
+disk keyed by a hash of its prompt, so a re-run with unchanged prompts is instant and
+deterministic. Reports selection accuracy (overall and per routing path), per-case latency
+and retriever recall@k.
+
+    python -m tests.run_evaluation                     # selector LLM (select_tools_node)
+    python -m tests.run_evaluation --pipeline full     # fast path + selector (aselect_tools_node)
+    python -m tests.run_evaluation --no-cache          # measure real model latency
+    python -m tests.run_evaluation --offline           # fake models, no API keys needed
+"""
+import argparse
 import asyncio
-from orchestrator.graph import select_tool_node, GraphState
-from tests.evaluation_dataset import EVALUATION_DATASET
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Any, List, Optional, Sequence
 
-async def run_evaluation():
-    """
-    Runs the tool selection node against the evaluation dataset and reports accuracy.
-    """
-    print("--- 🚀 STARTING TOOL SELECTION EVALUATION ---")
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(REPO_ROOT, ".eval_cache")
+
+# The disk-cached embeddings hash differently from the live ones, so keep their index apart
+os.environ.setdefault("TOOL_INDEX_DIR", os.path.join(CACHE_DIR, "index"))
+
+from langchain_core.caches import BaseCache
+from langchain_core.embeddings import Embeddings
+from langchain_core.globals import set_llm_cache
+from langchain_core.load import dumps, loads
+
+from orchestrator import agent
+from orchestrator.agent import GraphState, select_tools_node, aselect_tools_node
+from orchestrator.config import RETRIEVER_K
+from orchestrator.fast_router import fast_path_router
+from orchestrator.selection_cache import selection_cache
+from orchestrator.telemetry import configure_logging, shutdown_logging
+from orchestrator.tool_index import get_retriever
+from tests.evaluation_dataset import EVALUATION_DATASET, expected_tools
+
+def _prompt_hash(*parts: str) -> str:
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+class DiskLLMCache(BaseCache):
+    """LangChain LLM cache storing one JSON file per (prompt, model settings) hash."""
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, prompt: str, llm_string: str) -> str:
+        return os.path.join(self.directory, _prompt_hash(llm_string, prompt) + ".json")
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Any]]:
+        try:
+            # The cache files are written by this script, never taken from user input.
+            with open(self._path(prompt, llm_string)) as f:
+                generations = loads(f.read(), allowed_objects="core")
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Any]):
+        path = self._path(prompt, llm_string)
+        with open(path + ".tmp", "w") as f:
+            f.write(dumps(list(return_val)))
+        os.replace(path + ".tmp", path)
+
+    def clear(self, **kwargs):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+
+class DiskCachedEmbeddings(Embeddings):
+    """Wraps an embedding model and stores each vector on disk keyed by a hash of its text."""
+    def __init__(self, model: Embeddings, directory: str):
+        self.model = model
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
 
-    correct_predictions = 0
-    incorrect_predictions = []
-
-    for i, item in enumerate(EVALUATION_DATASET):
-        message = item["message"]
-        expected_tool = item["expected_tool"]
-
-        print(f"\n🧪 Running Test Case #{i+1}...")
-        print(f"   Message: '{message}'")
-        print(f"   Expected Tool: {expected_tool}")
-
-        # Create the initial state for the node
-        initial_state = GraphState(
-            student_message=message,
-            chat_history=[],
-            user_info={},
-            selected_tool="",
-            extracted_parameters={},
-            api_response={},
-            final_answer=""
-        )
-
-        # Run the tool selection node
+    def _path(self, text: str) -> str:
+        return os.path.join(self.directory, _prompt_hash(type(self.model).__name__, text) + ".json")
+
+    def _read(self, text: str) -> Optional[List[float]]:
         try:
-            updated_state = select_tool_node(initial_state)
-            actual_tool = updated_state["selected_tool"]
+            with open(self._path(text)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, text: str, vector: List[float]):
+        with open(self._path(text), "w") as f:
+            json.dump(list(vector), f)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self._read(text)
+        if vector is None:
+            vector = self.model.embed_query(text)
+            self._write(text, vector)
+        return vector
 
-            print(f"   Actual Tool:   {actual_tool}")
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return list(await asyncio.gather(*(self.aembed_query(text) for text in texts)))
 
-            if actual_tool == expected_tool:
-                print("   Result: ✅ Correct")
-                correct_predictions += 1
+    async def aembed_query(self, text: str) -> List[float]:
+        vector = self._read(text)
+        if vector is None:
+            vector = await self.model.aembed_query(text)
+            self._write(text, vector)
+        return vector
+
+def _initial_state(message: str) -> GraphState:
+    return GraphState(
+        student_message=message, chat_history=[], conversation_summary="", user_info={},
+        selected_tools=[], tool_parameters={}, tool_api_responses=[], final_answer=""
+    )
+
+def _retrieved_tools(message: str, k: int) -> List[str]:
+    return [doc.metadata["tool_name"] for doc in get_retriever(k).invoke(message)]
+
+async def _evaluate_case(index: int, case: dict, args, semaphore: asyncio.Semaphore) -> dict:
+    expected = expected_tools(case)
+    async with semaphore:
+        started = time.perf_counter()
+        try:
+            if args.pipeline == "full":
+                state = await aselect_tools_node(_initial_state(case["message"]))
             else:
-                print(f"   Result: ❌ Incorrect")
-                incorrect_predictions.append({
-                    "id": i+1,
-                    "message": message,
-                    "expected": expected_tool,
-                    "actual": actual_tool
-                })
+                state = await asyncio.to_thread(select_tools_node, _initial_state(case["message"]))
+            actual, path, error = state["selected_tools"], state["selection_path"], None
         except Exception as e:
-            print(f"   Result: 🚨 Error: {e}")
-            incorrect_predictions.append({
-                "id": i+1,
-                "message": message,
-                "expected": expected_tool,
-                "actual": f"ERROR - {e}"
-            })
+            actual, path, error = [], None, str(e)
+        latency_ms = (time.perf_counter() - started) * 1000
+        retrieved = await asyncio.to_thread(_retrieved_tools, case["message"], args.k)
+    if path in ("fast", "llm"):
+        # Labels the path each case took, so the report compares fast-path accuracy with the selector LLM's
+        fast_path_router.record_outcome(path, actual, expected)
 
+    return {
+        "id": index + 1,
+        "message": case["message"],
+        "expected": expected,
+        "actual": actual,
+        "path": path,
+        "error": error,
+        # Order is scored separately: the scheduler derives execution order from tool dependencies
+        "correct": error is None and sorted(actual) == sorted(expected),
+        "exact_order": error is None and actual == expected,
+        "latency_ms": round(latency_ms, 2),
+        "retrieved": retrieved,
+        "recall_at_k": len(set(expected) & set(retrieved)) / len(expected),
+    }
 
-    # --- Generate Final Report ---
-    total_tests = len(EVALUATION_DATASET)
-    accuracy = (correct_predictions / total_tests) * 100
+def _latency_summary(values: List[float]) -> dict:
+    data = np.asarray(values)
+    return {
+        "mean_ms": round(float(data.mean()), 2),
+        "p50_ms": round(float(np.percentile(data, 50)), 2),
+        "p95_ms": round(float(np.percentile(data, 95)), 2),
+        "max_ms": round(float(data.max()), 2),
+    }
 
-    print("\n\n--- 📊 EVALUATION REPORT ---")
-    print(f"Total Test Cases: {total_tests}")
-    print(f"Correct Predictions: {correct_predictions}")
-    print(f"Accuracy: {accuracy:.2f}%")
+async def run_evaluation(args) -> dict:
+    """
+    Runs tool selection over the evaluation dataset and returns the report.
+    """
+    print("--- 🚀 STARTING TOOL SELECTION EVALUATION ---")
+
+    chat_model, embedding_model = None, agent.embeddings
+    if args.offline:
+        from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+        chat_model, embedding_model = FakeChatModel(), FakeEmbeddings()
+    llm_cache = None
+    if not args.no_cache:
+        llm_cache = DiskLLMCache(os.path.join(CACHE_DIR, "llm"))
+        set_llm_cache(llm_cache)
+        embedding_model = DiskCachedEmbeddings(embedding_model, os.path.join(CACHE_DIR, "embeddings"))
+    agent.configure_models(chat_model=chat_model, embedding_model=embedding_model)
+    # Cached selections from one case would leak into another
+    selection_cache.enabled = False
 
-    if incorrect_predictions:
+    semaphore = asyncio.Semaphore(args.concurrency)
+    started = time.perf_counter()
+    cases = await asyncio.gather(*(
+        _evaluate_case(index, case, args, semaphore) for index, case in enumerate(EVALUATION_DATASET)
+    ))
+    elapsed = time.perf_counter() - started
+
+    total = len(cases)
+    report = {
+        "pipeline": args.pipeline,
+        "total": total,
+        "correct": sum(case["correct"] for case in cases),
+        "accuracy": round(sum(case["correct"] for case in cases) / total, 4),
+        "exact_order_accuracy": round(sum(case["exact_order"] for case in cases) / total, 4),
+        f"recall_at_{args.k}": round(sum(case["recall_at_k"] for case in cases) / total, 4),
+        "errors": sum(case["error"] is not None for case in cases),
+        "elapsed_s": round(elapsed, 3),
+        "latency": _latency_summary([case["latency_ms"] for case in cases]),
+        "llm_cache": {"hits": llm_cache.hits, "misses": llm_cache.misses} if llm_cache else None,
+        "router": {path: fast_path_router.get_stats()[path] for path in ("fast", "llm")},
+        "cases": cases,
+    }
+    _print_report(report, args.k)
+    return report
+
+def _print_report(report: dict, k: int):
+    print("\n--- 📊 EVALUATION REPORT ---")
+    print(f"Total Test Cases: {report['total']}  (pipeline: {report['pipeline']})")
+    print(f"Accuracy: {report['accuracy'] * 100:.2f}%  (exact order: {report['exact_order_accuracy'] * 100:.2f}%)")
+    print(f"Retriever Recall@{k}: {report[f'recall_at_{k}'] * 100:.2f}%")
+    latency = report["latency"]
+    print(f"Latency per case: p50 {latency['p50_ms']} ms, p95 {latency['p95_ms']} ms, max {latency['max_ms']} ms")
+    print(f"Wall time: {report['elapsed_s']} s")
+    if report["llm_cache"]:
+        print(f"LLM cache: {report['llm_cache']['hits']} hits, {report['llm_cache']['misses']} misses")
+    for path, stats in report["router"].items():
+        if stats["labeled"]:
+            print(f"{path} path: {stats['correct']}/{stats['labeled']} correct (accuracy {stats['accuracy']})")
+
+    failed = [case for case in report["cases"] if not case["correct"]]
+    if failed:
         print("\n--- ❌ Failed Test Cases ---")
-        for failed in incorrect_predictions:
-            print(f"  - Case #{failed['id']}: '{failed['message']}'")
-            print(f"    Expected: {failed['expected']}, Got: {failed['actual']}")
+        for case in failed:
+            actual = f"ERROR - {case['error']}" if case["error"] else case["actual"]
+            print(f"  - Case #{case['id']}: '{case['message']}'")
+            print(f"    Expected: {case['expected']}, Got: {actual}")
 
     print("\n--- ✅ EVALUATION COMPLETE ---")
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate tool selection against the evaluation dataset.")
+    parser.add_argument("--pipeline", choices=["llm", "full"], default="llm",
+                        help="llm: select_tools_node (selector LLM only); full: aselect_tools_node (with fast path).")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--k", type=int, default=RETRIEVER_K, help="Retriever depth for recall@k.")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the on-disk LLM/embedding cache.")
+    parser.add_argument("--offline", action="store_true", help="Use the deterministic fake models from benchmarks.fakes.")
+    parser.add_argument("--output", default=None, help="Also write the JSON report here.")
+    parser.add_argument("--verbose", action="store_true", help="Log every node and span (DEBUG level).")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    asyncio.run(run_evaluation())
\ No newline at end of file
+    args = parse_args(sys.argv[1:])
+    if args.verbose:
+        configure_logging("DEBUG")
+    report = asyncio.run(run_evaluation(args))
+    shutdown_logging()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,83 @@
+"""
+Regression test for the async fan-out: a turn's independent tools extract their
+parameters and call their APIs concurrently, so the turn takes about as long as its
+slowest tool rather than the sum of every tool's latency.
+
+    python -m pytest tests/test_async_fanout.py
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+# No API keys or saved index needed: the models are replaced with offline fakes below
+os.environ.setdefault("GOOGLE_API_KEY", "offline-test")
+os.environ.setdefault("TOOL_INDEX_DIR", os.path.join(tempfile.gettempdir(), "orchestrator_test_index"))
+
+import pytest
+
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings, LatencyModel
+from orchestrator import agent, workflow
+from orchestrator.admission import llm_rate_limiter
+from orchestrator.agent import GraphState
+from orchestrator.model_tiers import model_tiers
+from orchestrator.state_manager import mock_student_db
+
+LLM_LATENCY_MS = 200
+TOOL_LATENCY_MS = 200
+TOOLS = ["NoteMaker", "Flashcards", "ConceptExplainer"]  # No dependencies between them
+
+@pytest.fixture
+def fake_turn(monkeypatch):
+    """Fake models with a fixed latency, a fixed 3-tool selection and downstream tools that just sleep."""
+    # Everything swapped here is process-wide, so it is put back after the test
+    models = {tier: model_tiers.model(tier) for tier in model_tiers.tier_names}
+    embeddings = agent.embeddings
+    limit = (llm_rate_limiter.rate, llm_rate_limiter.burst)
+    monkeypatch.setitem(mock_student_db["student123"], "chat_history", list(mock_student_db["student123"]["chat_history"]))
+
+    chat_model = FakeChatModel(latency=LatencyModel(f"constant:{LLM_LATENCY_MS}"))
+    agent.configure_models(chat_model=chat_model, embedding_model=FakeEmbeddings(), tier_models={"fast": chat_model})
+    # The fakes have no provider quota; the token bucket would only add its own pacing
+    llm_rate_limiter.configure(0)
+
+    async def select(state):
+        return {**state, "selected_tools": list(TOOLS), "tool_parameters": {}}
+
+    calls = []
+
+    async def call_tool(tool_name, params):
+        calls.append(tool_name)
+        await asyncio.sleep(TOOL_LATENCY_MS / 1000)
+        return {"_tool_name_": tool_name, "topic": params.get("topic")}
+
+    monkeypatch.setattr(workflow, "PLANNER_MODE_ENABLED", False)
+    monkeypatch.setattr(workflow, "aselect_tools_node", select)
+    monkeypatch.setattr(workflow, "cached_call_tool_api", call_tool)
+    yield chat_model, calls
+
+    llm_rate_limiter.configure(*limit)
+    agent.configure_models(embedding_model=embeddings, tier_models=models)
+
+def _initial_state() -> GraphState:
+    return GraphState(
+        user_id="student123", student_message="Notes, flashcards and an explanation of photosynthesis",
+        chat_history=[], conversation_summary="", user_info={},
+        selected_tools=[], tool_parameters={}, tool_results={}, tool_api_responses=[], final_answer="",
+        retriever_k=None
+    )
+
+def test_independent_tools_run_concurrently(fake_turn):
+    chat_model, calls = fake_turn
+
+    started = time.perf_counter()
+    final_state = asyncio.run(workflow.run_turn(_initial_state()))
+    elapsed = time.perf_counter() - started
+
+    assert sorted(calls) == sorted(TOOLS)
+    assert chat_model.calls == len(TOOLS)  # One extraction per tool
+    assert not any(response.get("_timed_out_") for response in final_state["tool_api_responses"])
+    # Run one after another, the tools would take the sum of their latencies; fanned out,
+    # about one extraction plus one call
+    sequential = len(TOOLS) * (LLM_LATENCY_MS + TOOL_LATENCY_MS) / 1000
+    assert elapsed < sequential / 2, f"turn took {elapsed:.2f}s, sequential would be {sequential:.2f}s"
@@ -0,0 +1,65 @@
+"""
+Table tests for the local repair of structured LLM output (orchestrator/output_repair.py):
+what gets fixed in place, and what must stay unusable so the stage escalates or re-asks.
+
+    python -m pytest tests/test_output_repair.py
+"""
+import pytest
+from langchain_core.exceptions import OutputParserException
+
+from orchestrator.output_repair import OutputRepairer
+from orchestrator.schemas import FlashcardGeneratorInput, NoteMakerInput
+
+BASE = '"topic": "Cells", "subject": "Biology"'
+
+@pytest.fixture
+def repairer():
+    # A fresh instance, so the shared repairer's stats aren't touched
+    return OutputRepairer(enabled=True)
+
+@pytest.mark.parametrize("text, field, expected, fix", [
+    # Out-of-range numbers are clamped to the schema's bounds
+    (f'{{{BASE}, "count": 25, "difficulty": "easy"}}', "count", 20, "clamped"),
+    (f'{{{BASE}, "count": 0, "difficulty": "easy"}}', "count", 1, "clamped"),
+    # Enum values off by case or separators, or given as a listed synonym
+    (f'{{{BASE}, "difficulty": "Medium"}}', "difficulty", "medium", "snapped_value"),
+    (f'{{{BASE}, "difficulty": "difficult"}}', "difficulty", "hard", "snapped_value"),
+    # Readable values of the wrong type are coerced
+    (f'{{{BASE}, "count": "about 7", "difficulty": "easy"}}', "count", 7, "coerced"),
+    # Only a null optional field falls back to its default
+    (f'{{{BASE}, "difficulty": "easy", "include_examples": null}}', "include_examples", True, "defaulted"),
+    # Truncated JSON (e.g. the answer hit the token limit after a complete value)
+    (f'{{{BASE}, "difficulty": "easy", "count": 3', "count", 3, None),
+    # Prose around the object and Python-style literals
+    (f"Here you go: {{'topic': 'Cells', 'subject': 'Biology', 'difficulty': 'easy', 'include_examples': False}}",
+     "include_examples", False, "python_literal"),
+])
+def test_repairs(repairer, text, field, expected, fix):
+    result = repairer.parse("extraction", text, FlashcardGeneratorInput)
+    assert getattr(result, field) == expected
+    stats = repairer.get_stats()["stages"]["extraction"]
+    if fix is None:
+        assert stats["unrecoverable"] == 0
+    else:
+        assert stats["fixes"].get(fix) == 1
+
+def test_snaps_note_style_separators(repairer):
+    result = repairer.parse("extraction", f'{{{BASE}, "note_taking_style": "Bullet Points"}}', NoteMakerInput)
+    assert result.note_taking_style == "bullet_points"
+
+@pytest.mark.parametrize("text", [
+    # Enum values that would need a guess
+    f'{{{BASE}, "difficulty": "not hard"}}',
+    f'{{{BASE}, "difficulty": "medium-hard"}}',
+    f'{{{BASE}, "difficulty": "very hard"}}',
+    # Optional fields the model did fill in, but unreadably: never replaced by the default
+    f'{{{BASE}, "count": "twenty", "difficulty": "easy"}}',
+    f'{{{BASE}, "difficulty": "easy", "include_examples": "maybe"}}',
+    # Required field missing, and no JSON at all
+    '{"topic": "Cells", "difficulty": "easy"}',
+    "I could not work out the parameters for this tool.",
+])
+def test_unusable_output_escalates(repairer, text):
+    with pytest.raises(OutputParserException):
+        repairer.parse("extraction", text, FlashcardGeneratorInput)
+    assert repairer.get_stats()["stages"]["extraction"]["unrecoverable"] == 1
@@ -0,0 +1,106 @@
+"""
+Unit tests for the tool-call resilience layer (orchestrator/resilience.py): the circuit
+breaker's state machine, the retry budget, and how `ToolResilience.call` uses both.
+
+    python -m pytest tests/test_resilience.py
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from orchestrator import resilience
+from orchestrator.resilience import CircuitBreaker, CircuitOpenError, RetryBudget, ToolResilience
+
+def _expire(breaker: CircuitBreaker):
+    """Moves an open breaker past its reset period without sleeping."""
+    breaker.opened_at -= breaker.reset_seconds + 1
+
+def test_breaker_closed_open_half_open_closed():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+    assert breaker.allow() and breaker.state == "closed"
+
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    _expire(breaker)
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()  # One probe at a time
+
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.consecutive_failures == 0
+    assert breaker.allow()
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=5, reset_seconds=60)
+    for _ in range(5):
+        breaker.record_failure()
+    _expire(breaker)
+    assert breaker.allow() and breaker.state == "half_open"
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+def test_retry_budget_refills_from_calls():
+    budget = RetryBudget(ratio=0.25, max_tokens=1.0)
+    assert budget.try_withdraw()
+    assert not budget.try_withdraw()
+    for _ in range(3):
+        budget.deposit()
+    assert not budget.try_withdraw()
+    budget.deposit()
+    assert budget.try_withdraw()
+    for _ in range(10):
+        budget.deposit()
+    assert budget.tokens == 1.0  # Capped at max_tokens
+
+@pytest.fixture
+def tool(monkeypatch):
+    # No backoff sleeps between retries
+    monkeypatch.setattr(resilience, "RETRY_BASE_DELAY", 0.0)
+    return ToolResilience("UnitTestTool")
+
+def _sender(*outcomes):
+    """A `send` that raises or returns each outcome in turn."""
+    remaining = list(outcomes)
+
+    async def send():
+        outcome = remaining.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    return send
+
+def _ok() -> httpx.Response:
+    return httpx.Response(200, request=httpx.Request("POST", "http://tools.test/unit"))
+
+def test_call_retries_transient_errors_within_budget(tool):
+    response = asyncio.run(tool.call(_sender(httpx.ConnectError("refused"), _ok())))
+    assert response.status_code == 200
+    assert tool.stats["retries"] == 1 and tool.breaker.state == "closed"
+
+def test_call_stops_retrying_when_budget_is_spent(tool):
+    tool.budget.tokens = 0.0
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(tool.call(_sender(httpx.ConnectError("refused"), _ok())))
+    assert tool.stats["retries_denied"] == 1 and tool.stats["retries"] == 0
+
+def test_open_breaker_short_circuits(tool):
+    tool.breaker.state, tool.breaker.opened_at = "open", resilience.time.monotonic()
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(tool.call(_sender(_ok())))
+    assert tool.stats["short_circuited"] == 1
+
+@pytest.mark.parametrize("error", [ValueError("bad body"), asyncio.CancelledError()])
+def test_unexpected_error_releases_the_probe(tool, error):
+    tool.breaker.state = "half_open"
+    with pytest.raises(type(error)):
+        asyncio.run(tool.call(_sender(error)))
+    # Not judged as a failure, and the next call may probe again
+    assert tool.breaker.state == "half_open"
+    assert tool.breaker.allow()
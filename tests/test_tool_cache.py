@@ -0,0 +1,81 @@
+"""
+Unit tests for the downstream tool-result cache (orchestrator/tool_cache.py): single-flight
+coalescing of identical calls, TTL expiry, and which results and tools are never cached.
+
+    python -m pytest tests/test_tool_cache.py
+"""
+import asyncio
+
+from orchestrator.config import TOOL_RESULT_TTLS
+from orchestrator.tool_cache import ToolResultCache
+
+PARAMS = {"topic": "Cells", "subject": "Biology"}
+
+def _fetcher(delay: float = 0.0, result: dict = None):
+    """A fake tool call that records each call and returns a fresh copy of `result`."""
+    calls = []
+
+    async def fetch(tool_name, parameters):
+        calls.append((tool_name, dict(parameters)))
+        await asyncio.sleep(delay)
+        return dict(result or {"_tool_name_": tool_name, "cards": len(calls)})
+
+    return fetch, calls
+
+def test_concurrent_identical_calls_share_one_request():
+    cache = ToolResultCache(ttls={"Deterministic": 60.0})
+    fetch, calls = _fetcher(delay=0.05)
+
+    async def run():
+        # Same parameters in a different key order are the same call
+        return await asyncio.gather(
+            cache.call("Deterministic", PARAMS, fetch),
+            cache.call("Deterministic", dict(reversed(list(PARAMS.items()))), fetch),
+            cache.call("Deterministic", PARAMS, fetch),
+        )
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert cache.stats["misses"] == 1 and cache.stats["coalesced"] == 2
+    # Each caller gets its own copy
+    results[0]["cards"] = 99
+    assert results[1]["cards"] == 1
+
+def test_results_expire_after_the_ttl():
+    cache = ToolResultCache(ttls={"Deterministic": 0.05})
+    fetch, calls = _fetcher()
+
+    async def run():
+        await cache.call("Deterministic", PARAMS, fetch)
+        await cache.call("Deterministic", PARAMS, fetch)
+        await asyncio.sleep(0.06)
+        await cache.call("Deterministic", PARAMS, fetch)
+
+    asyncio.run(run())
+    assert len(calls) == 2
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 2
+
+def test_error_results_are_not_cached():
+    cache = ToolResultCache(ttls={"Deterministic": 60.0})
+    fetch, calls = _fetcher(result={"error": "HTTP 503"})
+
+    async def run():
+        await cache.call("Deterministic", PARAMS, fetch)
+        await cache.call("Deterministic", PARAMS, fetch)
+
+    asyncio.run(run())
+    assert len(calls) == 2
+
+def test_tools_without_a_ttl_are_always_called():
+    cache = ToolResultCache(ttls={})
+    fetch, calls = _fetcher(delay=0.01)
+
+    async def run():
+        await asyncio.gather(*(cache.call("QuizGenerator", PARAMS, fetch) for _ in range(2)))
+        await cache.call("QuizGenerator", PARAMS, fetch)
+
+    asyncio.run(run())
+    assert len(calls) == 3 and cache.stats["bypassed"] == 3
+
+def test_generative_tools_are_not_cached_by_default():
+    assert not any(TOOL_RESULT_TTLS.get(tool_name) for tool_name in ("QuizGenerator", "Flashcards"))